@@ -0,0 +1,102 @@
+"""
+Benchmark harness for the commoncontent views.
+
+Seeds a test database with a multi-site dataset, then reports query counts, wall time
+and peak allocations for every benchmark case. Run from the project root::
+
+    python -m benchmarks --articles 5000 --repeat 5
+
+Exits non-zero if any view exceeds its query budget.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument(
+        "--articles",
+        type=int,
+        default=None,
+        help="Number of Articles to seed per site.",
+    )
+    parser.add_argument("--sites", type=int, default=2, help="Number of Sites to seed.")
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of timed requests per URL. The best time is reported.",
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "test_project.settings")
+    os.environ.setdefault("SITE_ID", "1")
+    import django
+
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client
+    from django.test import override_settings
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    from benchmarks.budgets import QUERY_BUDGETS
+    from benchmarks.cases import get_cases
+    from benchmarks.dataset import ARTICLES_PER_SITE, seed_dataset
+    from benchmarks.measure import measure
+
+    setup_test_environment()
+    # Keep the seeded images and their renditions out of the project's media. Generate
+    # renditions while seeding, as a site's rendition backend would have before its
+    # pages are visited, rather than in threads that outlive the media directory.
+    media = override_settings(
+        MEDIA_ROOT=tempfile.mkdtemp(prefix="benchmarks-media-"),
+        COMMONCONTENT_RENDITION_BACKEND={
+            "BACKEND": "commoncontent.renditions.SyncRenditionBackend"
+        },
+    )
+    media.enable()
+    # Query capture requires DEBUG-style cursor wrapping, which CaptureQueriesContext
+    # forces on, but keep template debugging off so timings reflect production.
+    settings.DEBUG = False
+    old_name = connection.creation.create_test_db(verbosity=0)
+    failed = False
+    try:
+        start = time.perf_counter()
+        dataset = seed_dataset(
+            articles_per_site=args.articles or ARTICLES_PER_SITE, sites=args.sites
+        )
+        print(f"Seeded dataset in {time.perf_counter() - start:.1f}s\n")
+
+        client = Client()
+        header = f"{'case':<24} {'status':>6} {'queries':>7} {'budget':>6} "
+        header += f"{'ms':>8} {'peak KiB':>9}"
+        print(header)
+        print("-" * len(header))
+        for case in get_cases(dataset):
+            result = measure(client, case, repeat=args.repeat)
+            budget = QUERY_BUDGETS.get(case.name)
+            over = budget is not None and result.num_queries > budget
+            failed = failed or over or result.status != case.status
+            print(
+                f"{case.name:<24} {result.status:>6} {result.num_queries:>7} "
+                f"{budget if budget is not None else '-':>6} "
+                f"{result.seconds * 1000:>8.1f} {result.peak_bytes / 1024:>9.0f}"
+                + (" OVER BUDGET" if over else "")
+            )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        media.disable()
+        shutil.rmtree(media.options["MEDIA_ROOT"], ignore_errors=True)
+        teardown_test_environment()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""
+Query budgets for each benchmark case: the maximum number of database queries a single
+request may issue once the per-process caches are warm.
+
+These budgets must not depend on the size of the dataset. If a change makes a view
+cheaper, lower its budget here so the improvement cannot silently regress.
+"""
+
+QUERY_BUDGETS = {
+    "home_page": 10,
+    "home_paginated": 10,
+    "home_keyset": 10,
+    "author_list": 5,
+    "author_page": 11,
+    "author_page_paginated": 11,
+    "author_page_keyset": 11,
+    "author_feed": 5,
+    "section_page": 10,
+    "section_paginated": 10,
+    "section_keyset": 10,
+    "section_feed": 5,
+    "section_feed_redirect": 0,
+    "article_page": 14,
+    "article_series_page": 14,
+    "series_page": 2,
+    "landing_page": 6,
+    "site_feed": 6,
+    "site_feed_redirect": 0,
+    "sitemap_index": 1,
+    "sitemap": 1,
+    "sitemap_articles": 1,
+    "sitemap_articles_paginated": 3,
+}
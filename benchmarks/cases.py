@@ -0,0 +1,154 @@
+"""
+The list of URLs exercised by the benchmarks, one per URL pattern in
+``commoncontent.urls``.
+"""
+
+import typing as T
+from dataclasses import dataclass
+
+from django.urls import reverse
+from django.utils import timezone
+
+from benchmarks.dataset import Dataset
+from commoncontent.pagination import make_cursor
+
+
+@dataclass
+class Case:
+    name: str
+    url: str
+    status: int = 200
+
+
+def get_cases(dataset: Dataset) -> T.List[Case]:
+    data = dataset.primary
+    section = data.sections[0]
+    author = data.authors[0]
+    page = data.pages[0]
+    article = next(a for a in data.articles if a.series is None)
+    series_article = next(a for a in data.articles if a.series is not None)
+    # A page in the middle of the archive, more expensive than page 2 for offset
+    # pagination
+    deep_page = max(2, len(data.articles) // 15 // 2)
+
+    def deep_cursor(articles):
+        "Keyset cursor of the article in the middle of the list"
+        articles = sorted(articles, key=lambda a: (a.date_published, a.pk))
+        middle = articles[len(articles) // 2]
+        return make_cursor(middle.date_published, middle.pk)
+
+    published = timezone.localtime(article.date_published)
+    month = {"year": published.year, "month": published.month}
+    cases = [
+        Case("home_page", reverse("home_page")),
+        Case("home_paginated", reverse("home_paginated", kwargs={"page": deep_page})),
+        Case(
+            "home_keyset",
+            reverse("home_keyset", kwargs={"cursor": deep_cursor(data.articles)}),
+        ),
+        Case("author_list", reverse("author_list")),
+        Case(
+            "author_page",
+            reverse("author_page", kwargs={"author_slug": author.slug}),
+        ),
+        Case(
+            "author_page_paginated",
+            reverse(
+                "author_page_paginated",
+                kwargs={"author_slug": author.slug, "page": 2},
+            ),
+        ),
+        Case(
+            "author_page_keyset",
+            reverse(
+                "author_page_keyset",
+                kwargs={
+                    "author_slug": author.slug,
+                    "cursor": deep_cursor(
+                        a for a in data.articles if a.author_id == author.pk
+                    ),
+                },
+            ),
+        ),
+        Case(
+            "author_feed",
+            reverse("author_feed", kwargs={"author_slug": author.slug}),
+        ),
+        Case(
+            "section_page",
+            reverse("section_page", kwargs={"section_slug": section.slug}),
+        ),
+        Case(
+            "section_paginated",
+            reverse(
+                "section_paginated",
+                kwargs={"section_slug": section.slug, "page": 2},
+            ),
+        ),
+        Case(
+            "section_keyset",
+            reverse(
+                "section_keyset",
+                kwargs={
+                    "section_slug": section.slug,
+                    "cursor": deep_cursor(
+                        a for a in data.articles if a.section_id == section.pk
+                    ),
+                },
+            ),
+        ),
+        Case(
+            "section_feed",
+            reverse("section_feed", kwargs={"section_slug": section.slug}),
+        ),
+        Case(
+            "section_feed_redirect",
+            f"/{section.slug}/feed/",
+            status=302,
+        ),
+        Case(
+            "article_page",
+            reverse(
+                "article_page",
+                kwargs={
+                    "section_slug": article.section.slug,
+                    "article_slug": article.slug,
+                },
+            ),
+        ),
+        Case(
+            "article_series_page",
+            reverse(
+                "article_series_page",
+                kwargs={
+                    "section_slug": series_article.section.slug,
+                    "series_slug": series_article.series.slug,
+                    "article_slug": series_article.slug,
+                },
+            ),
+        ),
+        Case(
+            "series_page",
+            reverse(
+                "series_page",
+                kwargs={
+                    "section_slug": series_article.section.slug,
+                    "series_slug": series_article.series.slug,
+                },
+            ),
+            status=301,
+        ),
+        Case("landing_page", reverse("landing_page", kwargs={"page_slug": page.slug})),
+        Case("site_feed", reverse("site_feed")),
+        Case("site_feed_redirect", "/feed/", status=302),
+        Case("sitemap_index", reverse("sitemap_index")),
+        Case("sitemap", reverse("sitemap", kwargs={"kind": "sections"})),
+        Case("sitemap_articles", reverse("sitemap_articles", kwargs=month)),
+        # Months with fewer Articles than a sitemap holds have no second page
+        Case(
+            "sitemap_articles_paginated",
+            reverse("sitemap_articles_paginated", kwargs={**month, "page": 2}),
+            status=404,
+        ),
+    ]
+    return cases
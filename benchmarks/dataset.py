@@ -0,0 +1,228 @@
+"""
+Seed a realistic multi-site content dataset for benchmarks.
+
+Everything is created with ``bulk_create`` so that thousands of Articles can be
+generated in a few seconds. The data is deterministic for a given seed, so query
+counts and timings are comparable between runs.
+"""
+
+import random
+import typing as T
+from dataclasses import dataclass, field
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image as PILImage
+from sitevars.models import SiteVar
+from taggit.models import Tag, TaggedItem
+
+from commoncontent.models import (
+    Article,
+    ArticleSeries,
+    Author,
+    HomePage,
+    Image,
+    Link,
+    Menu,
+    Page,
+    Section,
+    Site,
+)
+
+# Default size of the dataset. Override with the ``articles_per_site`` argument.
+ARTICLES_PER_SITE = 1000
+SECTIONS_PER_SITE = 6
+AUTHORS_PER_SITE = 8
+PAGES_PER_SITE = 5
+SERIES_PER_SITE = 4
+IMAGES_PER_SITE = 12
+TAGS = 40
+PAGINATE_BY = 15
+
+
+@dataclass
+class SiteData:
+    "The objects seeded for one Site, used to construct benchmark URLs."
+
+    site: Site
+    sections: T.List[Section] = field(default_factory=list)
+    authors: T.List[Author] = field(default_factory=list)
+    pages: T.List[Page] = field(default_factory=list)
+    series: T.List[ArticleSeries] = field(default_factory=list)
+    images: T.List[Image] = field(default_factory=list)
+    articles: T.List[Article] = field(default_factory=list)
+
+
+@dataclass
+class Dataset:
+    sites: T.List[SiteData] = field(default_factory=list)
+
+    @property
+    def primary(self) -> SiteData:
+        "Data for the current site (``SITE_ID``), which the views will serve."
+        return self.sites[0]
+
+
+def _image_file(rng, name):
+    "Generate a small JPEG image file, landscape or portrait."
+    size = (320, 180) if rng.random() < 0.75 else (180, 320)
+    img = PILImage.new("RGB", size, color=(rng.randrange(256), 128, 128))
+    buf = BytesIO()
+    img.save(buf, format="JPEG")
+    return ContentFile(buf.getvalue(), name=name)
+
+
+def seed_site(site, articles_per_site, rng, tags) -> SiteData:
+    now = timezone.now()
+    data = SiteData(site=site)
+    SiteVar.objects.update_or_create(
+        site=site, name="paginate_by", defaults={"value": str(PAGINATE_BY)}
+    )
+    SiteVar.objects.update_or_create(
+        site=site, name="tagline", defaults={"value": "Benchmarks for everyone"}
+    )
+
+    HomePage.objects.create(
+        site=site,
+        admin_name=f"Home page for {site.domain}",
+        title=f"Welcome to {site.name}",
+        slug="home",
+        body="<p>Home page intro.</p>",
+        date_published=now - timedelta(days=3650),
+    )
+
+    # Images need real files so renditions can be generated for list and detail pages
+    for i in range(IMAGES_PER_SITE):
+        data.images.append(
+            Image.objects.create(
+                site=site,
+                title=f"Image {i}",
+                alt_text=f"Alt text {i}",
+                image_file=_image_file(rng, f"bench-{site.pk}-{i}.jpg"),
+                date_published=now - timedelta(days=3650),
+            )
+        )
+
+    data.authors = Author.objects.bulk_create(
+        Author(
+            site=site,
+            name=f"Author {i}",
+            slug=f"author-{i}",
+            short_bio=f"<p>Author {i} writes things.</p>",
+            profile_image=rng.choice(data.images),
+        )
+        for i in range(AUTHORS_PER_SITE)
+    )
+    data.sections = Section.objects.bulk_create(
+        _with_excerpts(
+            Section(
+                site=site,
+                title=f"Section {i}",
+                slug=f"section-{i}",
+                body=f"<p>All about topic {i}.</p>",
+                share_image=rng.choice(data.images) if i % 2 else None,
+                date_published=now - timedelta(days=3650),
+            )
+            for i in range(SECTIONS_PER_SITE)
+        )
+    )
+    data.pages = Page.objects.bulk_create(
+        _with_excerpts(
+            Page(
+                site=site,
+                title=f"Page {i}",
+                slug=f"page-{i}",
+                body=f"<p>Evergreen page {i}.</p>",
+                date_published=now - timedelta(days=3650),
+            )
+            for i in range(PAGES_PER_SITE)
+        )
+    )
+    data.series = ArticleSeries.objects.bulk_create(
+        ArticleSeries(site=site, name=f"Series {i}", slug=f"series-{i}")
+        for i in range(SERIES_PER_SITE)
+    )
+
+    menu = Menu.objects.create(site=site, admin_name="Footer", slug="footer")
+    Link.objects.bulk_create(
+        Link(menu=menu, url=page.get_absolute_url(), title=page.title)
+        for page in data.pages
+    )
+
+    paragraph = "<p>" + " ".join(["lorem ipsum dolor sit amet"] * 20) + "</p>"
+    articles = []
+    series_order = {}
+    for i in range(articles_per_site):
+        series = rng.choice(data.series) if rng.random() < 0.1 else None
+        order = 0
+        if series:
+            order = series_order[series.pk] = series_order.get(series.pk, 0) + 1
+        articles.append(
+            Article(
+                site=site,
+                section=rng.choice(data.sections),
+                author=rng.choice(data.authors) if rng.random() < 0.9 else None,
+                series=series,
+                _order=order,
+                title=f"Article {i} on {site.domain}",
+                slug=f"article-{i}",
+                description=f"Description of article {i}.",
+                body=paragraph * rng.randint(2, 10),
+                share_image=rng.choice(data.images) if rng.random() < 0.3 else None,
+                date_published=now - timedelta(hours=i + 1),
+            )
+        )
+    data.articles = Article.objects.bulk_create(
+        _with_excerpts(articles), batch_size=500
+    )
+
+    through = Article.image_set.through
+    through.objects.bulk_create(
+        (
+            through(article_id=article.pk, image_id=image.pk)
+            for article in data.articles
+            if rng.random() < 0.3
+            for image in rng.sample(data.images, 2)
+        ),
+        batch_size=1000,
+    )
+
+    article_type = ContentType.objects.get_for_model(Article)
+    TaggedItem.objects.bulk_create(
+        (
+            TaggedItem(content_type=article_type, object_id=article.pk, tag=tag)
+            for article in data.articles
+            for tag in rng.sample(tags, rng.randint(0, 4))
+        ),
+        batch_size=1000,
+    )
+    return data
+
+
+def _with_excerpts(pages):
+    "bulk_create() does not call save(), so store the excerpts as save() would."
+    pages = list(pages)
+    for page in pages:
+        page.update_excerpt()
+    return pages
+
+
+def seed_dataset(articles_per_site=ARTICLES_PER_SITE, sites=2, seed=42) -> Dataset:
+    """Create ``sites`` Sites (the first being the current site), each populated with
+    ``articles_per_site`` Articles and their related content."""
+    rng = random.Random(seed)
+    tags = Tag.objects.bulk_create(
+        Tag(name=f"Topic {i}", slug=f"topic-{i}") for i in range(TAGS)
+    )
+    dataset = Dataset()
+    site_objs = [Site.objects.get_current()]
+    for i in range(1, sites):
+        site_objs.append(
+            Site.objects.create(domain=f"site{i}.example.com", name=f"Site {i}")
+        )
+    for site in site_objs:
+        dataset.sites.append(seed_site(site, articles_per_site, rng, tags))
+    return dataset
@@ -0,0 +1,64 @@
+import time
+import tracemalloc
+import typing as T
+from dataclasses import dataclass
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from benchmarks.cases import Case
+
+
+@dataclass
+class Result:
+    case: Case
+    status: int
+    queries: T.List[str]
+    seconds: float
+    peak_bytes: int
+
+    @property
+    def num_queries(self):
+        return len(self.queries)
+
+
+def _get(client: Client, url: str):
+    "Request ``url``, reading streamed responses to the end, where their work is done."
+    resp = client.get(url)
+    if resp.streaming:
+        b"".join(resp.streaming_content)
+    return resp
+
+
+def measure(client: Client, case: Case, repeat: int = 1) -> Result:
+    """Request the case's URL and measure it. The URL is requested once to warm up
+    per-process caches, then ``repeat`` more times. Query counts come from the first
+    measured request, wall time is the best of all measured requests, and allocations
+    are the peak traced memory of a final request."""
+    _get(client, case.url)
+
+    with CaptureQueriesContext(connection) as ctx:
+        resp = _get(client, case.url)
+    queries = [q["sql"] for q in ctx.captured_queries]
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _get(client, case.url)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        _get(client, case.url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Result(
+        case=case,
+        status=resp.status_code,
+        queries=queries,
+        seconds=best,
+        peak_bytes=peak,
+    )
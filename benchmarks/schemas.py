@@ -0,0 +1,75 @@
+"""
+Micro-benchmark for serializing the Open Graph and schema.org objects of
+``commoncontent.schemas``, which every page renders in its head. Reports the time to
+serialize one object of each kind. Run from the project root::
+
+    python -m benchmarks.schemas --number 20000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+from functools import partial
+
+
+def sample_objects():
+    "Objects like those built for a typical Article page"
+    from commoncontent.schemas import ArticleSchema, ImageProp, OGArticle, PersonSchema
+
+    published = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    image = ImageProp(
+        url="https://example.com/media/2024/5/1/photo.jpg",
+        type="image/jpeg",
+        width=1280,
+        height=720,
+        alt="A photo & its <caption>",
+    )
+    og = OGArticle(
+        title="An Article About Things",
+        description="Everything you wanted to know about things, & more.",
+        url="https://example.com/news/an-article-about-things.html",
+        published_time=published,
+        modified_time=published,
+        section="News",
+        site_name="Example",
+        image=[image],
+        author=["https://example.com/author/writer/"],
+        tag=["things", "stuff", "more things"],
+    )
+    schema = ArticleSchema(
+        headline="An Article About Things",
+        description="<p>Everything you wanted to know about things, & more.</p>",
+        url="https://example.com/news/an-article-about-things.html",
+        creativeWorkStatus="usable",
+        datePublished=published,
+        dateModified=published,
+        author=PersonSchema(name="Writer", description="<p>Writes things.</p>"),
+        keywords=["things", "stuff", "more things"],
+    )
+    return {"OGArticle": og, "ArticleSchema": schema}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.schemas", description=__doc__
+    )
+    parser.add_argument(
+        "--number", type=int, default=20000, help="Serializations per measurement."
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "test_project.settings")
+    import django
+
+    django.setup()
+
+    for name, obj in sample_objects().items():
+        best = min(timeit.repeat(partial(str, obj), number=args.number, repeat=5))
+        print(f"{name:<16} {best / args.number * 1e6:>8.2f} µs per object")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import os
+
+from django.test import TestCase
+from django.urls import URLPattern
+
+from benchmarks.budgets import QUERY_BUDGETS
+from benchmarks.cases import get_cases
+from benchmarks.dataset import seed_dataset
+from benchmarks.measure import measure
+from commoncontent import urls
+
+# Keep the default run quick. Set BENCHMARK_ARTICLES to test with a larger dataset;
+# budgets must hold at any size.
+ARTICLES_PER_SITE = int(os.environ.get("BENCHMARK_ARTICLES", 200))
+
+
+class TestQueryBudgets(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = seed_dataset(articles_per_site=ARTICLES_PER_SITE)
+
+    def test_every_url_pattern_has_a_case(self):
+        names = {case.name for case in get_cases(self.dataset)}
+        for pattern in urls.urlpatterns:
+            if isinstance(pattern, URLPattern) and pattern.name:
+                self.assertIn(pattern.name, names)
+
+    def test_every_case_has_a_budget(self):
+        for case in get_cases(self.dataset):
+            self.assertIn(case.name, QUERY_BUDGETS)
+
+    def test_query_budgets(self):
+        for case in get_cases(self.dataset):
+            with self.subTest(case.name):
+                result = measure(self.client, case)
+                self.assertEqual(result.status, case.status)
+                budget = QUERY_BUDGETS[case.name]
+                self.assertLessEqual(
+                    result.num_queries,
+                    budget,
+                    f"{case.url} issued {result.num_queries} queries, "
+                    f"budget is {budget}:\n" + "\n".join(result.queries),
+                )
@@ -0,0 +1,25 @@
+"""
+Keep the files that tests and benchmarks upload, and the renditions generated from them,
+out of the test project's ``var/media``.
+"""
+
+import shutil
+import tempfile
+
+from django.test import override_settings
+
+_media_settings = None
+
+
+def pytest_configure(config):
+    global _media_settings
+    _media_settings = override_settings(
+        MEDIA_ROOT=tempfile.mkdtemp(prefix="commoncontent-media-")
+    )
+    _media_settings.enable()
+
+
+def pytest_unconfigure(config):
+    if _media_settings is not None:
+        _media_settings.disable()
+        shutil.rmtree(_media_settings.options["MEDIA_ROOT"], ignore_errors=True)
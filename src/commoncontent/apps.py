@@ -77,12 +77,167 @@ class CommonContentConfig(AppConfig):
     default_icon = "file-text"
     fallback_copyright = _("© Copyright {} {}. All rights reserved.")
 
+    def ready(self):
+        # Connect the signal handlers that keep caches in sync with the content
+        from commoncontent import signals  # noqa: F401
+
     @property
     def excerpt_max_words(self):
         from django.conf import settings
 
         return getattr(settings, "COMMONCONTENT_EXCERPT_MAX_WORDS", 200)
 
+    @property
+    def excerpt_version(self):
+        """Identifies the settings that excerpts are computed with. Excerpts stored with
+        a different version are ignored until refreshed with ``refresh_excerpts``."""
+        from django.utils.crypto import md5
+
+        key = f"{self.pagebreak_separator}\n{self.excerpt_max_words}"
+        return md5(key.encode(), usedforsecurity=False).hexdigest()[:16]
+
+    @property
+    def cache_alias(self):
+        """Name of the Django cache used by Common Content"""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_CACHE", "default")
+
+    @property
+    def page_cache(self):
+        """Whether to serve Common Content pages from the page cache"""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_PAGE_CACHE", False)
+
+    @property
+    def page_cache_timeout(self):
+        """Maximum seconds to keep a page in the page cache. Pages are also removed
+        from the cache when the content they display changes."""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_PAGE_CACHE_TIMEOUT", 3600)
+
+    @property
+    def conditional_get(self):
+        """Whether pages have ETag and Last-Modified headers, and are not rendered for
+        clients that already have them. Defaults to the same as ``page_cache``, as it
+        also requires a cache shared by all server processes."""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_CONDITIONAL_GET", self.page_cache)
+
+    @property
+    def cache_tag_header(self):
+        """Name of the response header listing the dependency tags of each page, for a
+        CDN to purge by (e.g. "Cache-Tag" or "Surrogate-Key"). None to omit it."""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_CACHE_TAG_HEADER", None)
+
+    @property
+    def purge_backend(self):
+        """Configuration of the backend that purges changed content from a CDN, a dict
+        with a "BACKEND" class path and optional "OPTIONS". See commoncontent.purge."""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_PURGE_BACKEND", None)
+
+    @property
+    def metadata_cache(self):
+        """Whether to cache the Open Graph and schema.org metadata rendered in the head
+        of each page. Defaults to the same as ``page_cache``, as it also requires a
+        cache shared by all server processes."""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_METADATA_CACHE", self.page_cache)
+
+    @property
+    def menu_cache(self):
+        """Whether to cache menus, with their links resolved. Defaults to the same as
+        ``page_cache``, as it also requires a cache shared by all server processes."""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_MENU_CACHE", self.page_cache)
+
+    @property
+    def sitemap_cache(self):
+        """Whether to cache sitemaps, gzip-compressed, until the content they list
+        changes. Defaults to the same as ``page_cache``, as it also requires a cache
+        shared by all server processes."""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_SITEMAP_CACHE", self.page_cache)
+
+    @property
+    def renditions(self):
+        """Names of the Image renditions generated when an image is uploaded, rather
+        than when first displayed: those the site's templates use."""
+        from django.conf import settings
+
+        return getattr(
+            settings,
+            "COMMONCONTENT_RENDITIONS",
+            ("large", "medium", "portrait_large", "portrait_medium"),
+        )
+
+    @property
+    def responsive_formats(self):
+        """Pillow formats, best first, offered as ``<source>`` elements by the
+        ``responsive_image`` template tag. Those Pillow cannot encode are skipped."""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_RESPONSIVE_FORMATS", ("AVIF", "WEBP"))
+
+    @property
+    def rendition_policy(self):
+        """Path to the function choosing which of ``renditions`` to generate for each
+        image. See commoncontent.renditions.orientation_policy."""
+        from django.conf import settings
+
+        return getattr(
+            settings,
+            "COMMONCONTENT_RENDITION_POLICY",
+            "commoncontent.renditions.orientation_policy",
+        )
+
+    @property
+    def rendition_backend(self):
+        """Configuration of the backend that generates renditions of uploaded images, a
+        dict with a "BACKEND" class path and optional "OPTIONS", or None to generate
+        renditions when first displayed. See commoncontent.renditions."""
+        from django.conf import settings
+
+        return getattr(
+            settings,
+            "COMMONCONTENT_RENDITION_BACKEND",
+            {"BACKEND": "commoncontent.renditions.ThreadRenditionBackend"},
+        )
+
+    @property
+    def sitevars_cache(self):
+        """Whether to keep SiteVars in memory between requests. Requires a cache shared
+        by all server processes, which tells each process when SiteVars change."""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_SITEVARS_CACHE", False)
+
+    @property
+    def pagination(self):
+        """How article lists link to their pages: "offset" (page numbers) or "keyset"
+        (cursors, which are as fast to serve deep in an archive as on the first page).
+        Both kinds of URL are always served."""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_PAGINATION", "offset")
+
+    @property
+    def pagination_count(self):
+        """Whether keyset paginated lists display the (cached) number of articles"""
+        from django.conf import settings
+
+        return getattr(settings, "COMMONCONTENT_PAGINATION_COUNT", False)
+
     @property
     def pagebreak_separator(self):
         from django.conf import settings
@@ -145,7 +300,9 @@ def context_defaults(request):
     # Edge case: SiteVars override our settings by having inject_sitevars context
     # processor come after this one. But if they override list_*_template, we need to
     # check that here, since we're assigning values they may not have set.
-    sitevars = request.site.vars
+    from commoncontent.caching import site_vars
+
+    sitevars = site_vars(request.site)
     list_tpls = [
         "list_content_template",
         "list_precontent_template",
@@ -166,3 +323,15 @@ def context_defaults(request):
 
     # And don't forget to return the value!!!
     return gvars
+
+
+def inject_sitevars(request):
+    """Add all SiteVars to the template context. Replaces
+    ``sitevars.context_processors.inject_sitevars``, sharing the SiteVars loaded by the
+    rest of the request instead of loading them again."""
+    from django.contrib.sites.shortcuts import get_current_site
+
+    from commoncontent.caching import site_vars
+
+    site = request.site if hasattr(request, "site") else get_current_site(request)
+    return dict(site_vars(site))
@@ -0,0 +1,497 @@
+"""
+Dependency tracking and an opt-in full-page cache for Common Content views.
+
+While a page is rendered, the views and template tags record *dependency tags* on the
+request, naming the content the page used, e.g. ``article:12``, ``section:3`` or
+``site:1``. Collection tags like ``articles:1`` stand for "which Articles are listed on
+site 1", so pages that list content are invalidated when content is added or removed.
+
+Every tag has a version token stored in the cache. When content is saved or deleted, the
+signal handlers in ``commoncontent.signals`` replace the version tokens of every tag it
+affects. A cached page remembers the versions of its tags at the time it was stored,
+and is only served while all of them are unchanged, so a page is never served stale
+and never needs a database query to decide that.
+
+Content scheduled to go live or expire changes pages without any signal being sent, so
+cache timeouts, and the ``s-maxage`` of pages sent to a CDN, are bounded by the site's
+next scheduled publication or expiration (see ``next_transition``).
+
+SiteVars are read many times per page, so ``site_vars`` loads all of a site's vars at
+most once per request, and optionally keeps them in memory between requests, checked
+against the ``site:`` tag's version.
+
+The page cache is disabled unless ``COMMONCONTENT_PAGE_CACHE = True`` in settings.
+Conditional GET (ETag and Last-Modified headers, and 304 Not Modified responses), which
+uses the same dependency tags, is enabled with the page cache by default.
+"""
+
+import math
+import typing as T
+import uuid
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import cache as default_cache
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import md5
+from django.utils.http import http_date, quote_etag
+
+TAG_KEY_PREFIX = "commoncontent:tag:"
+PAGE_KEY_PREFIX = "commoncontent:page:"
+TRANSITION_KEY_PREFIX = "commoncontent:transition:"
+MENU_KEY_PREFIX = "commoncontent:menu:"
+VALIDATORS_KEY_PREFIX = "commoncontent:validators:"
+METADATA_KEY_PREFIX = "commoncontent:head:"
+SITEMAP_KEY_PREFIX = "commoncontent:sitemap:"
+# WSGI environ key marking the requests of static builds, which read page dependencies
+STATIC_BUILD_ENVIRON = "commoncontent.static_build"
+
+# Models whose live() status changes with time, and the collection tag for each
+SCHEDULED_MODELS = {
+    "Article": "articles",
+    "HomePage": "homepages",
+    "Page": "pages",
+    "Section": "sections",
+}
+
+
+def get_cache():
+    conf = apps.get_app_config("commoncontent")
+    return caches[conf.cache_alias]
+
+
+######################################################################################
+# Dependency tags
+######################################################################################
+def dependency_tags(obj) -> T.Set[str]:
+    """Return the tags a page depends on when it displays ``obj``."""
+    Article = apps.get_model("commoncontent", "Article")
+    Author = apps.get_model("commoncontent", "Author")
+    HomePage = apps.get_model("commoncontent", "HomePage")
+
+    tags = set()
+    site_id = getattr(obj, "site_id", None)
+    if site_id:
+        tags.add(f"site:{site_id}")
+    if isinstance(obj, HomePage):
+        # Which HomePage is displayed depends on all of them
+        tags.add(f"homepages:{site_id}")
+    if obj.pk is not None:
+        tags.add(f"{obj._meta.model_name}:{obj.pk}")
+    if isinstance(obj, Article):
+        tags.add(f"section:{obj.section_id}")
+        if obj.series_id:
+            tags.add(f"series:{obj.series_id}")
+    for fk in ("author_id", "share_image_id"):
+        if value := getattr(obj, fk, None):
+            model = "author" if fk == "author_id" else "image"
+            tags.add(f"{model}:{value}")
+    if isinstance(obj, Author) and obj.profile_image_id:
+        tags.add(f"image:{obj.profile_image_id}")
+    return tags
+
+
+def invalidation_tags(instance) -> T.Set[str]:
+    """Return the tags whose pages are stale after ``instance`` is changed."""
+    label = instance._meta.label_lower
+    model_name = instance._meta.model_name
+    site_id = getattr(instance, "site_id", None)
+
+    if label == "sites.site":
+        return {f"site:{instance.pk}"}
+    if label == "sitevars.sitevar":
+        return {f"site:{site_id}"}
+    if label == "commoncontent.link":
+        return {f"menu:{instance.menu_id}"}
+    if label == "commoncontent.articleseries":
+        return {f"series:{instance.pk}"}
+
+    tags = {f"{model_name}:{instance.pk}"}
+    if label == "commoncontent.article":
+        tags.add(f"articles:{site_id}")
+        if instance.series_id:
+            tags.add(f"series:{instance.series_id}")
+        # Pages of the section and series the article moved out of are stale too
+        saved = getattr(instance, "_saved_placement", {})
+        for fk, model in (("section_id", "section"), ("series_id", "series")):
+            previous, current = saved.get(fk), getattr(instance, fk)
+            if previous and previous != current:
+                tags.add(f"{model}:{previous}")
+                if current:
+                    tags.add(f"{model}:{current}")
+    elif label == "commoncontent.author":
+        # Author names are displayed in article lists
+        tags.update((f"authors:{site_id}", f"articles:{site_id}"))
+    elif label == "commoncontent.section":
+        # Sections appear in the default main-nav menu on every page, and their slugs
+        # in the URLs of article lists
+        tags.update((f"sections:{site_id}", f"articles:{site_id}"))
+    elif label == "commoncontent.homepage":
+        tags.add(f"homepages:{site_id}")
+    elif label == "commoncontent.page":
+        tags.add(f"pages:{site_id}")
+    elif label == "commoncontent.menu":
+        tags.add(f"menus:{site_id}")
+    return tags
+
+
+def record_dependencies(request, *tags):
+    """Record that the page being rendered for ``request`` depends on ``tags``."""
+    if request is None:
+        return
+    if not hasattr(request, "_commoncontent_dependencies"):
+        request._commoncontent_dependencies = set()
+    request._commoncontent_dependencies.update(tags)
+
+
+def tracks_dependencies(request) -> bool:
+    """Whether the dependency tags of ``request`` are used: by the page cache,
+    conditional GET, the cache tag header or a static build. For views to skip work
+    that only records dependencies."""
+    if request is None:
+        return False
+    conf = apps.get_app_config("commoncontent")
+    return bool(
+        conf.page_cache
+        or conf.conditional_get
+        or conf.cache_tag_header
+        or request.META.get(STATIC_BUILD_ENVIRON)
+    )
+
+
+def get_dependencies(request) -> T.Set[str]:
+    """Return the dependency tags recorded so far for ``request``."""
+    return getattr(request, "_commoncontent_dependencies", set())
+
+
+######################################################################################
+# Tag versions
+######################################################################################
+def get_tag_versions(tags: T.Iterable[str], create=False) -> T.Dict[str, str]:
+    """Return the current version token of each tag. Tags with no version in the cache
+    are omitted, unless ``create`` is True, in which case a version is assigned."""
+    cache = get_cache()
+    keys = {TAG_KEY_PREFIX + tag: tag for tag in tags}
+    found = cache.get_many(keys.keys())
+    versions = {keys[key]: version for key, version in found.items()}
+    if create:
+        missing = {
+            key: uuid.uuid4().hex for key, tag in keys.items() if tag not in versions
+        }
+        if missing:
+            cache.set_many(missing, None)
+            versions.update({keys[key]: version for key, version in missing.items()})
+    return versions
+
+
+def invalidate_tags(tags: T.Iterable[str]):
+    """Assign new versions to ``tags``, invalidating every page that depends on them."""
+    tags = list(tags)
+    if tags:
+        get_cache().set_many(
+            {TAG_KEY_PREFIX + tag: uuid.uuid4().hex for tag in tags}, None
+        )
+
+
+def cached_value(key: str, tags, compute: T.Callable, timeout=None):
+    """Return the value cached under ``key`` if none of its dependency ``tags`` have
+    changed since it was stored, otherwise ``compute()`` it and cache it.
+
+    If the tags are only known once the value is computed, pass a function returning
+    them from the value as ``tags``."""
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is not None:
+        versions, value = entry
+        if get_tag_versions(versions.keys()) == versions:
+            return value
+    if callable(tags):
+        # Like pages, take the versions once the dependencies are known
+        value = compute()
+        versions = get_tag_versions(tags(value), create=True)
+    else:
+        # Take the versions first, so a change made while computing invalidates it
+        versions = get_tag_versions(tags, create=True)
+        value = compute()
+    cache.set(key, (versions, value), timeout)
+    return value
+
+
+######################################################################################
+# Site variables
+######################################################################################
+# Snapshots of the SiteVars loaded by the current request, by site id. None outside
+# of a request.
+_request_vars: ContextVar = ContextVar("commoncontent_sitevars", default=None)
+# With COMMONCONTENT_SITEVARS_CACHE, snapshots kept between requests in this process,
+# by site id, with the version of the site's tag they were loaded at.
+_process_vars: T.Dict[int, T.Tuple[str, "SiteVars"]] = {}
+
+
+class SiteVars(dict):
+    """A snapshot of all the SiteVars of a Site, by name. ``get_value`` works like
+    ``site.vars.get_value`` without querying the database."""
+
+    def get_value(self, name: str, default: str = "", asa: T.Callable = str):
+        val = self.get(name, default)
+        return asa(val) if val is not None else val
+
+
+def load_site_vars(site_id: int) -> SiteVars:
+    """Load the SiteVars of a site with at most one query. They are kept in the
+    process's memory if ``COMMONCONTENT_SITEVARS_CACHE`` is enabled, until they
+    change."""
+    conf = apps.get_app_config("commoncontent")
+    if conf.sitevars_cache:
+        tag = f"site:{site_id}"
+        # Take the version first, so a change made while loading is not missed
+        version = get_tag_versions([tag], create=True)[tag]
+        entry = _process_vars.get(site_id)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+    SiteVar = apps.get_model("sitevars", "SiteVar")
+    # Share django-sitevars' own cache when it is enabled. Like django-sitevars, do not
+    # use it inside a transaction, where it can get out of sync.
+    key = f"sitevars:{site_id}"
+    shared = apps.get_app_config("sitevars").use_cache and transaction.get_autocommit()
+    values = default_cache.get(key) if shared else None
+    if values is None:
+        values = dict(
+            SiteVar.objects.filter(site_id=site_id).values_list("name", "value")
+        )
+        if shared:
+            default_cache.set(key, values)
+    values = SiteVars(values)
+    if conf.sitevars_cache:
+        _process_vars[site_id] = (version, values)
+    return values
+
+
+def site_vars(site) -> SiteVars:
+    """Return the SiteVars of ``site`` (a Site or its id). Within a request, they are
+    loaded once and shared by every caller."""
+    site_id = getattr(site, "pk", site)
+    snapshots = _request_vars.get()
+    if snapshots is None:
+        return load_site_vars(site_id)
+    if site_id not in snapshots:
+        snapshots[site_id] = load_site_vars(site_id)
+    return snapshots[site_id]
+
+
+def begin_request(**kwargs):
+    "request_started handler: start a new set of SiteVars snapshots."
+    _request_vars.set({})
+
+
+def end_request(**kwargs):
+    "request_finished handler: discard the request's SiteVars snapshots."
+    _request_vars.set(None)
+
+
+def forget_site_vars(site_id: int):
+    """Discard the snapshots of a site's SiteVars, after they changed. Other processes
+    notice the change by the version of the ``site:`` tag."""
+    snapshots = _request_vars.get()
+    if snapshots:
+        snapshots.pop(site_id, None)
+    _process_vars.pop(site_id, None)
+
+
+######################################################################################
+# Scheduled publication and expiration
+######################################################################################
+def next_transition(site_id):
+    """Return the next time any content on the site is scheduled to go live or expire,
+    or None if nothing is scheduled.
+
+    The result is cached until that time, or until content on the site changes."""
+    cache = get_cache()
+    key = f"{TRANSITION_KEY_PREFIX}{site_id}"
+    tags = [f"{collection}:{site_id}" for collection in SCHEDULED_MODELS.values()]
+    entry = cache.get(key)
+    if entry is not None:
+        versions, transition = entry
+        if get_tag_versions(versions.keys()) == versions and (
+            transition is None or transition > timezone.now()
+        ):
+            return transition
+
+    versions = get_tag_versions(tags, create=True)
+    transitions = []
+    for model_name in SCHEDULED_MODELS:
+        model = apps.get_model("commoncontent", model_name)
+        if when := model.objects.filter(site_id=site_id).next_transition():
+            transitions.append(when)
+    transition = min(transitions) if transitions else None
+    cache.set(key, (versions, transition), transition_timeout(transition, None))
+    return transition
+
+
+def transition_timeout(transition, timeout):
+    """Shorten the cache ``timeout`` (in seconds, None for forever) so that it expires
+    no later than the ``transition`` time."""
+    if transition is None:
+        return timeout
+    remaining = max(1, math.ceil((transition - timezone.now()).total_seconds()))
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def site_cache_timeout(site_id, timeout):
+    """Bound the cache ``timeout`` for content displayed on the site by the site's next
+    scheduled publication or expiration, so that cached pages change on time."""
+    return transition_timeout(next_transition(site_id), timeout)
+
+
+######################################################################################
+# Page cache
+######################################################################################
+def page_cache_key(request, prefix=PAGE_KEY_PREFIX) -> str:
+    """Cache key for a page, based on the site, the path, and the requested page
+    number."""
+    site = get_current_site(request)
+    path = md5(request.path.encode(), usedforsecurity=False).hexdigest()
+    page = request.GET.get("page", "")
+    return f"{prefix}{site.pk}:{path}:{page}"
+
+
+def is_cacheable(response) -> bool:
+    if response.status_code != 200 or response.cookies:
+        return False
+    cache_control = response.get("Cache-Control", "")
+    return "private" not in cache_control and "no-store" not in cache_control
+
+
+def store_page(request, response):
+    if not is_cacheable(response):
+        return
+    conf = apps.get_app_config("commoncontent")
+    versions = get_tag_versions(get_dependencies(request), create=True)
+    site = get_current_site(request)
+    timeout = site_cache_timeout(site.pk, conf.page_cache_timeout)
+    get_cache().set(page_cache_key(request), (versions, response), timeout)
+
+
+def add_cache_tags(request, response):
+    """List the page's dependency tags in the ``COMMONCONTENT_CACHE_TAG_HEADER``
+    header, for a CDN to purge the page by."""
+    header = apps.get_app_config("commoncontent").cache_tag_header
+    if not header or response.has_header(header):
+        return
+    # Fastly's Surrogate-Key is space separated, other CDNs' headers comma separated
+    separator = " " if header.lower() == "surrogate-key" else ","
+    response.headers[header] = separator.join(sorted(get_dependencies(request)))
+
+
+def limit_shared_max_age(request, response):
+    """Set the ``s-maxage`` of a page served to a CDN to expire no later than the next
+    scheduled publication or expiration on the site, which purges nothing."""
+    if not apps.get_app_config("commoncontent").cache_tag_header:
+        return
+    site = get_current_site(request)
+    if (timeout := site_cache_timeout(site.pk, None)) is not None:
+        patch_cache_control(response, s_maxage=timeout)
+
+
+def store_validators(request, response):
+    """Set the ETag and Last-Modified headers of a rendered page, and remember them
+    with the versions of the page's dependencies, for ``not_modified``."""
+    if not is_cacheable(response) or response.streaming or response.has_header("ETag"):
+        return
+    conf = apps.get_app_config("commoncontent")
+    cache = get_cache()
+    key = page_cache_key(request, VALIDATORS_KEY_PREFIX)
+    etag = quote_etag(md5(response.content, usedforsecurity=False).hexdigest())
+    previous = cache.get(key)
+    if previous is not None and previous[1] == etag:
+        # Rendered again after a change that did not affect this page
+        last_modified = previous[2]
+    else:
+        last_modified = int(timezone.now().timestamp())
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(last_modified)
+
+    versions = get_tag_versions(get_dependencies(request), create=True)
+    site = get_current_site(request)
+    timeout = site_cache_timeout(site.pk, conf.page_cache_timeout)
+    cache.set(key, (versions, etag, last_modified), timeout)
+
+
+def not_modified(request):
+    """Return a 304 Not Modified response if the client's copy of the page, identified
+    by the request's If-None-Match or If-Modified-Since header, is still current.
+    Costs no database queries."""
+    entry = get_cache().get(page_cache_key(request, VALIDATORS_KEY_PREFIX))
+    if entry is None:
+        return None
+    versions, etag, last_modified = entry
+    if get_tag_versions(versions.keys()) != versions:
+        return None
+    # The headers to send with a 304 response
+    headers = HttpResponse()
+    headers["ETag"] = etag
+    headers["Last-Modified"] = http_date(last_modified)
+    response = get_conditional_response(request, etag, last_modified, headers)
+    if response is headers:
+        # The client does not have the page, or sent no conditional headers
+        return None
+    record_dependencies(request, *versions)
+    return response
+
+
+def cached_response(request, render: T.Callable):
+    """Return the cached response for ``request`` if it is still current, otherwise
+    call ``render`` to produce the response, and cache it once rendered.
+
+    Responses list their dependency tags in ``COMMONCONTENT_CACHE_TAG_HEADER``, if
+    set. With conditional GET enabled, they carry ETag and Last-Modified headers, and
+    requests from clients that already have the current page are answered with 304
+    Not Modified, without rendering it."""
+    conf = apps.get_app_config("commoncontent")
+    if request.method not in ("GET", "HEAD"):
+        return render()
+
+    if conf.conditional_get and (response := not_modified(request)) is not None:
+        return response
+
+    if conf.page_cache:
+        entry = get_cache().get(page_cache_key(request))
+        if entry is not None:
+            versions, response = entry
+            if get_tag_versions(versions.keys()) == versions:
+                record_dependencies(request, *versions)
+                limit_shared_max_age(request, response)
+                return response
+
+    def store(response):
+        add_cache_tags(request, response)
+        limit_shared_max_age(request, response)
+        if conf.conditional_get:
+            # Before caching the page, so the cached page has the headers too
+            store_validators(request, response)
+        if conf.page_cache:
+            store_page(request, response)
+
+    response = render()
+    if callable(getattr(response, "render", None)) and not response.is_rendered:
+        # Template tags record their dependencies while the template renders
+        response.add_post_render_callback(store)
+    else:
+        store(response)
+    return response
+
+
+class CachedPageMixin:
+    """Serve the view from the page cache when enabled."""
+
+    def dispatch(self, request, *args, **kwargs):
+        return cached_response(
+            request,
+            lambda: super(CachedPageMixin, self).dispatch(request, *args, **kwargs),
+        )
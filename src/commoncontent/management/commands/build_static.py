@@ -0,0 +1,171 @@
+"""
+Render the public pages of one or more Sites to static files.
+
+Every live URL of each Site (see ``commoncontent.staticsite.site_urls``) is rendered
+through the project's own URLconf and views, and written under the output directory in a
+folder named for the Site's domain. Rendering is spread across a pool of processes, one
+per CPU by default.
+
+Builds are incremental: a manifest saved in each site's folder records what every page
+depended on, and later builds only render pages whose content has changed, plus new
+pages. Pages that are no longer live are deleted. Use ``--full`` to render every page,
+e.g. after changing templates.
+
+Static and media files are not copied. Use ``collectstatic`` and copy ``MEDIA_ROOT`` to
+publish those alongside the pages.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from commoncontent.models import Site
+from commoncontent.staticsite import (
+    Manifest,
+    fingerprint_tags,
+    init_worker,
+    output_path,
+    render_urls,
+    site_urls,
+)
+
+
+def batched(iterable, size):
+    "Batch data from the iterable into lists of length ``size`` (the last may be shorter)"
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Render the public pages of the site(s) to static files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output",
+            type=Path,
+            help="Directory to write the sites into, one folder per site domain.",
+        )
+        parser.add_argument(
+            "--site",
+            action="append",
+            dest="sites",
+            help=(
+                "ID or domain of a Site to build. May be given more than once. "
+                "Defaults to all Sites."
+            ),
+        )
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes. Defaults to the number of CPUs.",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Render every page, ignoring the manifest of the previous build.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Number of pages each worker renders per task.",
+        )
+
+    def get_sites(self, identifiers):
+        if not identifiers:
+            return list(Site.objects.order_by("pk"))
+        sites = []
+        for site_id in identifiers:
+            # Determine whether they passed a site id or domain
+            try:
+                lookup = {"id": int(site_id)}
+            except ValueError:
+                lookup = {"domain": site_id}
+            try:
+                sites.append(Site.objects.get(**lookup))
+            except Site.DoesNotExist:
+                raise CommandError(f"Site with {lookup} does not exist.") from None
+        return sites
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        jobs = max(1, options["jobs"] or 1)
+        start = time.perf_counter()
+
+        builds = []
+        tasks = []
+        skipped = removed = 0
+        for site in self.get_sites(options["sites"]):
+            site_dir = output / site.domain
+            manifest = Manifest() if options["full"] else Manifest.load(site_dir)
+            # Fingerprint the content before rendering, so that changes made while the
+            # build runs are picked up by the next build.
+            fingerprints = fingerprint_tags(manifest.tags())
+            paths = list(site_urls(site))
+            stale = [
+                path
+                for path in paths
+                if manifest.is_stale(path, fingerprints)
+                or not (site_dir / output_path(path)).exists()
+            ]
+            skipped += len(paths) - len(stale)
+            for path in set(manifest.dependencies) - set(paths):
+                (site_dir / output_path(path)).unlink(missing_ok=True)
+                manifest.remove(path)
+                removed += 1
+            builds.append((site_dir, manifest, fingerprints))
+            for batch in batched(stale, options["batch_size"]):
+                digests = {path: manifest.digests.get(path) for path in batch}
+                tasks.append((len(builds) - 1, (site.pk, batch, site_dir, digests)))
+
+        if jobs == 1 or len(tasks) < 2:
+            results = [(build, render_urls(*task)) for build, task in tasks]
+        else:
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as pool:
+                futures = {
+                    pool.submit(render_urls, *task): build for build, task in tasks
+                }
+                results = [
+                    (futures[future], future.result())
+                    for future in as_completed(futures)
+                ]
+
+        rendered = 0
+        failed = []
+        for build, batch in results:
+            builds[build][1].update(batch)
+            for result in batch:
+                if result.status < 400:
+                    rendered += 1
+                else:
+                    failed.append(result)
+
+        for site_dir, manifest, fingerprints in builds:
+            # Tags recorded for the first time in this build
+            fingerprints.update(fingerprint_tags(manifest.tags() - fingerprints.keys()))
+            manifest.fingerprints = {
+                tag: fingerprints[tag] for tag in manifest.tags() if tag in fingerprints
+            }
+            manifest.save(site_dir)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rendered {rendered} pages to {output} in {elapsed:.1f}s "
+                f"({skipped} unchanged, {removed} removed)"
+            )
+        )
+        if failed:
+            for result in failed:
+                self.stderr.write(self.style.ERROR(f"{result.status} {result.path}"))
+            raise CommandError(f"{len(failed)} pages could not be rendered.")
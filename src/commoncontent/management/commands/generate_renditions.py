@@ -0,0 +1,111 @@
+"""
+Generate the renditions of existing Images, e.g. after installing Common Content on a
+site with images, adding a rendition to ``COMMONCONTENT_RENDITIONS``, or restoring
+media files without their renditions.
+
+Images are processed in batches across a pool of processes, one per CPU by default.
+Renditions that already exist are skipped, unless ``--force`` is given.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from imagekit.models import ImageSpecField
+
+from commoncontent.management.commands.build_static import batched
+from commoncontent.models import Image, Site
+from commoncontent.renditions import generate_image_renditions
+from commoncontent.staticsite import init_worker
+
+
+class Command(BaseCommand):
+    help = "Generate the renditions of existing images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--site",
+            help="ID or domain of the Site whose images to process. Defaults to all.",
+        )
+        parser.add_argument(
+            "--rendition",
+            action="append",
+            dest="renditions",
+            help=(
+                "Name of a rendition to generate, e.g. 'medium'. May be given more "
+                "than once. Defaults to those of COMMONCONTENT_RENDITIONS chosen for "
+                "each image by COMMONCONTENT_RENDITION_POLICY."
+            ),
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Generate renditions again even if they exist.",
+        )
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes. Defaults to the number of CPUs.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Number of images each worker processes per task.",
+        )
+
+    def get_images(self, site_id):
+        images = Image.objects.exclude(image_file="").exclude(image_file=None)
+        if site_id:
+            # Determine whether they passed a site id or domain
+            try:
+                lookup = {"id": int(site_id)}
+            except ValueError:
+                lookup = {"domain": site_id}
+            try:
+                images = images.filter(site=Site.objects.get(**lookup))
+            except Site.DoesNotExist:
+                raise CommandError(f"Site with {lookup} does not exist.") from None
+        return images
+
+    def handle(self, *args, **options):
+        names = options["renditions"]
+        unknown = [
+            name
+            for name in names or ()
+            if not isinstance(getattr(Image, name, None), ImageSpecField)
+        ]
+        if unknown:
+            raise CommandError(f"Unknown renditions: {', '.join(unknown)}")
+        jobs = max(1, options["jobs"] or 1)
+        start = time.perf_counter()
+
+        pks = list(
+            self.get_images(options["site"]).order_by("pk").values_list("pk", flat=True)
+        )
+        tasks = [
+            (batch, names, options["force"])
+            for batch in batched(pks, options["batch_size"])
+        ]
+        if jobs == 1 or len(tasks) < 2:
+            generated = sum(generate_image_renditions(*task) for task in tasks)
+        else:
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as pool:
+                futures = [
+                    pool.submit(generate_image_renditions, *task) for task in tasks
+                ]
+                generated = sum(future.result() for future in as_completed(futures))
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {generated} rendition files of {len(pks)} images in "
+                f"{elapsed:.1f}s"
+            )
+        )
@@ -26,51 +26,58 @@ The command should be able to handle multiple markdown files passed as arguments
 
 The command should also be able to handle markdown files that do not have YAML front
 matter.
+
+Large sites can have tens of thousands of files, so the files are parsed in parallel by
+a pool of worker processes (see ``commoncontent.markdown_import``), and the Articles
+and their tags are inserted in batches, one transaction per batch. Highlighted code
+blocks are cached, so that snippets repeated across files are highlighted once.
+
+The command can be run again on the same files to keep the site in sync with them. The
+hash of each imported file is stored (see ``ImportedFile``), so that files that have
+not changed are skipped without being parsed. With ``--update``, the Articles of
+changed files are updated, and with ``--withdraw-missing``, the Articles of files that
+were deleted are withdrawn.
 """
 
-import logging
-import re
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 from pathlib import Path
 
-from dateutil.parser import parse
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 from django.utils.text import slugify
-from mistletoe import Document
-from mistletoe.contrib.pygments_renderer import PygmentsRenderer
-from yaml import Loader, load
+from taggit.models import Tag
 
 from commoncontent.common import Status
-from commoncontent.models import Article, Section, Site
-
-# Define the regular expression pattern for YAML front matter
-# This pattern looks for text that starts and ends with triple dashes
-# and captures everything in between as the YAML front matter.
-# It also captures everything after the second set of triple dashes as content.
-# Use the re.DOTALL flag to make the dot match newlines as well
-pattern = re.compile(r"^---\s*\n(.*?)\n---\s*\n(.*)", re.DOTALL)
-logger = logging.getLogger(__name__)
-
-
-def extract_title_from_ast(doc):
-    """
-    Extract the title from the AST of the markdown content.
-    The title is assumed to be the first heading in the content.
-    """
-    for index, node in enumerate(doc.children):
-        logger.debug(f"Examining node {node}")
-        if node.__class__.__name__ == "Heading":
-            logger.debug(f"Found heading node {node}")
-            title = node.children[0].content
-            # Remove the node from the AST, title is a separate element in the final HTML
-            doc.children.pop(index)
-            return title
-    return ""
+from commoncontent.markdown_import import (
+    ARTICLE_FIELDS,
+    configure_highlight_cache,
+    extract_title_from_ast,
+    file_hash,
+    iter_markdown_files,
+    parse_markdown_file,
+    parse_markdown_files,
+    slug_for_path,
+)
+from commoncontent.models import Article, ImportedFile, Section, Site
+from commoncontent.signals import tags_changed
+
+__all__ = ["Command", "extract_title_from_ast"]
+
+# The stages of the import, in the order they are reported
+STAGES = ("read", "yaml", "markdown", "highlight", "db")
 
 
 class Command(BaseCommand):
     help = "Import markdown files from Hugo or another static site generator."
+    # Number of files sent to a worker process at a time
+    parse_chunk_size = 32
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -86,18 +93,63 @@ class Command(BaseCommand):
                 "Defaults to the value of the SITE_ID setting."
             ),
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of Articles to insert per transaction.",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            default=os.cpu_count() or 1,
+            help=(
+                "Number of processes parsing markdown files. Defaults to the number "
+                "of CPUs. Use 1 to parse in the main process."
+            ),
+        )
+        parser.add_argument(
+            "--highlight-cache",
+            type=Path,
+            help=(
+                "Directory to store highlighted code blocks in, to reuse them in "
+                "later imports. Code blocks are always reused within an import."
+            ),
+        )
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            help=(
+                "Update Articles whose file changed since it was imported. Without "
+                "this option, files whose Article already exists are skipped."
+            ),
+        )
+        parser.add_argument(
+            "--withdraw-missing",
+            action="store_true",
+            help=(
+                "Withdraw (cancel) Articles imported into the section from files that "
+                "are not given this time, e.g. because they were deleted."
+            ),
+        )
         parser.add_argument(
             "files",
             type=Path,
             nargs="+",
-            help="Markdown files to import as Articles. Can be one or more files.",
+            help=(
+                "Markdown files to import as Articles, directories to search for "
+                "them, or quoted glob patterns such as 'content/**/*.md'."
+            ),
         )
 
     def handle(self, *args, **options):
         section_title = options["section"]
         site_id = options["site"]
-        files = options["files"]
+        paths = options["files"]
+        batch_size = max(1, options["batch_size"])
+        self.verbosity = options["verbosity"]
         now = timezone.now()
+        start = time.perf_counter()
 
         # Determine whether they passed a site id or domain, and load the Site object
         # from the database
@@ -120,119 +172,239 @@ class Command(BaseCommand):
             defaults={"slug": slugify(section_title), "date_published": now},
         )
 
-        for file in files:
-            markdown_content = file.read_text()
-
-            # Extract the YAML front matter and content from the markdown file
-            match = re.match(pattern, markdown_content)
-
-            ##################################################################
-            # Has YAML front matter. Extract metadata and content from file
-            ##################################################################
-            if match:
-                yaml_front_matter = match.group(1)
-                content = match.group(2)
-
-                # Convert the markdown content to AST form
-                doc = Document(content)
-
-                # Load the YAML front matter into a dictionary
-                metadata = load(yaml_front_matter, Loader=Loader)
-                # Hugo only allows certain fields in the front matter, and custom fields
-                # are prefixed with "params."
-                if "params" in metadata:
-                    params = metadata.pop("params")
-                    metadata.update(params)
-
-                # Extract the title from the YAML front matter or the first heading
-                title = metadata.get("title", None)
-                if not title:
-                    title = extract_title_from_ast(doc)
-
-                # Extract the publish date from the YAML front matter. Various SSGs use
-                # different keys for the date field, so we need to check for multiple
-                # keys
-                date_keys = ["date", "publishDate", "published", "publishedAt"]
-                date = None
-                for key in date_keys:
-                    if key in metadata:
-                        date = parse(metadata[key])
-                        break
-                if not date:
-                    date = now
-
-                # In some cases we also have a modified date
-                mod_keys = ["lastmod", "lastModified", "updated", "updatedAt"]
-                modified = None
-                for key in mod_keys:
-                    if key in metadata:
-                        modified = parse(metadata[key])
-                        break
-
-                # In rare cases there may be an expiry date
-                expiry_keys = ["expiryDate", "expires", "expiresAt"]
-                expires = None
-                for key in expiry_keys:
-                    if key in metadata:
-                        expires = parse(metadata[key])
-                        break
-
-                # Extract the description from the YAML front matter
-                description = metadata.get("description", "")
-
-                # Extract the slug from the filename
-                slug = file.stem
-
-                # If this is a draft, set the status appropriately
-                status = Status.USABLE
-                if metadata.get("draft", False):
-                    status = Status.WITHHELD
-
-                # Extract tags from the metadata
-                tags = metadata.get("tags", [])
-
-                # Produce the HTML content from the AST
-                renderer = PygmentsRenderer()
-                html_content = renderer.render(doc)
-
-                # Create the Article object
-                article = Article.objects.create(
-                    title=title,
-                    slug=slug,
-                    section=section,
-                    site=site,
-                    status=status,
-                    description=description,
-                    body=html_content,
-                    date_published=date,
-                    date_modified=modified,
-                    expires=expires,
-                )
-                if tags:
-                    article.tags.add(*tags)
+        # The ID, imported file hash and publish date of each Article already in the
+        # section, by slug
+        self.existing = {
+            slug: values
+            for slug, *values in Article.objects.filter(
+                site=site, section=section
+            ).values_list("slug", "pk", "imported_file__content_hash", "date_published")
+        }
+        self.counts = Counter()
+        self.timings = Counter()
+        seen = set()
+        # Counting the files first costs a directory walk, but allows reporting an ETA
+        total = sum(1 for path in iter_markdown_files(paths))
+
+        # Files are read, parsed and saved as they are found, so that memory use does
+        # not grow with the number of files
+        batch = []
+        files = self.changed_files(iter_markdown_files(paths), seen, options["update"])
+        parsed_files = self.parse_files(
+            files, options["jobs"], options["highlight_cache"]
+        )
+        for parsed in parsed_files:
+            self.timings.update(parsed.timings)
+            self.counts["code_blocks"] += parsed.code_blocks
+            self.counts["cached_code_blocks"] += parsed.cached_code_blocks
+            batch.append(parsed)
+            if len(batch) >= batch_size:
+                self.save_batch(batch, site, section, now)
+                batch = []
+                self.report_progress(total, start)
+        if batch:
+            self.save_batch(batch, site, section, now)
+        if options["withdraw_missing"]:
+            self.withdraw_missing(seen, site)
+
+        elapsed = time.perf_counter() - start
+        count = self.counts["created"] + self.counts["updated"]
+        self.stdout.write(
+            f"Imported {count} articles in {elapsed:.1f}s "
+            f"({count / max(elapsed, 0.001):.1f} articles/s): "
+            f"{self.counts['created']} created, {self.counts['updated']} updated, "
+            f"{self.counts['skipped']} skipped, {self.counts['withdrawn']} withdrawn"
+        )
+        if self.verbosity >= 1:
+            stages = ", ".join(f"{s} {self.timings[s]:.1f}s" for s in STAGES)
+            self.stdout.write(f"Time per stage, summed over processes: {stages}")
+            self.stdout.write(
+                f"Highlighted {self.counts['code_blocks']} code blocks, "
+                f"{self.counts['cached_code_blocks']} from the cache"
+            )
+
+    def report_progress(self, total, start):
+        if self.verbosity < 1:
+            return
+        done = sum(self.counts[key] for key in ("created", "updated", "skipped"))
+        elapsed = time.perf_counter() - start
+        rate = done / max(elapsed, 0.001)
+        eta = (total - done) / rate if rate else 0
+        self.stdout.write(
+            f"{done}/{total} files ({done / max(total, 1):.0%}) in {elapsed:.0f}s, "
+            f"{rate:.1f} files/s, ETA {eta:.0f}s"
+        )
 
-            ##################################################################
-            # No YAML front matter. Assume the entire file is content
-            ################################################################
+    def changed_files(self, files, seen, update):
+        """Yield the files that need importing: those without an Article, and with
+        ``update``, those that changed since they were imported. Adds the slug of every
+        file to ``seen``."""
+        for path in files:
+            slug = slug_for_path(path)
+            if slug in seen:
+                self.stderr.write(f"Skipping {path}, another file has its slug.")
+                self.counts["skipped"] += 1
+                continue
+            seen.add(slug)
+            pk, content_hash, _ = self.existing.get(slug, (None, None, None))
+            if pk is not None and (not update or self.unchanged(path, content_hash)):
+                self.counts["skipped"] += 1
+                continue
+            yield path
+
+    def unchanged(self, path, content_hash) -> bool:
+        "True if the file at ``path`` has the hash it had when it was imported."
+        start = time.perf_counter()
+        unchanged = content_hash == file_hash(path)
+        self.timings["read"] += time.perf_counter() - start
+        return unchanged
+
+    def parse_files(self, files, jobs, highlight_cache=None):
+        """Yield the ParsedArticle of each file, in order. Files are sent to worker
+        processes in chunks, reading only a few chunks ahead of the results."""
+        files = iter(files)
+        chunk = list(islice(files, self.parse_chunk_size))
+        if jobs <= 1 or len(chunk) < self.parse_chunk_size:
+            # Not worth starting worker processes
+            configure_highlight_cache(highlight_cache)
+            yield from map(parse_markdown_file, chain(chunk, files))
+            return
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=configure_highlight_cache,
+            initargs=(highlight_cache,),
+        ) as executor:
+            pending = deque()
+            while chunk:
+                pending.append(executor.submit(parse_markdown_files, chunk))
+                if len(pending) > jobs * 2:
+                    yield from pending.popleft().result()
+                chunk = list(islice(files, self.parse_chunk_size))
+            while pending:
+                yield from pending.popleft().result()
+
+    def save_batch(self, batch, site, section, now):
+        """Insert or update the Articles parsed from a batch of files, with their tags,
+        in one transaction."""
+        start = time.perf_counter()
+        new = []
+        updated = []
+        imported = []
+        for parsed in batch:
+            pk, _, date_published = self.existing.get(parsed.slug, (None, None, now))
+            article = Article(
+                pk=pk, site=site, section=section, **parsed.article_fields()
+            )
+            if article.date_published is None:
+                # Keep the publish date of updated Articles
+                article.date_published = date_published or now
+            # bulk_create() does not call save(), so store the excerpt as save() would
+            article.update_excerpt()
+            if pk is None:
+                article._order = 0
+                new.append(article)
             else:
-                # Convert the markdown content to AST form
-                doc = Document(markdown_content)
-                # Extract the title from the first heading
-                title = extract_title_from_ast(doc)
-                renderer = PygmentsRenderer()
-                content = renderer.render(doc)
-
-                # Extract the slug from the filename
-                slug = file.stem
-
-                # Create the Article object
-                article = Article.objects.create(
-                    title=title,
-                    slug=slug,
-                    section=section,
-                    site=site,
-                    status=Status.USABLE,
-                    body=content,
-                    description="",
-                    date_published=now,
+                updated.append(article)
+            imported.append((article, parsed))
+
+        with transaction.atomic():
+            Article.objects.bulk_create(new)
+            if any(article.pk is None for article in new):
+                # The database does not return the IDs of bulk inserted rows
+                ids = dict(
+                    Article.objects.filter(
+                        site=site, section=section, slug__in=[a.slug for a in new]
+                    ).values_list("slug", "pk")
+                )
+                for article in new:
+                    article.pk = ids[article.slug]
+            if updated:
+                Article.objects.bulk_update(
+                    updated, [*ARTICLE_FIELDS, *Article.EXCERPT_FIELDS]
+                )
+                # Replace the tags of updated Articles
+                Article.tags.through.objects.filter(
+                    content_type=ContentType.objects.get_for_model(Article),
+                    object_id__in=[article.pk for article in updated],
+                ).delete()
+            self.save_tags([(article, parsed.tags) for article, parsed in imported])
+
+            ImportedFile.objects.filter(
+                article__in=[article.pk for article in updated]
+            ).delete()
+            ImportedFile.objects.bulk_create(
+                ImportedFile(
+                    article_id=article.pk,
+                    path=str(parsed.path),
+                    content_hash=parsed.content_hash,
+                    date_imported=now,
                 )
+                for article, parsed in imported
+            )
+
+            # bulk_create() does not send post_save, so invalidate the article lists
+            # and the pages of updated Articles
+            tags_changed({f"articles:{site.pk}", *(f"article:{a.pk}" for a in updated)})
+        self.counts["created"] += len(new)
+        self.counts["updated"] += len(updated)
+        self.timings["db"] += time.perf_counter() - start
+
+    def withdraw_missing(self, seen, site):
+        """Withdraw the Articles imported into the section from files whose slugs are
+        not in ``seen``."""
+        missing = [
+            pk
+            for slug, (pk, content_hash, _) in self.existing.items()
+            if content_hash and slug not in seen
+        ]
+        with transaction.atomic():
+            for start in range(0, len(missing), 500):
+                ids = missing[start : start + 500]
+                Article.objects.filter(pk__in=ids).update(status=Status.CANCELLED)
+                # Clear the hash, so that the Article is updated if the file is restored
+                ImportedFile.objects.filter(article__in=ids).update(content_hash="")
+            if missing:
+                tags_changed(
+                    {f"articles:{site.pk}", *(f"article:{pk}" for pk in missing)}
+                )
+        self.counts["withdrawn"] += len(missing)
+
+    def save_tags(self, tagged):
+        """Tag Articles with Tags by name, creating missing Tags. ``tagged`` is a list
+        of ``(article, tag_names)`` pairs."""
+        names = {name for article, tag_names in tagged for name in tag_names}
+        if not names:
+            return
+        tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+        missing = sorted(names - tags.keys())
+        if missing:
+            # Tag.save() makes slugs unique, bulk_create() does not, so save() any Tag
+            # whose slug is taken
+            new_tags = {}
+            slugify_tag = Tag().slugify
+            taken = set(
+                Tag.objects.filter(
+                    slug__in=[slugify_tag(name) for name in missing]
+                ).values_list("slug", flat=True)
+            )
+            for name in missing:
+                tag = Tag(name=name, slug=slugify_tag(name))
+                if tag.slug in taken:
+                    tag.slug = ""
+                    tag.save()
+                    tags[name] = tag
+                else:
+                    taken.add(tag.slug)
+                    new_tags[name] = tag
+            Tag.objects.bulk_create(new_tags.values())
+            tags.update(
+                (tag.name, tag) for tag in Tag.objects.filter(name__in=list(new_tags))
+            )
+
+        through = Article.tags.through
+        content_type = ContentType.objects.get_for_model(Article)
+        through.objects.bulk_create(
+            through(content_type=content_type, object_id=article.pk, tag=tags[name])
+            for article, tag_names in tagged
+            for name in dict.fromkeys(tag_names)
+        )
@@ -0,0 +1,55 @@
+"""
+Store computed excerpts for pages saved before excerpts were stored, or before the
+``pagebreak_separator`` or ``COMMONCONTENT_EXCERPT_MAX_WORDS`` settings were changed.
+
+Until it is refreshed, a page whose stored excerpt is out of date computes its excerpt
+every time it is displayed, so the site is correct but slower. Run this command after
+upgrading and after changing either setting.
+"""
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from commoncontent.models import Article, HomePage, Page, Section
+
+
+class Command(BaseCommand):
+    help = "Compute and store the excerpts of pages whose excerpts are out of date."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Refresh every excerpt, even those stored with the current settings.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of pages to update per query.",
+        )
+
+    def handle(self, *args, **options):
+        conf = apps.get_app_config("commoncontent")
+        batch_size = options["batch_size"]
+        for model in (Section, Page, HomePage, Article):
+            queryset = model._base_manager.only("pk", "body").order_by("pk")
+            if not options["all"]:
+                queryset = queryset.exclude(excerpt_version=conf.excerpt_version)
+
+            count = 0
+            batch = []
+            for obj in queryset.iterator(chunk_size=batch_size):
+                obj.update_excerpt()
+                batch.append(obj)
+                if len(batch) >= batch_size:
+                    model._base_manager.bulk_update(batch, model.EXCERPT_FIELDS)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                model._base_manager.bulk_update(batch, model.EXCERPT_FIELDS)
+                count += len(batch)
+
+            self.stdout.write(
+                f"Refreshed the excerpts of {count} {model._meta.verbose_name_plural}"
+            )
@@ -0,0 +1,340 @@
+"""
+Parsing of markdown files from Hugo or another static site generator, for the
+``import_markdown`` command.
+
+Parsing is the slow part of an import, so the command runs ``parse_markdown_file`` in a
+pool of worker processes. This module must not import models, so that workers can
+import it without setting up Django, and what it returns must be picklable.
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import re
+import time
+import typing as T
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+import mistletoe
+import pygments
+from dateutil.parser import parse
+from mistletoe import Document
+from mistletoe.contrib.pygments_renderer import PygmentsRenderer
+from yaml import Loader, load
+
+from commoncontent.common import Status
+
+# Define the regular expression pattern for YAML front matter
+# This pattern looks for text that starts and ends with triple dashes
+# and captures everything in between as the YAML front matter.
+# It also captures everything after the second set of triple dashes as content.
+# Use the re.DOTALL flag to make the dot match newlines as well
+pattern = re.compile(r"^---\s*\n(.*?)\n---\s*\n(.*)", re.DOTALL)
+logger = logging.getLogger(__name__)
+
+# Various SSGs use different keys for the same field, so we check for each of them
+DATE_KEYS = ("date", "publishDate", "published", "publishedAt")
+MODIFIED_KEYS = ("lastmod", "lastModified", "updated", "updatedAt")
+EXPIRY_KEYS = ("expiryDate", "expires", "expiresAt")
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+# The Article fields set from a file
+ARTICLE_FIELDS = (
+    "title",
+    "slug",
+    "body",
+    "description",
+    "status",
+    "date_published",
+    "date_modified",
+    "expires",
+)
+
+
+@dataclass
+class ParsedArticle:
+    "The fields of an Article parsed from a markdown file."
+
+    path: Path
+    title: str
+    slug: str
+    body: str
+    description: str = ""
+    status: str = Status.USABLE
+    # None if the file does not give a publish date
+    date_published: T.Optional[datetime] = None
+    date_modified: T.Optional[datetime] = None
+    expires: T.Optional[datetime] = None
+    tags: T.List[str] = field(default_factory=list)
+    content_hash: str = ""
+    # Seconds spent on each stage of parsing
+    timings: T.Dict[str, float] = field(default_factory=dict)
+    # Number of code blocks, and how many of those were found in the highlight cache
+    code_blocks: int = 0
+    cached_code_blocks: int = 0
+
+    def article_fields(self) -> T.Dict[str, T.Any]:
+        "Keyword arguments for the Article model"
+        return {name: getattr(self, name) for name in ARTICLE_FIELDS}
+
+
+def extract_title_from_ast(doc):
+    """
+    Extract the title from the AST of the markdown content.
+    The title is assumed to be the first heading in the content.
+    """
+    for index, node in enumerate(doc.children):
+        logger.debug(f"Examining node {node}")
+        if node.__class__.__name__ == "Heading":
+            logger.debug(f"Found heading node {node}")
+            title = node.children[0].content
+            # Remove the node from the AST, title is a separate element in the final HTML
+            doc.children.pop(index)
+            return title
+    return ""
+
+
+class HighlightCache:
+    """Highlighted code blocks, by a hash of their code, language and the highlighting
+    software, so that a snippet repeated in many files (license headers, config
+    samples...) is highlighted once. Kept in memory, and in ``directory`` if given, to
+    be reused by later imports.
+
+    Each process has its own cache (see ``configure_highlight_cache``), whose ``hits``
+    and ``misses`` count the code blocks found in it or highlighted."""
+
+    def __init__(self, directory=None, max_entries=10000):
+        self.directory = Path(directory) if directory else None
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(code: str, language: str, style: str) -> str:
+        # The HTML also depends on the versions of Pygments and mistletoe
+        data = "\0".join(
+            (pygments.__version__, mistletoe.__version__, style, language, code)
+        )
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.html"
+
+    def _remember(self, key: str, html: str):
+        self.entries[key] = html
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, key: str) -> T.Optional[str]:
+        html = self.entries.get(key)
+        if html is not None:
+            self.entries.move_to_end(key)
+        elif self.directory is not None:
+            try:
+                html = self._path(key).read_text()
+            except FileNotFoundError:
+                return None
+            self._remember(key, html)
+        return html
+
+    def set(self, key: str, html: str):
+        self._remember(key, html)
+        if self.directory is not None:
+            path = self._path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first, so that concurrent workers never read a
+            # partial file
+            temp = path.with_name(f"{key}.{os.getpid()}.tmp")
+            temp.write_text(html)
+            os.replace(temp, path)
+
+
+highlight_cache = HighlightCache()
+
+
+def configure_highlight_cache(directory=None):
+    """Replace this process's highlight cache with one stored in ``directory``. Used to
+    initialize worker processes."""
+    global highlight_cache
+    highlight_cache = HighlightCache(directory)
+
+
+class ImportRenderer(PygmentsRenderer):
+    """Renders markdown with code blocks highlighted by Pygments. Highlighted code is
+    reused from the process's ``highlight_cache``, and the time spent highlighting is
+    recorded, for the import's statistics."""
+
+    style = "default"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, style=self.style, **kwargs)
+        self.highlight_time = 0.0
+
+    def render_block_code(self, token):
+        start = time.perf_counter()
+        key = HighlightCache.key(token.content, token.language or "", self.style)
+        html = highlight_cache.get(key)
+        if html is None:
+            highlight_cache.misses += 1
+            html = super().render_block_code(token)
+            highlight_cache.set(key, html)
+        else:
+            highlight_cache.hits += 1
+        self.highlight_time += time.perf_counter() - start
+        return html
+
+
+def render_markdown(
+    content: str, extract_title=False, timings: T.Optional[T.Dict[str, float]] = None
+) -> T.Tuple[str, str]:
+    """Render markdown ``content`` to HTML, with code blocks highlighted by Pygments.
+    Returns the HTML and, if ``extract_title``, the text of the first heading, which is
+    removed from the HTML. Adds the seconds spent to the "markdown" and "highlight"
+    entries of ``timings``, if given."""
+    start = time.perf_counter()
+    # Documents must be parsed inside the renderer's context: creating a renderer adds
+    # its tokens to mistletoe's global token lists, and leaving the context removes
+    # them. Otherwise the lists grow with every file, and parsing slows to a crawl.
+    with ImportRenderer() as renderer:
+        doc = Document(content)
+        title = extract_title_from_ast(doc) if extract_title else ""
+        html = renderer.render(doc)
+    if timings is not None:
+        highlight = renderer.highlight_time
+        timings["markdown"] = time.perf_counter() - start - highlight
+        timings["highlight"] = highlight
+    return html, title
+
+
+def file_hash(path: Path) -> str:
+    "SHA-256 of a file's contents, to tell whether it changed since it was imported."
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def slug_for_path(path: Path) -> str:
+    """The slug of the Article imported from ``path``: the file name without the
+    extension, or the directory name for Hugo's page bundles (``my-post/index.md``)."""
+    if path.stem == "index" and path.parent.name:
+        return path.parent.name
+    return path.stem
+
+
+def _is_markdown_file(name: str) -> bool:
+    "Whether a file named ``name`` is imported: a markdown file, but not a list page."
+    # Skip Hugo's _index.md files, which are list pages
+    return not name.startswith("_") and os.path.splitext(name)[1] in MARKDOWN_SUFFIXES
+
+
+def _walk(directory: str) -> T.Iterator[Path]:
+    "Yield the markdown files in ``directory`` and its subdirectories, in name order."
+    with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        # Skip hidden files and directories
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir():
+            # Not "_" directories, like Jekyll's _posts
+            yield from _walk(entry.path)
+        elif _is_markdown_file(entry.name):
+            yield Path(entry.path)
+
+
+def iter_markdown_files(paths: T.Iterable[Path]) -> T.Iterator[Path]:
+    """Yield the markdown files to import from ``paths``, which may be files,
+    directories to search recursively, or glob patterns like ``content/**/*.md`` (quote
+    them so that the shell does not expand them). Directories are read one at a time,
+    so that huge content trees can be imported with bounded memory."""
+    for path in paths:
+        if path.is_dir():
+            yield from _walk(str(path))
+        elif not path.exists() and any(char in str(path) for char in "*?["):
+            for match in glob.iglob(str(path), recursive=True):
+                # Patterns like content/** also match directories and other files
+                if _is_markdown_file(os.path.basename(match)) and os.path.isfile(match):
+                    yield Path(match)
+        else:
+            yield path
+
+
+def _first_date(metadata, keys):
+    for key in keys:
+        if key in metadata:
+            return parse(metadata[key])
+    return None
+
+
+def parse_markdown_file(path: Path) -> ParsedArticle:
+    """Parse a markdown file, with or without YAML front matter. The seconds spent on
+    each stage of the import are recorded in ``ParsedArticle.timings``."""
+    hits, misses = highlight_cache.hits, highlight_cache.misses
+    parsed = _parse_markdown_file(path)
+    parsed.cached_code_blocks = highlight_cache.hits - hits
+    parsed.code_blocks = parsed.cached_code_blocks + highlight_cache.misses - misses
+    return parsed
+
+
+def _parse_markdown_file(path: Path) -> ParsedArticle:
+    timings = {}
+    start = time.perf_counter()
+    markdown_content = path.read_text()
+    content_hash = file_hash(path)
+    timings["read"] = time.perf_counter() - start
+
+    # Extract the YAML front matter and content from the markdown file
+    match = re.match(pattern, markdown_content)
+    if not match:
+        # No YAML front matter. Assume the entire file is content
+        body, title = render_markdown(markdown_content, True, timings)
+        return ParsedArticle(
+            path=path,
+            title=title,
+            slug=slug_for_path(path),
+            body=body,
+            content_hash=content_hash,
+            timings=timings,
+        )
+
+    start = time.perf_counter()
+    yaml_front_matter = match.group(1)
+
+    # Load the YAML front matter into a dictionary
+    metadata = load(yaml_front_matter, Loader=Loader)
+    # Hugo only allows certain fields in the front matter, and custom fields
+    # are prefixed with "params."
+    if "params" in metadata:
+        params = metadata.pop("params")
+        metadata.update(params)
+    dates = [
+        _first_date(metadata, keys) for keys in (DATE_KEYS, MODIFIED_KEYS, EXPIRY_KEYS)
+    ]
+    timings["yaml"] = time.perf_counter() - start
+
+    # Extract the title from the YAML front matter or the first heading
+    title = metadata.get("title", None)
+    body, heading = render_markdown(match.group(2), not title, timings)
+
+    return ParsedArticle(
+        path=path,
+        title=title or heading,
+        slug=slug_for_path(path),
+        body=body,
+        date_published=dates[0],
+        description=metadata.get("description", ""),
+        # If this is a draft, set the status appropriately
+        status=Status.WITHHELD if metadata.get("draft", False) else Status.USABLE,
+        date_modified=dates[1],
+        expires=dates[2],
+        tags=[str(tag) for tag in metadata.get("tags", None) or []],
+        content_hash=content_hash,
+        timings=timings,
+    )
+
+
+def parse_markdown_files(paths: T.List[Path]) -> T.List[ParsedArticle]:
+    "Parse several files, to send work to worker processes in chunks."
+    return [parse_markdown_file(path) for path in paths]
@@ -0,0 +1,100 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("commoncontent", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="article",
+            name="excerpt_version",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=16,
+                verbose_name="excerpt version",
+            ),
+        ),
+        migrations.AddField(
+            model_name="article",
+            name="stored_excerpt",
+            field=models.TextField(blank=True, editable=False, verbose_name="excerpt"),
+        ),
+        migrations.AddField(
+            model_name="article",
+            name="stored_has_excerpt",
+            field=models.BooleanField(
+                default=False, editable=False, verbose_name="has excerpt"
+            ),
+        ),
+        migrations.AddField(
+            model_name="homepage",
+            name="excerpt_version",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=16,
+                verbose_name="excerpt version",
+            ),
+        ),
+        migrations.AddField(
+            model_name="homepage",
+            name="stored_excerpt",
+            field=models.TextField(blank=True, editable=False, verbose_name="excerpt"),
+        ),
+        migrations.AddField(
+            model_name="homepage",
+            name="stored_has_excerpt",
+            field=models.BooleanField(
+                default=False, editable=False, verbose_name="has excerpt"
+            ),
+        ),
+        migrations.AddField(
+            model_name="page",
+            name="excerpt_version",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=16,
+                verbose_name="excerpt version",
+            ),
+        ),
+        migrations.AddField(
+            model_name="page",
+            name="stored_excerpt",
+            field=models.TextField(blank=True, editable=False, verbose_name="excerpt"),
+        ),
+        migrations.AddField(
+            model_name="page",
+            name="stored_has_excerpt",
+            field=models.BooleanField(
+                default=False, editable=False, verbose_name="has excerpt"
+            ),
+        ),
+        migrations.AddField(
+            model_name="section",
+            name="excerpt_version",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=16,
+                verbose_name="excerpt version",
+            ),
+        ),
+        migrations.AddField(
+            model_name="section",
+            name="stored_excerpt",
+            field=models.TextField(blank=True, editable=False, verbose_name="excerpt"),
+        ),
+        migrations.AddField(
+            model_name="section",
+            name="stored_has_excerpt",
+            field=models.BooleanField(
+                default=False, editable=False, verbose_name="has excerpt"
+            ),
+        ),
+    ]
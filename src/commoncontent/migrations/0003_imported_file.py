@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("commoncontent", "0002_stored_excerpt"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportedFile",
+            fields=[
+                (
+                    "article",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="imported_file",
+                        serialize=False,
+                        to="commoncontent.article",
+                        verbose_name="article",
+                    ),
+                ),
+                ("path", models.CharField(max_length=1024, verbose_name="path")),
+                (
+                    "content_hash",
+                    models.CharField(
+                        blank=True, max_length=64, verbose_name="content hash"
+                    ),
+                ),
+                (
+                    "date_imported",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="date imported"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "imported file",
+                "verbose_name_plural": "imported files",
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-17 22:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("commoncontent", "0003_imported_file"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="renditions",
+            field=models.JSONField(
+                blank=True, default=dict, editable=False, verbose_name="renditions"
+            ),
+        ),
+    ]
@@ -1,4 +1,6 @@
 import mimetypes
+import typing as T
+from dataclasses import dataclass
 
 from django.apps import apps
 from django.conf import settings
@@ -15,6 +17,7 @@ from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFill, ResizeToFit
 from taggit.managers import TaggableManager
 
+from commoncontent.caching import site_vars
 from commoncontent.common import Status, upload_to
 from commoncontent.schemas import (
     ImageProp,
@@ -282,7 +285,7 @@ class AbstractCreativeWork(models.Model):
         elif self.author:
             return self.author.copyright_holder or self.author.name
         else:
-            return self.site.vars.get_value("copyright_holder", self.site.name)
+            return site_vars(self.site).get_value("copyright_holder", self.site.name)
 
     @property
     def copyright_year(self):
@@ -296,7 +299,7 @@ class AbstractCreativeWork(models.Model):
     @property
     def copyright_notice(self):
         conf = apps.get_app_config("commoncontent")
-        var = self.site.vars
+        var = site_vars(self.site_id)
         if self.custom_copyright_notice:
             return format_html(self.custom_copyright_notice, self.copyright_year)
         elif self.author and self.author.copyright_notice:
@@ -329,7 +332,7 @@ class AbstractCreativeWork(models.Model):
         if self.author:
             schema.author = self.author.schema
         try:
-            tags = list(self.tags.names())
+            tags = self.tag_names
         except ValueError:
             # ValueError: objects need to have a primary key value before you
             # can access their tags.
@@ -338,6 +341,15 @@ class AbstractCreativeWork(models.Model):
             schema.keywords = tags
         return schema
 
+    @property
+    def tag_names(self):
+        """List of the names of the object's tags. Uses the tags loaded by
+        ``prefetch_related("tags")`` if available, rather than querying again."""
+        prefetched = getattr(self, "_prefetched_objects_cache", {})
+        if "tags" in prefetched:
+            return [tag.name for tag in prefetched["tags"]]
+        return list(self.tags.names())
+
     @property
     def opengraph(self) -> OpenGraph:
         """Serialize data to Open Graph metatags.
@@ -360,7 +372,7 @@ class AbstractCreativeWork(models.Model):
             site_name=self.site.name,
             type=self.opengraph_type,
         )
-        og.site_name = self.site.vars.get_value("brand", self.site.name)
+        og.site_name = site_vars(self.site).get_value("brand", self.site.name)
         return og
 
 
@@ -429,6 +441,11 @@ class Image(MediaObject):
     alt_text = models.CharField(_("alt text"), max_length=255, blank=True)
     width = models.PositiveIntegerField(_("width"), blank=True, null=True)
     height = models.PositiveIntegerField(_("height"), blank=True, null=True)
+    # Registry of the rendition files generated for the image, by variant key, with
+    # their storage names and dimensions. See commoncontent.renditions
+    renditions = models.JSONField(
+        _("renditions"), default=dict, blank=True, editable=False
+    )
 
     # ImageSpec fields defining different renditions
     # Small, medium, and social renditions are used in layouts, so they are ResizeToFill
@@ -556,6 +573,20 @@ class CreativeWorkQuerySet(models.QuerySet):
             date_published__lte=timezone.now(),
         )
 
+    def next_transition(self):
+        """Return the earliest future time at which an object in the queryset will go
+        live or expire, or None if nothing is scheduled. Anything displaying ``live()``
+        objects is unchanged by the passage of time until then."""
+        now = timezone.now()
+        result = self.filter(status=Status.USABLE).aggregate(
+            publish=models.Min(
+                "date_published", filter=models.Q(date_published__gt=now)
+            ),
+            expire=models.Min("expires", filter=models.Q(expires__gt=now)),
+        )
+        times = [t for t in result.values() if t is not None]
+        return min(times) if times else None
+
 
 class GenericPageManager(models.Manager):
     def get_queryset(self):
@@ -606,6 +637,15 @@ class BasePage(AbstractCreativeWork):
             "the page, the rest of the layout is inherited from base.html."
         ),
     )
+    # The excerpt is computed from the body when saved, so that lists and feeds do not
+    # parse every body they display. See the `excerpt` property.
+    stored_excerpt = models.TextField(_("excerpt"), blank=True, editable=False)
+    stored_has_excerpt = models.BooleanField(
+        _("has excerpt"), default=False, editable=False
+    )
+    excerpt_version = models.CharField(
+        _("excerpt version"), max_length=16, blank=True, editable=False
+    )
 
     objects = GenericPageManager.from_queryset(CreativeWorkQuerySet)()
 
@@ -614,6 +654,13 @@ class BasePage(AbstractCreativeWork):
         verbose_name = _("page")
         verbose_name_plural = _("pages")
 
+    def save(self, *args, **kwargs):
+        self.update_excerpt()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "body" in update_fields:
+            kwargs["update_fields"] = {*update_fields, *self.EXCERPT_FIELDS}
+        return super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse("generic_page", kwargs={"page_slug": self.slug})
 
@@ -624,23 +671,50 @@ class BasePage(AbstractCreativeWork):
     @property
     def icon_name(self):
         "name of an icon to represent this object"
-        return self.custom_icon or self.site.vars.get_value("default_icon", "file-text")
+        return self.custom_icon or site_vars(self.site_id).get_value(
+            "default_icon", "file-text"
+        )
 
-    @property
-    def excerpt(self):
-        """Rich text excerpt for use in teases and feed content. If no excerpt has
-        been specified, returns the full body text."""
+    EXCERPT_FIELDS = ("stored_excerpt", "stored_has_excerpt", "excerpt_version")
+
+    def compute_excerpt(self) -> str:
+        """Compute the excerpt from the body: the text before the pagebreak separator,
+        truncated to `excerpt_max_words`."""
         config = apps.get_app_config("commoncontent")
         if not self.body:
             return ""
         excerpt = self.body.split(config.pagebreak_separator, maxsplit=1)[0]
         return truncatewords_html(excerpt, config.excerpt_max_words)
 
+    def update_excerpt(self):
+        """Store the excerpt computed with the current settings. Called by `save()`.
+        Call it yourself before `bulk_create()` or `bulk_update()`."""
+        self.stored_excerpt = self.compute_excerpt()
+        self.stored_has_excerpt = self.stored_excerpt != self.body
+        self.excerpt_version = apps.get_app_config("commoncontent").excerpt_version
+
+    def _excerpt_is_current(self) -> bool:
+        # Check for deferred fields first: reading one would cost a query per object
+        if self.get_deferred_fields().intersection(self.EXCERPT_FIELDS):
+            return False
+        conf = apps.get_app_config("commoncontent")
+        return self.excerpt_version == conf.excerpt_version
+
+    @property
+    def excerpt(self):
+        """Rich text excerpt for use in teases and feed content. If no excerpt has
+        been specified, returns the full body text."""
+        if self._excerpt_is_current():
+            return self.stored_excerpt
+        return self.compute_excerpt()
+
     @property
     def has_excerpt(self):
         """True if there is more body text to read after the excerpt. False if
         excerpt == body.
         """
+        if self._excerpt_is_current():
+            return self.stored_has_excerpt
         return not self.excerpt == self.body
 
 
@@ -728,6 +802,25 @@ class ArticleManager(models.Manager):
         )
 
 
+class ArticleQuerySet(CreativeWorkQuerySet):
+    def for_listing(self):
+        """Optimize the queryset for pages and feeds that display many Articles.
+
+        Related objects used when rendering each item (author, the section's share
+        image, tags, and related images) are loaded with the Articles in a fixed number
+        of queries, so the cost of a list page does not grow with its length.
+        """
+        return self.select_related(
+            "author__site", "section__share_image", "share_image__site"
+        ).prefetch_related(
+            "tags",
+            models.Prefetch(
+                "image_set",
+                queryset=Image.objects.select_related("site").order_by("pk"),
+            ),
+        )
+
+
 class Article(BasePage):
     "Articles are the bread and butter of a site. They will appear in feeds."
 
@@ -744,7 +837,7 @@ class Article(BasePage):
     image_set = models.ManyToManyField(Image, verbose_name=_("related images"))
     attachment_set = models.ManyToManyField(Attachment, verbose_name=_("attachments"))
 
-    objects = ArticleManager.from_queryset(CreativeWorkQuerySet)()
+    objects = ArticleManager.from_queryset(ArticleQuerySet)()
 
     # Intentionally not inherting from AbstractCreativeWork's Meta because `ordering`
     # and `order_with_respect_to` are not compatible with each other.
@@ -775,7 +868,9 @@ class Article(BasePage):
     def save(self, *args, **kwargs):
         if not self.id:
             # Django should do the Right Thing setting _order on new instances
-            return super().save(*args, **kwargs)
+            retval = super().save(*args, **kwargs)
+            self._remember_placement()
+            return retval
 
         # When adding a series to an existing article, Django does not set _order,
         # so it has the default 0, which breaks get_next_in_order
@@ -791,6 +886,7 @@ class Article(BasePage):
             # Possible the series has changed, which could cause dupes. This
             # will reset the _order for all articles in the series.
             self.series.set_article_order(self.series.get_article_order())
+        self._remember_placement()
         return retval
 
     def get_absolute_url(self):
@@ -808,6 +904,20 @@ class Article(BasePage):
             kwargs={"article_slug": self.slug, "section_slug": self.section.slug},
         )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_placement()
+        return instance
+
+    def _remember_placement(self):
+        """Remember the section and series the article was saved in, whose pages are
+        also stale if it moves (see ``commoncontent.caching.invalidation_tags``)."""
+        # Read from __dict__ so that deferred fields are not loaded
+        self._saved_placement = {
+            name: self.__dict__.get(name) for name in ("section_id", "series_id")
+        }
+
     schema_type = "Article"
     opengraph_type = "article"
 
@@ -828,7 +938,7 @@ class Article(BasePage):
             og.image = [self.share_image.opengraph]
         if self.author:
             og.author = [self.author.url]
-        tags = list(self.tags.names())
+        tags = self.tag_names
         if tags:
             og.tag = tags
         return og
@@ -843,6 +953,31 @@ class Article(BasePage):
         return f"Part {ids.index(self.id) + 1} of {len(ids)}"
 
 
+class ImportedFile(models.Model):
+    """The source file of an Article created by the ``import_markdown`` command, so
+    that importing the same files again can skip those that have not changed."""
+
+    article = models.OneToOneField(
+        Article,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="imported_file",
+        verbose_name=_("article"),
+    )
+    path = models.CharField(_("path"), max_length=1024)
+    # SHA-256 of the file's contents. Blank if the Article was withdrawn because its
+    # file was deleted, so that it is imported again if the file is restored.
+    content_hash = models.CharField(_("content hash"), max_length=64, blank=True)
+    date_imported = models.DateTimeField(_("date imported"), default=timezone.now)
+
+    class Meta:
+        verbose_name = _("imported file")
+        verbose_name_plural = _("imported files")
+
+    def __str__(self):
+        return self.path
+
+
 #######################################################################
 # Site Menus
 #######################################################################
@@ -912,7 +1047,7 @@ class Link(models.Model):
     @property
     def icon_name(self):
         "name of an icon to represent this object"
-        return self.custom_icon or self.site.vars.get_value(
+        return self.custom_icon or site_vars(self.menu.site_id).get_value(
             "default_icon", "link-45deg"
         )
 
@@ -949,3 +1084,72 @@ class SectionMenu:
         if self.pages:
             menu.extend(self.pages)
         return menu
+
+
+@dataclass(frozen=True)
+class MenuItem:
+    """A link of a ``ResolvedMenu``, with the properties templates use to display
+    menus."""
+
+    url: str
+    title: str
+    icon_name: str
+
+    def get_absolute_url(self):
+        return self.url
+
+
+@dataclass(frozen=True)
+class ResolvedMenu:
+    """A ``Menu`` or ``SectionMenu`` with its links resolved to ``MenuItem`` objects,
+    so that it can be cached and displayed without querying the database.
+    ``dependencies`` are the dependency tags of the content it displays."""
+
+    name: str
+    title: str
+    links: T.Tuple[MenuItem, ...]
+    dependencies: T.FrozenSet[str]
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def lookup(
+        site: Site, slug: str
+    ) -> T.Tuple[T.Union[Menu, SectionMenu, None], T.Set[str]]:
+        """Return the site's menu with the given slug, or None, and the dependency tags
+        of the content it displays. The magic slug "main-nav" falls back to a
+        ``SectionMenu`` if there is no such Menu."""
+        dependencies = {f"site:{site.pk}", f"menus:{site.pk}"}
+        try:
+            menu = Menu.objects.get(site=site, slug=slug)
+            dependencies.add(f"menu:{menu.pk}")
+        except Menu.DoesNotExist:
+            if slug != "main-nav":
+                return None, dependencies
+            menu = SectionMenu(site)
+            dependencies.update((f"sections:{site.pk}", f"homepages:{site.pk}"))
+        return menu, dependencies
+
+    @classmethod
+    def resolve(cls, site: Site, slug: str) -> T.Optional["ResolvedMenu"]:
+        """Resolve the site's menu with the given slug (see ``lookup``)."""
+        menu, dependencies = cls.lookup(site, slug)
+        if menu is None:
+            return None
+        if isinstance(menu, Menu):
+            name = menu.admin_name
+        else:
+            name = f"SectionMenu for {site.domain}"
+
+        links = tuple(
+            MenuItem(
+                url=item.get_absolute_url()
+                if hasattr(item, "get_absolute_url")
+                else item.url,
+                title=item.title,
+                icon_name=item.icon_name,
+            )
+            for item in menu.links
+        )
+        return cls(name, menu.title, links, frozenset(dependencies))
@@ -0,0 +1,159 @@
+"""
+Keyset pagination for article lists.
+
+Django's ``Paginator`` fetches page N with ``OFFSET (N - 1) * per_page`` and needs a
+``COUNT`` of the whole list, so deep archive pages get slower as the archive grows.
+``KeysetPaginator`` instead fetches the articles published before a *cursor*, the
+``(date_published, id)`` of the last article on the previous page, so every page costs
+the same as the first.
+
+A cursor is written in URLs as ``<microseconds since the epoch>-<id>``, e.g.
+``page_1700000000000000-42.html``. A cursor URL always shows the same articles, however
+many newer ones are published.
+"""
+
+import typing as T
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.timezone import is_naive, make_naive
+
+CURSOR_PATTERN = r"\d+-\d+"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class KeysetCursorConverter:
+    "URL path converter for keyset pagination cursors"
+
+    regex = CURSOR_PATTERN
+
+    def to_python(self, value):
+        return value
+
+    def to_url(self, value):
+        return value
+
+
+def make_cursor(date_published: datetime, pk: int) -> str:
+    if is_naive(date_published):
+        # USE_TZ = False. Treat the time as UTC, as parse_cursor() does.
+        date_published = date_published.replace(tzinfo=timezone.utc)
+    delta = date_published - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return f"{micros}-{pk}"
+
+
+def parse_cursor(cursor: str) -> T.Tuple[datetime, int]:
+    """Return the ``(date_published, id)`` of a cursor. Raises ValueError if the cursor
+    is malformed."""
+    micros, _, pk = cursor.partition("-")
+    seconds, micros = divmod(int(micros), 1_000_000)
+    try:
+        date = datetime.fromtimestamp(seconds, tz=timezone.utc)
+    except (OverflowError, OSError) as e:
+        raise ValueError(f"Cursor {cursor} is out of range") from e
+    date = date.replace(microsecond=micros)
+    if not settings.USE_TZ:
+        date = make_naive(date, timezone.utc)
+    return date, int(pk)
+
+
+class KeysetPage:
+    """A page of a ``KeysetPaginator``. Supports the parts of Django's ``Page`` that do
+    not depend on the page number."""
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor, is_first):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        # None means the previous page is the first page
+        self.previous_cursor = previous_cursor
+        self.is_first = is_first
+
+    def __repr__(self):
+        return f"<KeysetPage after {self.previous_cursor or 'first page'}>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return not self.is_first
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate a queryset of articles newest first by ``(date_published, id)``.
+
+    ``count`` is optional. If given (it may be approximate), ``count`` and
+    ``num_pages`` are available to templates, otherwise both are None.
+    """
+
+    keyset = True
+    ordering = ("-date_published", "-pk")
+
+    def __init__(self, object_list, per_page, count=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.count = count
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, -(-self.count // self.per_page))
+
+    def page(self, cursor: T.Optional[str] = None) -> KeysetPage:
+        """Return the page of articles published before ``cursor``, or the first page.
+        Raises ValueError if the cursor is malformed."""
+        queryset = self.object_list.order_by(*self.ordering)
+        keys = self.object_list.select_related(None).prefetch_related(None)
+        if cursor is None:
+            items = list(queryset[: self.per_page + 1])
+            newer = []
+        else:
+            date, pk = parse_cursor(cursor)
+            items = list(
+                queryset.filter(
+                    Q(date_published__lt=date) | Q(date_published=date, pk__lt=pk)
+                )[: self.per_page + 1]
+            )
+            # The first key of the previous page is the last one of the page before it
+            newer = list(
+                keys.filter(
+                    Q(date_published__gt=date) | Q(date_published=date, pk__gte=pk)
+                )
+                .order_by("date_published", "pk")
+                .values_list("date_published", "pk")[: self.per_page + 1]
+            )
+
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[: self.per_page]
+            next_cursor = make_cursor(items[-1].date_published, items[-1].pk)
+        previous_cursor = None
+        if len(newer) > self.per_page:
+            previous_cursor = make_cursor(*newer[-1])
+
+        return KeysetPage(items, self, next_cursor, previous_cursor, cursor is None)
+
+    def cursors(self) -> T.Iterator[str]:
+        """Yield the cursor of every page after the first, for generating all the
+        pages of the list. Reads only the keys, with a single query."""
+        keys = self.object_list.select_related(None).prefetch_related(None)
+        keys = keys.order_by(*self.ordering).values_list("date_published", "pk")
+        previous = None
+        for index, key in enumerate(keys.iterator(chunk_size=2000)):
+            if previous is not None:
+                yield make_cursor(*previous)
+                previous = None
+            if index % self.per_page == self.per_page - 1:
+                previous = key
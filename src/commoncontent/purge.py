@@ -0,0 +1,127 @@
+"""
+Purge backends tell a CDN (or any cache in front of the site) which pages are stale when
+content changes.
+
+With ``COMMONCONTENT_CACHE_TAG_HEADER`` set, every page names the content it displays in
+that header, using the dependency tags of ``commoncontent.caching`` (``article:12``,
+``section:3``, ``site:1``...). When content is saved or deleted, the tags it affects are
+passed to the purge backend once the transaction commits, so the CDN can drop exactly
+the pages that displayed it. Backends that call a remote API do so in a background
+thread, so saving content does not wait for the CDN. Configure a backend like Django's
+caches:
+
+    COMMONCONTENT_PURGE_BACKEND = {
+        "BACKEND": "commoncontent.purge.HTTPPurgeBackend",
+        "OPTIONS": {"url": "https://cdn.example.com/purge"},
+    }
+"""
+
+import json
+import logging
+import typing as T
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.apps import apps
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class BasePurgeBackend:
+    """Base class for purge backends. The ``OPTIONS`` of the backend's configuration
+    are passed to the constructor as keyword arguments. Backends with ``background``
+    set purge in a thread of the current process, one purge at a time, in order."""
+
+    background = False
+
+    def __init__(self, **options):
+        self.options = options
+
+    def purge(self, tags: T.Collection[str]):
+        "Purge every cached page that carries any of ``tags``."
+        raise NotImplementedError
+
+
+class FilePurgeBackend(BasePurgeBackend):
+    """Append each purge to a file, as a line with a JSON list of tags. A stand-in for a
+    CDN in development and tests."""
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = Path(path)
+
+    def purge(self, tags):
+        with self.path.open("a") as f:
+            f.write(json.dumps(sorted(tags)) + "\n")
+
+
+class HTTPPurgeBackend(BasePurgeBackend):
+    """POST the tags to a URL as JSON, ``{"tags": [...]}``, the shape most CDN purge
+    APIs accept. Use ``headers`` for authentication, and override ``request`` for APIs
+    that expect something else. Requests are sent in the background unless
+    ``background`` is False."""
+
+    def __init__(self, url, headers=None, timeout=10, background=True, **options):
+        super().__init__(**options)
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.background = background
+
+    def request(self, tags) -> urllib.request.Request:
+        return urllib.request.Request(
+            self.url,
+            data=json.dumps({"tags": sorted(tags)}).encode(),
+            headers={"Content-Type": "application/json", **self.headers},
+            method="POST",
+        )
+
+    def purge(self, tags):
+        with urllib.request.urlopen(self.request(tags), timeout=self.timeout) as resp:
+            resp.read()
+
+
+def get_purge_backend() -> T.Optional[BasePurgeBackend]:
+    """Return the configured purge backend, or None."""
+    conf = apps.get_app_config("commoncontent")
+    config = conf.purge_backend
+    if not config:
+        return None
+    backend = import_string(config["BACKEND"])
+    return backend(**config.get("OPTIONS", {}))
+
+
+_executor: T.Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        # A single worker keeps purges in the order the changes were committed
+        _executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="commoncontent-purge"
+        )
+    return _executor
+
+
+def _purge_logged(backend: BasePurgeBackend, tags: T.Set[str]):
+    try:
+        backend.purge(tags)
+    except Exception:
+        logger.exception("Could not purge cache tags %s", ", ".join(sorted(tags)))
+
+
+def purge_tags(tags: T.Iterable[str]):
+    """Purge pages carrying ``tags`` with the configured backend, if any. Errors are
+    logged, not raised, so that editing content does not fail when the CDN does."""
+    tags = set(tags)
+    backend = get_purge_backend()
+    if not tags or backend is None:
+        return
+    if backend.background:
+        # Pending purges are completed before the process exits
+        _get_executor().submit(_purge_logged, backend, tags)
+    else:
+        _purge_logged(backend, tags)
@@ -0,0 +1,371 @@
+"""
+Eager generation of Image renditions.
+
+django-imagekit generates a rendition the first time its URL or size is read, so the
+first visitor to a page with a new image waits while Pillow resizes it. Instead, when an
+Image file is uploaded, the renditions the site uses (``COMMONCONTENT_RENDITIONS``) are
+passed to the rendition backend once the transaction commits, to be generated outside
+the request.
+
+Each rendition also has responsive variants, for the ``responsive_image`` template tag:
+the rendition scaled down for small screens, in JPEG and in the modern formats of
+``COMMONCONTENT_RESPONSIVE_FORMATS`` (WebP and AVIF, where Pillow supports them). They
+are generated along with the rendition, and the tag only lists those generated.
+
+Not every image needs every rendition: the rendition policy chooses which to generate
+for each image (see ``orientation_policy``). The files generated are recorded in
+``Image.renditions``, a registry of their storage names and dimensions keyed by
+``variant_key``, so that pages resolve their URLs and sizes with ``rendition_file``
+without asking the storage whether they exist or opening them, which on cloud storage
+would be a network request per image. Renditions that were not generated in advance are
+still generated on first use, by imagekit.
+
+Configure a backend like Django's caches:
+
+    COMMONCONTENT_RENDITION_BACKEND = {
+        "BACKEND": "commoncontent.renditions.ThreadRenditionBackend",
+        "OPTIONS": {"max_workers": 2},
+    }
+
+The default ``ThreadRenditionBackend`` generates renditions in a pool of threads of the
+web process. To use a task queue, subclass ``BaseRenditionBackend`` and have ``enqueue``
+send the ids of the Images to a task that calls ``generate_image_renditions``.
+
+The ``generate_renditions`` management command generates the renditions of existing
+Images, in a pool of processes. Models are loaded from the app registry rather than
+imported, so that worker processes can import this module before Django is set up.
+"""
+
+import copy
+import functools
+import logging
+import typing as T
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.db import connections
+from django.utils.module_loading import import_string
+from PIL import features
+from pilkit.processors import Resize, ResizeToFill, ResizeToFit
+
+logger = logging.getLogger(__name__)
+
+
+# Widths of the variants listed in a responsive image's srcset, relative to the rendition
+SRCSET_SCALES = (0.5, 1)
+MIME_TYPES = {"AVIF": "image/avif", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+######################################################################################
+# Renditions and their variants
+######################################################################################
+@functools.lru_cache(maxsize=None)
+def _can_encode(format: str) -> bool:
+    return features.check(format.lower())
+
+
+def responsive_formats() -> T.List[str]:
+    """The formats of the ``<source>`` elements of responsive images, best first: those
+    of ``COMMONCONTENT_RESPONSIVE_FORMATS`` that Pillow can encode."""
+    conf = apps.get_app_config("commoncontent")
+    return [format for format in conf.responsive_formats if _can_encode(format)]
+
+
+def _scaled(processor, scale: float):
+    if scale == 1:
+        return processor
+    processor = copy.copy(processor)
+    for attr in ("width", "height"):
+        if getattr(processor, attr, None):
+            setattr(processor, attr, max(1, round(getattr(processor, attr) * scale)))
+    return processor
+
+
+def rendition_variant(image, name: str, scale: float = 1, format: str = None):
+    """Return the imagekit file of a variant of the rendition ``name`` of an Image,
+    scaled by ``scale`` and encoded in ``format`` (a Pillow format like "WEBP"). With
+    the defaults, the rendition itself."""
+    if scale == 1 and format is None:
+        return getattr(image, name)
+    from imagekit.cachefiles import ImageCacheFile
+
+    spec = getattr(type(image), name).get_spec(source=image.image_file)
+    spec.processors = [_scaled(processor, scale) for processor in spec.processors]
+    if format is not None:
+        spec.format = format
+    return ImageCacheFile(spec)
+
+
+def rendition_variants(name: str) -> T.List[T.Tuple[float, T.Optional[str]]]:
+    """The (scale, format) of each responsive variant of a rendition, other than the
+    rendition itself. A format of None is the rendition's own."""
+    formats = [None, *responsive_formats()]
+    return [
+        (scale, format)
+        for format in formats
+        for scale in SRCSET_SCALES
+        if (scale, format) != (1, None)
+    ]
+
+
+def variant_key(name: str, scale: float = 1, format: T.Optional[str] = None) -> str:
+    """The key of a variant of a rendition in the ``Image.renditions`` registry, e.g.
+    "medium", "medium@0.5x" or "medium@0.5x.webp"."""
+    key = name if scale == 1 else f"{name}@{scale:g}x"
+    return key if format is None else f"{key}.{format.lower()}"
+
+
+class RenditionFile(T.NamedTuple):
+    url: str
+    width: int
+    height: int
+
+
+def registered_file(
+    image, name: str, scale: float = 1, format: T.Optional[str] = None
+) -> T.Optional[RenditionFile]:
+    """The URL and dimensions of a variant of the rendition ``name`` of an Image (see
+    ``rendition_variant``) from the ``Image.renditions`` registry, without storage I/O.
+    None if the variant was not generated in advance."""
+    entry = image.renditions.get(variant_key(name, scale, format))
+    if not entry:
+        return None
+    from imagekit.utils import get_storage
+
+    return RenditionFile(
+        get_storage().url(entry["name"]), entry["width"], entry["height"]
+    )
+
+
+def rendition_file(
+    image, name: str, scale: float = 1, format: T.Optional[str] = None
+) -> RenditionFile:
+    """Like ``registered_file``, but for variants not in the registry, from imagekit,
+    which generates the file during the request if needed."""
+    if registered := registered_file(image, name, scale, format):
+        return registered
+    file = rendition_variant(image, name, scale, format)
+    width, height = rendition_size(image, name, scale) or (file.width, file.height)
+    return RenditionFile(file.url, width, height)
+
+
+def _resized(
+    processors, size: T.Optional[T.Tuple[int, int]]
+) -> T.Optional[T.Tuple[int, int]]:
+    """The size of an image of ``size`` once processed by ``processors``, or None if it
+    cannot be known without processing the image. Processors that crop or pad to a
+    fixed size need no ``size``."""
+    for processor in processors:
+        fixed = getattr(processor, "width", None) and getattr(processor, "height", None)
+        if isinstance(processor, (Resize, ResizeToFill)):
+            if not (fixed and processor.upscale):
+                return None
+            size = (processor.width, processor.height)
+        elif isinstance(processor, ResizeToFit) and processor.mat_color is not None:
+            if not fixed:
+                return None
+            # The resized image is pasted on a canvas of the given size
+            size = (processor.width, processor.height)
+        elif isinstance(processor, ResizeToFit) and size:
+            width, height = size
+            if fixed:
+                ratio = min(processor.width / width, processor.height / height)
+            elif processor.width:
+                ratio = processor.width / width
+            else:
+                ratio = processor.height / height
+            new_size = (round(width * ratio), round(height * ratio))
+            # Like pilkit's Resize processor, only enlarge images if upscale is set
+            if processor.upscale or (new_size[0] < width and new_size[1] < height):
+                size = new_size
+        else:
+            return None
+    return size
+
+
+def rendition_size(image, name: str, scale: float = 1) -> T.Optional[T.Tuple[int, int]]:
+    """The width and height of the rendition ``name`` of an Image, scaled by ``scale``,
+    without opening any file: fixed by the rendition's processors, like ResizeToFill,
+    or computed from ``Image.width`` and ``Image.height``. None if unknown, e.g. for
+    renditions with custom processors."""
+    size = (image.width, image.height) if image.width and image.height else None
+    processors = getattr(type(image), name).get_spec(source=image.image_file).processors
+    return _resized([_scaled(p, scale) for p in processors], size)
+
+
+######################################################################################
+# Rendition policy
+######################################################################################
+def is_portrait_rendition(name: str) -> bool:
+    return name.startswith("portrait_")
+
+
+def orientation_policy(image, names: T.Sequence[str]) -> T.List[str]:
+    """The default rendition policy: the renditions of ``names`` to generate for an
+    Image. Portrait renditions (``portrait_*``) crop landscape images badly, so they are
+    only generated for portrait images, and for images used as an Author's profile
+    image, which the author templates display in portrait renditions. The other
+    renditions are generated for every image, as article templates use them whatever
+    the orientation."""
+    if image.is_portrait:
+        return list(names)
+    Author = apps.get_model("commoncontent", "Author")
+    if Author.objects.filter(profile_image=image).exists():
+        return list(names)
+    return [name for name in names if not is_portrait_rendition(name)]
+
+
+def rendition_names(image) -> T.List[str]:
+    """The names of the renditions to generate for an Image, chosen by the rendition
+    policy among ``COMMONCONTENT_RENDITIONS``."""
+    conf = apps.get_app_config("commoncontent")
+    return import_string(conf.rendition_policy)(image, conf.renditions)
+
+
+def generate_renditions(
+    image, names: T.Optional[T.Iterable[str]] = None, force=False
+) -> int:
+    """Generate the renditions ``names`` of an Image and their responsive variants, by
+    default those chosen by the rendition policy, unless they already exist or
+    ``force``. Records them in the ``Image.renditions`` registry. Returns the number of
+    files generated."""
+    if not image.image_file:
+        return 0
+    names = rendition_names(image) if names is None else list(names)
+    generated = 0
+    registry = dict(image.renditions)
+    for name in names:
+        for scale, format in [(1, None), *rendition_variants(name)]:
+            file = rendition_variant(image, name, scale, format)
+            # Generate here, whichever imagekit backend would otherwise generate it
+            backend = file.cachefile_backend
+            if force or not backend.exists(file):
+                backend.generate_now(file, force=True)
+                generated += 1
+            width, height = rendition_size(image, name, scale) or (
+                file.width,
+                file.height,
+            )
+            registry[variant_key(name, scale, format)] = {
+                "name": file.name,
+                "width": width,
+                "height": height,
+            }
+    if registry != image.renditions:
+        # Imported here because signals imports this module
+        from commoncontent.signals import tags_changed
+
+        # Not save(), which would invalidate the pages of the Articles using the Image.
+        # Only the pages displaying it list its new variants, in the page cache and CDN.
+        type(image).objects.filter(pk=image.pk).update(renditions=registry)
+        image.renditions = registry
+        tags_changed([f"image:{image.pk}"])
+    return generated
+
+
+def generate_image_renditions(
+    pks: T.Iterable[int], names: T.Optional[T.Iterable[str]] = None, force=False
+) -> int:
+    """Generate the renditions of the Images with primary keys ``pks``. For task queues
+    and worker processes. Errors are logged, so that one broken file does not stop the
+    others. Returns the number of files generated."""
+    Image = apps.get_model("commoncontent", "Image")
+    generated = 0
+    for image in Image.objects.filter(pk__in=pks).only(
+        "image_file", "width", "height", "renditions"
+    ):
+        try:
+            generated += generate_renditions(image, names, force)
+        except Exception:
+            logger.exception(
+                "Could not generate the renditions of %s", image.image_file
+            )
+    return generated
+
+
+######################################################################################
+# Rendition backends
+######################################################################################
+class BaseRenditionBackend:
+    """Base class for rendition backends. The ``OPTIONS`` of the backend's configuration
+    are passed to the constructor as keyword arguments."""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def enqueue(self, images: T.Collection):
+        "Arrange for the renditions of ``images``, Image instances, to be generated."
+        raise NotImplementedError
+
+
+class SyncRenditionBackend(BaseRenditionBackend):
+    """Generate renditions immediately, in the process that saved the Image. Uploads
+    take longer, but pages never wait for renditions."""
+
+    def enqueue(self, images):
+        for image in images:
+            _generate_logged(image)
+
+
+class ThreadRenditionBackend(BaseRenditionBackend):
+    """Generate renditions in a pool of ``max_workers`` threads of the current process.
+    A stand-in for a task queue: renditions pending when the process exits are
+    generated on first use instead."""
+
+    def __init__(self, max_workers=2, **options):
+        super().__init__(**options)
+        self.max_workers = max_workers
+        # Threads are started as work is submitted
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="commoncontent-renditions"
+        )
+
+    def enqueue(self, images):
+        for image in images:
+            # Workers load their own copy, not to share the instance with the request
+            self.executor.submit(_generate_in_thread, image.pk)
+
+
+def _generate_logged(image):
+    try:
+        generate_renditions(image)
+    except Exception:
+        logger.exception("Could not generate the renditions of %s", image.image_file)
+
+
+def _generate_in_thread(pk: int):
+    try:
+        generate_image_renditions([pk])
+    finally:
+        # Close the thread's database connections, if the storage or cache opened any
+        connections.close_all()
+
+
+# The configuration of the backend last built, and the backend
+_backend: T.Optional[T.Tuple[dict, BaseRenditionBackend]] = None
+
+
+def get_rendition_backend() -> T.Optional[BaseRenditionBackend]:
+    """Return the configured rendition backend, or None. The backend is built once,
+    and again when its configuration changes."""
+    global _backend
+    conf = apps.get_app_config("commoncontent")
+    config = conf.rendition_backend
+    if not config:
+        return None
+    if _backend is None or _backend[0] != config:
+        backend = import_string(config["BACKEND"])
+        _backend = (copy.deepcopy(config), backend(**config.get("OPTIONS", {})))
+    return _backend[1]
+
+
+def enqueue_renditions(images: T.Collection):
+    """Pass ``images`` to the configured rendition backend, if any. Errors are logged,
+    not raised, so that uploads do not fail when the backend does."""
+    backend = get_rendition_backend()
+    if not images or backend is None:
+        return
+    try:
+        backend.enqueue(images)
+    except Exception:
+        logger.exception("Could not enqueue the renditions of %d images", len(images))
@@ -4,13 +4,15 @@ Schema.org and Open Graph <https://ogp.me/>.
 """
 
 import dataclasses
+import html
+import json
 import typing as T
 import urllib.parse
 from datetime import date
 from enum import Enum
 
 from django.db import models
-from django.utils.html import escape, format_html, json_script, mark_safe, strip_tags
+from django.utils.html import mark_safe, strip_tags
 
 from commoncontent.common import Status
 
@@ -24,10 +26,73 @@ def validate_http_url(value):
     return value
 
 
+@dataclasses.dataclass(frozen=True)
+class HeadMetadata:
+    """The Open Graph and schema.org metadata of an object, rendered for the ``<head>``
+    of its page. Rendering is costly, so it is done once and the result cached."""
+
+    title: str = ""
+    description: str = ""
+    opengraph: str = ""
+    schema: str = ""
+
+    @classmethod
+    def render(cls, obj) -> "HeadMetadata":
+        og = getattr(obj, "opengraph", None)
+        schema = getattr(obj, "schema", None)
+        return cls(
+            title=getattr(og, "title", None) or "",
+            description=getattr(og, "description", None) or "",
+            opengraph=mark_safe(str(og)) if og is not None else "",
+            schema=mark_safe(str(schema)) if schema is not None else "",
+        )
+
+
+########################################################################################
+# Serialization helpers
+########################################################################################
+# Serialization runs for every object on every page, so these avoid the overhead of
+# Django's lazy-aware escape(), format_html() and json_script(), with the same output.
+_json_script_escapes = {ord(">"): "\\u003E", ord("<"): "\\u003C", ord("&"): "\\u0026"}
+
+
+def _escape(value) -> str:
+    "Same as ``django.utils.html.conditional_escape``"
+    if hasattr(value, "__html__"):
+        return value.__html__()
+    return html.escape(str(value))
+
+
+def _strip_and_escape(value) -> str:
+    "Same as ``escape(strip_tags(value))``"
+    value = str(value)
+    if "<" in value and ">" in value:
+        value = strip_tags(value)
+    return html.escape(value)
+
+
+metatag = '<meta property="{}:{}" content="{}" />\n'
+
+
+def _metatag(parts: T.List[str], prefix: str, name: str, content):
+    "Append a meta tag to ``parts``. Same as ``format_html(metatag, ...)``"
+    parts.append(metatag.format(_escape(prefix), _escape(name), _escape(content)))
+
+
 ########################################################################################
 # Schema.org objects
 ########################################################################################
 class SchemaBase:
+    @classmethod
+    def _field_names(cls) -> T.Tuple[str, ...]:
+        """The names of the dataclass's fields, computed once per class, as
+        ``dataclasses.fields()`` is slow."""
+        names = cls.__dict__.get("_field_names_cache")
+        if names is None:
+            names = tuple(field.name for field in dataclasses.fields(cls))
+            cls._field_names_cache = names
+        return names
+
     def asdict(self):
         return {k: v for k, v in self.items() if v is not None}
 
@@ -35,19 +100,20 @@ class SchemaBase:
         """Yield the name and value of each field in the dataclass (similar to the dict
         method).
         """
-        for field in dataclasses.fields(self):
-            yield field.name, getattr(self, field.name)
+        for name in self._field_names():
+            yield name, getattr(self, name)
 
     def safe_dict(self):
         """Return a dictionary of the object's fields with HTML escaped values."""
         items = {}
-        for k, v in self.items():
+        for k in self._field_names():
+            v = getattr(self, k)
             if v is None:
                 continue
             if isinstance(v, SchemaBase):
                 items[k] = v.safe_dict()
             else:
-                items[k] = escape(strip_tags(v))
+                items[k] = _strip_and_escape(v)
         items["@context"] = "https://schema.org"
         items["@type"] = self._label
         return items
@@ -73,9 +139,11 @@ class ThingSchema(SchemaBase):
         cls._registry[subclass._label] = subclass
 
     def __str__(self):
-        schema = super().safe_dict()
-        out = json_script(schema, element_id="schema-data")
-        return mark_safe(out.replace("application/json", "application/ld+json"))
+        # Same as json_script(), but with the JSON-LD type
+        data = json.dumps(self.safe_dict()).translate(_json_script_escapes)
+        return mark_safe(
+            f'<script id="schema-data" type="application/ld+json">{data}</script>'
+        )
 
     def __init_subclass__(cls):
         ThingSchema._register(cls)
@@ -184,9 +252,6 @@ class PersonSchema(ThingSchema):
 ########################################################################################
 # Open Graph objects
 ########################################################################################
-metatag = '<meta property="{}:{}" content="{}" />\n'
-
-
 class OGGender(Enum):
     "Gender as defined at ogp.me. Sorry non-binary folks, FB hates you."
 
@@ -210,15 +275,20 @@ class StructuredProperty(SchemaBase):
             self.secure_url = validate_http_url(self.secure_url)
 
     def __str__(self):
+        parts = []
+        self._write_meta(parts)
+        return mark_safe("".join(parts))
+
+    def _write_meta(self, parts: T.List[str]):
         if not self._prefix:
-            return ""
-        val = format_html(metatag, "og", self._prefix, self.url)
-        for attr, content in self.items():
+            return
+        _metatag(parts, "og", self._prefix, self.url)
+        prefix = f"og:{self._prefix}"
+        for attr in self._field_names():
             if attr == "url":
                 continue
-            if content:
-                val += format_html(metatag, f"og:{self._prefix}", attr, content)
-        return val
+            if content := getattr(self, attr):
+                _metatag(parts, prefix, attr, content)
 
     def get_absolute_url(self):
         return self.url.path
@@ -270,23 +340,39 @@ class OpenGraph(SchemaBase):
             self.image = [self.image]
 
     def __str__(self):
+        # Each class writes its own tags to a list of parts, joined once at the end
+        parts = []
+        self._write_meta(parts)
+        return mark_safe("".join(parts))
+
+    def _write_meta(self, parts: T.List[str]):
         # Subclasses with attrs will use a separate namespace for them, so here we ONLY
         # want to output what's implemented in this class.
-        basic_attrs = "description determiner locale site_name title type".split()
-        val = format_html(metatag, "og", "url", self.url)
-        for attr, content in self.items():
+        basic_attrs = (
+            "description",
+            "determiner",
+            "locale",
+            "site_name",
+            "title",
+            "type",
+        )
+        _metatag(parts, "og", "url", self.url)
+        for attr in self._field_names():
+            content = getattr(self, attr)
             if attr == "url" or content is None:
                 continue
             elif attr in ("audio", "image", "video"):
                 # These are lists of StructuredProps
                 for item in content:
-                    val += str(item)
+                    if isinstance(item, StructuredProperty):
+                        item._write_meta(parts)
+                    else:
+                        parts.append(_escape(item))
             elif attr == "locale_alternate":
                 for locale in content:
-                    val += format_html(metatag, "og", attr, locale)
+                    _metatag(parts, "og", attr, locale)
             elif content and attr in basic_attrs:
-                val += format_html(metatag, "og", attr, content)
-        return val
+                _metatag(parts, "og", attr, content)
 
 
 @dataclasses.dataclass
@@ -315,19 +401,24 @@ class OGArticle(OpenGraph):
             if isinstance(val, date):
                 setattr(self, f, val.isoformat())
 
-    def __str__(self):
-        val = super().__str__()
+    def _write_meta(self, parts: T.List[str]):
+        super()._write_meta(parts)
         prefix = "article"
-        article_props = "published_time modified_time expiration_time section".split()
-        for attr, content in self.items():
+        article_props = (
+            "published_time",
+            "modified_time",
+            "expiration_time",
+            "section",
+        )
+        for attr in self._field_names():
+            content = getattr(self, attr)
             if content is None:
                 continue
             elif attr in article_props:
-                val += format_html(metatag, prefix, attr, content)
+                _metatag(parts, prefix, attr, content)
             elif attr in ("author", "tag"):
                 for tag in content:
-                    val += format_html(metatag, prefix, attr, tag)
-        return val
+                    _metatag(parts, prefix, attr, tag)
 
 
 @dataclasses.dataclass
@@ -353,19 +444,19 @@ class OGBook(OpenGraph):
         if self.release_date and isinstance(self.release_date, date):
             self.release_date = self.release_date.isoformat()
 
-    def __str__(self):
-        val = super().__str__()
+    def _write_meta(self, parts: T.List[str]):
+        super()._write_meta(parts)
         prefix = "book"
-        book_props = "author isbn release_date".split()
-        for attr, content in self.items():
+        book_props = ("author", "isbn", "release_date")
+        for attr in self._field_names():
+            content = getattr(self, attr)
             if content is None:
                 continue
             elif attr in book_props:
-                val += format_html(metatag, prefix, attr, content)
+                _metatag(parts, prefix, attr, content)
             elif attr in ("author", "tag"):
                 for tag in content:
-                    val += format_html(metatag, prefix, attr, tag)
-        return val
+                    _metatag(parts, prefix, attr, tag)
 
 
 # @dataclasses.dataclass
@@ -440,13 +531,13 @@ class OGProfile(OpenGraph):
         # Force the type to profile
         self.type = "profile"
 
-    def __str__(self):
-        val = super().__str__()
-        profile_props = "first_name last_name username gender".split()
-        for attr, content in self.items():
+    def _write_meta(self, parts: T.List[str]):
+        super()._write_meta(parts)
+        profile_props = ("first_name", "last_name", "username", "gender")
+        for attr in self._field_names():
+            content = getattr(self, attr)
             if content and attr in profile_props:
-                val += format_html(metatag, "profile", attr, content)
-        return val
+                _metatag(parts, "profile", attr, content)
 
 
 # Omitting the music category of objects for now.
@@ -0,0 +1,122 @@
+"""
+Signal handlers that invalidate cached pages and SiteVars when the content they display
+changes, purge changed pages from a CDN, scope SiteVars snapshots to requests, and
+generate the renditions of uploaded images. Connected by ``CommonContentConfig.ready()``.
+"""
+
+from django.contrib.sites.models import Site
+from django.core.signals import request_finished, request_started
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from imagekit.signals import source_saved
+from sitevars.models import SiteVar
+from taggit.models import TaggedItem
+
+from commoncontent.caching import (
+    begin_request,
+    end_request,
+    forget_site_vars,
+    invalidate_tags,
+    invalidation_tags,
+)
+from commoncontent.purge import purge_tags
+from commoncontent.models import (
+    Article,
+    ArticleSeries,
+    Author,
+    HomePage,
+    Image,
+    Link,
+    Menu,
+    Page,
+    Section,
+)
+from commoncontent.renditions import enqueue_renditions, is_portrait_rendition
+
+CONTENT_MODELS = (
+    Article,
+    ArticleSeries,
+    Author,
+    HomePage,
+    Image,
+    Link,
+    Menu,
+    Page,
+    Section,
+    Site,
+    SiteVar,
+)
+
+
+def content_changed(sender, instance, **kwargs):
+    tags_changed(invalidation_tags(instance))
+
+
+def tags_changed(tags):
+    """Invalidate the pages that depend on ``tags``, now and when the transaction
+    commits, and purge them from the CDN. For changes that send no signals, such as
+    ``bulk_create()``."""
+    invalidate_tags(tags)
+    # A concurrent request may cache the old content before this transaction commits,
+    # so invalidate again once the change is visible to other connections.
+    transaction.on_commit(lambda: invalidate_tags(tags))
+    transaction.on_commit(lambda: purge_tags(tags))
+
+
+def sitevars_changed(sender, instance, **kwargs):
+    site_id = instance.site_id
+    forget_site_vars(site_id)
+    transaction.on_commit(lambda: forget_site_vars(site_id))
+
+
+def relations_changed(sender, instance, action, **kwargs):
+    "Changes to an Article's tags or images do not trigger post_save."
+    if action in ("post_add", "post_remove", "post_clear") and isinstance(
+        instance, CONTENT_MODELS
+    ):
+        content_changed(sender, instance)
+
+
+def image_file_saved(sender, source, **kwargs):
+    """imagekit sends ``source_saved`` when an image file changes, once for each of its
+    renditions. Enqueue the Image's renditions once, when the transaction commits."""
+    image = source.instance
+    if not isinstance(image, Image) or getattr(image, "_renditions_pending", False):
+        return
+    image._renditions_pending = True
+    # The renditions of the previous file, if any, are out of date
+    if image.renditions:
+        image.renditions = {}
+        Image.objects.filter(pk=image.pk).update(renditions={})
+
+    def enqueue():
+        image._renditions_pending = False
+        enqueue_renditions([image])
+
+    transaction.on_commit(enqueue)
+
+
+def author_saved(sender, instance, **kwargs):
+    """Profile images are displayed in portrait renditions, which landscape images only
+    get once they are used as one (see ``commoncontent.renditions``)."""
+    image = instance.profile_image
+    if image is not None and not any(map(is_portrait_rendition, image.renditions)):
+        transaction.on_commit(lambda: enqueue_renditions([image]))
+
+
+for model in CONTENT_MODELS:
+    post_save.connect(content_changed, sender=model, dispatch_uid="commoncontent")
+    post_delete.connect(content_changed, sender=model, dispatch_uid="commoncontent")
+
+for through in (Article.image_set.through, Article.attachment_set.through, TaggedItem):
+    m2m_changed.connect(relations_changed, sender=through, dispatch_uid="commoncontent")
+
+# The dispatch_uid must differ from content_changed's for the same sender
+for signal in (post_save, post_delete):
+    signal.connect(sitevars_changed, sender=SiteVar, dispatch_uid="commoncontent.vars")
+
+source_saved.connect(image_file_saved, dispatch_uid="commoncontent")
+post_save.connect(author_saved, sender=Author, dispatch_uid="commoncontent.renditions")
+
+request_started.connect(begin_request, dispatch_uid="commoncontent")
+request_finished.connect(end_request, dispatch_uid="commoncontent")
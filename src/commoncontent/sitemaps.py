@@ -1,14 +1,102 @@
+"""
+Sitemaps of the site's public pages.
+
+``sitemap_index`` lists one sitemap per type of page, and one per month of Articles, so
+that no sitemap grows with the size of the archive. Each sitemap is streamed as it is
+read from the database, reading only the fields its URLs need, and builds the URLs from
+a template rather than calling ``reverse()`` for every item. Months with more Articles
+than a sitemap may hold are split into pages.
+
+The last modification time of a page is its ``date_modified``, or ``date_published`` if
+it was never modified. Sections and the home page list Articles, so they are also
+modified when their newest live Article is.
+
+With ``COMMONCONTENT_SITEMAP_CACHE`` enabled, each sitemap is rendered once and cached
+gzip-compressed, until content it depends on changes (see ``commoncontent.caching``).
+
+The ``sitemaps`` dict at the end of this module serves the same pages to Django's own
+sitemap views, for projects that use them.
+"""
+
+import gzip
+import typing as T
+from datetime import MAXYEAR, MINYEAR, datetime
+from xml.sax.saxutils import escape
+
 from django.apps import apps
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.contrib.sitemaps.views import x_robots_tag
+from django.contrib.sites.shortcuts import get_current_site
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest, TruncMonth
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
 
+from commoncontent.caching import (
+    SITEMAP_KEY_PREFIX,
+    cached_value,
+    record_dependencies,
+    site_cache_timeout,
+)
 from commoncontent.models import Article, Author, HomePage, Page, Section
 
 conf = apps.get_app_config("commoncontent")
 
+# The most URLs a sitemap may hold, per https://www.sitemaps.org/protocol.html
+SITEMAP_LIMIT = 50000
+URLSET_START = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+INDEX_START = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+
+
+def last_modified(prefix: str = ""):
+    """An expression for the time a page was last modified: its ``date_modified``, or
+    ``date_published`` if it was never modified. ``prefix`` is the path to a related
+    page, like ``"section__"``."""
+    return Coalesce(f"{prefix}date_modified", f"{prefix}date_published")
+
+
+def with_newest_article(lastmod, **filters):
+    """An expression for the later of ``lastmod`` and the last modification of the
+    newest live Article matching ``filters``, which may refer to the outer query with
+    ``OuterRef``."""
+    newest = (
+        Article.objects.live()
+        .filter(**filters)
+        .order_by()
+        .values("site")
+        .annotate(lastmod=Max(last_modified()))
+        .values("lastmod")
+    )
+    # Greatest() is NULL if any argument is on some databases
+    return Greatest(lastmod, Coalesce(Subquery(newest), lastmod))
+
+
+def url_template(viewname: str, *args: str) -> str:
+    """Return the URL path of ``viewname`` as a format string, with a positional field
+    for each of the keyword arguments named in ``args``. Formatting the template is
+    much faster than calling ``reverse()`` for each object. The arguments must be
+    slugs, which need no quoting."""
+    placeholders = {name: f"__{index}__" for index, name in enumerate(args)}
+    template = reverse(viewname, kwargs=placeholders)
+    for index, placeholder in enumerate(placeholders.values()):
+        template = template.replace(placeholder, f"{{{index}}}")
+    return template
+
 
 class SiteAwareSiteMap(Sitemap):
     site = None
     model = None
+    # The name of the URL of an item, and the fields giving its keyword arguments
+    url_name = None
+    url_fields = {}
 
     def get_urls(self, site=None, **kwargs):
         self.site = site
@@ -18,7 +106,24 @@ class SiteAwareSiteMap(Sitemap):
         return self.model.objects.live().filter(site=self.site)
 
     def lastmod(self, obj):
-        return obj.date_modified
+        return obj.date_modified or obj.date_published
+
+    def lastmod_expression(self):
+        "An expression for the last modification time of an item, in queries."
+        return last_modified()
+
+    def entries(self, items=None) -> T.Iterator[T.Tuple[str, T.Optional[datetime]]]:
+        """Yield the URL path and last modification time of each item, reading only
+        the fields they need, in chunks."""
+        items = self.items() if items is None else items
+        template = url_template(self.url_name, *self.url_fields)
+        rows = items.values_list(*self.url_fields.values(), self.lastmod_expression())
+        for *args, lastmod in rows.iterator(chunk_size=2000):
+            yield template.format(*args), lastmod
+
+    def dependencies(self) -> T.List[str]:
+        "The dependency tags of the sitemap, see ``commoncontent.caching``."
+        return [f"{self.model._meta.model_name}s:{self.site.pk}"]
 
 
 class ArticleSitemap(SiteAwareSiteMap):
@@ -29,26 +134,87 @@ class ArticleSitemap(SiteAwareSiteMap):
     def items(self):
         return super().items().order_by("-date_published")
 
+    def entries(self, items=None):
+        # Articles in a series have the series in their URL
+        items = self.items() if items is None else items
+        fields = ("section_slug", "article_slug")
+        template = url_template("article_page", *fields)
+        series_template = url_template("article_series_page", *fields, "series_slug")
+        rows = items.values_list(
+            "section__slug", "slug", "series__slug", self.lastmod_expression()
+        )
+        for section_slug, slug, series_slug, lastmod in rows.iterator(chunk_size=2000):
+            if series_slug is None:
+                yield template.format(section_slug, slug), lastmod
+            else:
+                yield series_template.format(section_slug, slug, series_slug), lastmod
+
+    def months(self) -> T.List[T.Tuple[datetime, int, datetime]]:
+        """Return the first moment of each month with live Articles, newest first, with
+        the number of Articles published in it and the last time one was modified."""
+        return list(
+            self.items()
+            .order_by()
+            .annotate(month=TruncMonth("date_published"))
+            .values_list("month")
+            .annotate(count=Count("pk"), lastmod=Max(self.lastmod_expression()))
+            .order_by("-month")
+        )
+
+    def month_items(self, year: int, month: int, page: int = 1):
+        "Return the live Articles published in a month, for a page of its sitemap."
+        start = _month_start(year, month)
+        end = _month_start(year + month // 12, month % 12 + 1)
+        offset = (page - 1) * SITEMAP_LIMIT
+        return self.items().filter(date_published__gte=start, date_published__lt=end)[
+            offset : offset + SITEMAP_LIMIT
+        ]
+
 
 class AuthorSitemap(SiteAwareSiteMap):
     changefreq = "weekly"
     priority = 0.5
     model = Author
+    url_name = "author_page"
+    url_fields = {"author_slug": "slug"}
 
     def items(self):
         return self.model.objects.filter(site=self.site)
 
+    def lastmod(self, obj):
+        return obj.date_modified
+
+    def lastmod_expression(self):
+        return F("date_modified")
+
 
 class PageSitemap(SiteAwareSiteMap):
     changefreq = "weekly"
     priority = 0.5
     model = Page
+    url_name = "landing_page"
+    url_fields = {"page_slug": "slug"}
 
 
 class SectionSitemap(SiteAwareSiteMap):
     changefreq = "weekly"
     priority = 0.5
     model = Section
+    url_name = "section_page"
+    url_fields = {"section_slug": "slug"}
+
+    def items(self):
+        # Computed in the items query, rather than with a query per item
+        return super().items().annotate(sitemap_lastmod=self.lastmod_expression())
+
+    def lastmod(self, obj):
+        return obj.sitemap_lastmod
+
+    def lastmod_expression(self):
+        return with_newest_article(last_modified(), section=OuterRef("pk"))
+
+    def dependencies(self):
+        return [*super().dependencies(), f"articles:{self.site.pk}"]
 
 
 class HomePageSitemap(SiteAwareSiteMap):
@@ -57,7 +223,24 @@ class HomePageSitemap(SiteAwareSiteMap):
     model = HomePage
 
     def items(self):
-        return [HomePage.objects.live().filter(site=self.site).latest()]
+        home = HomePage.objects.live().filter(site=self.site)
+        return [home.annotate(sitemap_lastmod=self.lastmod_expression()).latest()]
+
+    def lastmod(self, obj):
+        return obj.sitemap_lastmod
+
+    def lastmod_expression(self):
+        return with_newest_article(last_modified(), site=OuterRef("site"))
+
+    def entries(self, items=None):
+        home = (
+            HomePage.objects.live().filter(site=self.site).order_by("-date_published")
+        )
+        for lastmod in home.values_list(self.lastmod_expression(), flat=True)[:1]:
+            yield reverse("home_page"), lastmod
+
+    def dependencies(self):
+        return [*super().dependencies(), f"articles:{self.site.pk}"]
 
 
 sitemaps = {
@@ -67,3 +250,145 @@ sitemaps = {
     "sections": SectionSitemap,
     "home": HomePageSitemap,
 }
+
+
+######################################################################################
+# Views
+######################################################################################
+def _month_start(year: int, month: int) -> datetime:
+    start = datetime(year, month, 1)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+
+def _w3c_date(value: datetime) -> str:
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.strftime("%Y-%m-%d")
+
+
+def _lastmod_tag(lastmod: T.Optional[datetime]) -> str:
+    return f"<lastmod>{_w3c_date(lastmod)}</lastmod>" if lastmod else ""
+
+
+def render_urlset(entries, base_url: str, sitemap: Sitemap) -> T.Iterator[str]:
+    "Yield the XML of a sitemap of ``entries``, in chunks."
+    tail = ""
+    if sitemap.changefreq:
+        tail += f"<changefreq>{sitemap.changefreq}</changefreq>"
+    if sitemap.priority:
+        tail += f"<priority>{sitemap.priority}</priority>"
+    tail += "</url>\n"
+
+    yield URLSET_START
+    chunk = []
+    for path, lastmod in entries:
+        loc = escape(base_url + path)
+        chunk.append(f"<url><loc>{loc}</loc>{_lastmod_tag(lastmod)}{tail}")
+        if len(chunk) >= 1000:
+            yield "".join(chunk)
+            chunk = []
+    chunk.append("</urlset>\n")
+    yield "".join(chunk)
+
+
+def _base_url(request) -> str:
+    return f"{request.scheme}://{get_current_site(request).domain}"
+
+
+def _compress(content: T.Iterable[str]) -> bytes:
+    # A fixed mtime, so that unchanged sitemaps compress to the same bytes
+    return gzip.compress("".join(content).encode(), compresslevel=6, mtime=0)
+
+
+def _sitemap_response(request, site, tags, content: T.Callable) -> HttpResponse:
+    """Respond with the sitemap XML yielded by ``content()``, which depends on the
+    dependency ``tags``. With ``COMMONCONTENT_SITEMAP_CACHE``, the gzip-compressed XML
+    is cached until the tags change, and sent compressed to clients that accept it.
+    Otherwise the XML is streamed as it is rendered."""
+    record_dependencies(request, f"site:{site.pk}", *tags)
+    if not conf.sitemap_cache:
+        return StreamingHttpResponse(content(), content_type="application/xml")
+
+    document = cached_value(
+        f"{SITEMAP_KEY_PREFIX}{site.pk}:{request.scheme}:{request.path}",
+        [f"site:{site.pk}", *tags],
+        lambda: _compress(content()),
+        site_cache_timeout(site.pk, conf.page_cache_timeout),
+    )
+    accepts_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    if not accepts_gzip:
+        return HttpResponse(gzip.decompress(document), content_type="application/xml")
+    response = HttpResponse(document, content_type="application/xml")
+    response["Content-Encoding"] = "gzip"
+    response["Vary"] = "Accept-Encoding"
+    return response
+
+
+def sitemap_entries(site) -> T.Iterator[T.Tuple[str, T.Optional[datetime]]]:
+    """Yield the URL path of every sitemap listed in the site's sitemap index, with the
+    last modification time of the Articles in it, if it lists Articles."""
+    for kind in ("home", "sections", "pages", "authors"):
+        yield reverse("sitemap", kwargs={"kind": kind}), None
+    articles = ArticleSitemap()
+    articles.site = site
+    for month, count, lastmod in articles.months():
+        month = timezone.localtime(month) if timezone.is_aware(month) else month
+        kwargs = {"year": month.year, "month": month.month}
+        yield reverse("sitemap_articles", kwargs=kwargs), lastmod
+        pages = -(-count // SITEMAP_LIMIT)
+        for page in range(2, pages + 1):
+            path = reverse(
+                "sitemap_articles_paginated", kwargs={**kwargs, "page": page}
+            )
+            yield path, lastmod
+
+
+@x_robots_tag
+def sitemap_index(request):
+    "The sitemap index, listing the sitemap of each type of page and month of Articles."
+    site = get_current_site(request)
+    base_url = _base_url(request)
+
+    def content():
+        yield INDEX_START
+        for path, lastmod in sitemap_entries(site):
+            loc = escape(base_url + path)
+            yield f"<sitemap><loc>{loc}</loc>{_lastmod_tag(lastmod)}</sitemap>\n"
+        yield "</sitemapindex>\n"
+
+    return _sitemap_response(request, site, [f"articles:{site.pk}"], content)
+
+
+@x_robots_tag
+def sitemap(request, kind):
+    "The sitemap of one type of page: home, sections, pages or authors."
+    if kind not in ("home", "sections", "pages", "authors"):
+        raise Http404(f"No sitemap named {kind}")
+    sitemap = sitemaps[kind]()
+    sitemap.site = get_current_site(request)
+    return _sitemap_response(
+        request,
+        sitemap.site,
+        sitemap.dependencies(),
+        lambda: render_urlset(sitemap.entries(), _base_url(request), sitemap),
+    )
+
+
+@x_robots_tag
+def article_sitemap(request, year, month, page=1):
+    "The sitemap of the Articles published in a month."
+    # Year 1 is excluded too: its first day is before datetime.min in UTC for time
+    # zones ahead of UTC, where the query would overflow converting it
+    if not (MINYEAR < year < MAXYEAR and 1 <= month <= 12) or page < 1:
+        raise Http404("No such month")
+    sitemap = ArticleSitemap()
+    sitemap.site = get_current_site(request)
+    items = sitemap.month_items(year, month, page)
+    if page > 1 and not items.exists():
+        raise Http404("No such page")
+    return _sitemap_response(
+        request,
+        sitemap.site,
+        sitemap.dependencies(),
+        lambda: render_urlset(sitemap.entries(items), _base_url(request), sitemap),
+    )
@@ -0,0 +1,401 @@
+"""
+Static site generation.
+
+``site_urls`` lists the URL path of every public page of a Site: the home page, sections,
+authors and their pagination, articles, series, landing pages, feeds and sitemaps.
+``render_urls`` renders URL paths through the project's URLconf, middleware and views,
+exactly as they would be served, and writes each response to a file. The
+``build_static`` management command runs ``render_urls`` across a pool of processes.
+
+Builds are incremental. Each rendered page records the dependency tags of the content
+it displayed (see ``commoncontent.caching``), and a ``Manifest`` saved with the output
+remembers them, along with a fingerprint of the content each tag named at build time.
+On the next build only pages with a changed dependency fingerprint are rendered again.
+
+Models are loaded from the app registry rather than imported, so that worker processes
+can import this module before Django is set up (see ``init_worker``).
+"""
+
+import json
+import typing as T
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Count, TextField
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils.crypto import md5
+from django.utils.html import format_html
+
+from commoncontent.caching import STATIC_BUILD_ENVIRON, get_dependencies, site_vars
+from commoncontent.pagination import KeysetPaginator
+
+REDIRECT_HTML = """<!DOCTYPE html>
+<html>
+  <head>
+    <meta charset="utf-8">
+    <title>Redirecting&hellip;</title>
+    <link rel="canonical" href="{0}">
+    <meta http-equiv="refresh" content="0; url={0}">
+  </head>
+  <body><a href="{0}">{0}</a></body>
+</html>
+"""
+
+
+def output_path(url_path: str) -> str:
+    """Return the file path, relative to the output directory, for a URL path. Paths
+    ending in a slash are written as ``index.html`` in the corresponding directory."""
+    path = url_path.lstrip("/")
+    if not path or path.endswith("/"):
+        path += "index.html"
+    return path
+
+
+def _paginated_urls(site, name: str, articles, count: int, **kwargs) -> T.Iterable[str]:
+    """Return the URLs of pages 2 and up of a paginated list of ``count`` articles.
+    ``name`` is the name of the URL pattern for numbered pages. With keyset pagination
+    the URLs of the "<name>_keyset" pattern are returned instead."""
+    per_page = site_vars(site).get_value("paginate_by", None, asa=int)
+    if not per_page:
+        return []
+    if apps.get_app_config("commoncontent").pagination == "keyset":
+        name = name.replace("_paginated", "") + "_keyset"
+        return (
+            reverse(name, kwargs={**kwargs, "cursor": cursor})
+            for cursor in KeysetPaginator(articles, per_page).cursors()
+        )
+    orphans = site_vars(site).get_value("paginate_orphans", 0, asa=int)
+    num_pages = Paginator(range(count), per_page, orphans=orphans).num_pages
+    return [
+        reverse(name, kwargs={**kwargs, "page": page})
+        for page in range(2, num_pages + 1)
+    ]
+
+
+def site_urls(site) -> T.Iterator[str]:
+    """Yield the URL path of every public page of the Site."""
+    Article = apps.get_model("commoncontent", "Article")
+    Author = apps.get_model("commoncontent", "Author")
+    Page = apps.get_model("commoncontent", "Page")
+    Section = apps.get_model("commoncontent", "Section")
+
+    articles = Article.objects.live().filter(site=site)
+
+    yield reverse("home_page")
+    yield from _paginated_urls(site, "home_paginated", articles, articles.count())
+    yield reverse("site_feed")
+
+    by_section = dict(
+        articles.order_by().values_list("section").annotate(count=Count("pk"))
+    )
+    sections = Section.objects.live().filter(site=site).values_list("pk", "slug")
+    for pk, slug in sections.order_by():
+        yield reverse("section_page", kwargs={"section_slug": slug})
+        yield from _paginated_urls(
+            site,
+            "section_paginated",
+            articles.filter(section_id=pk),
+            by_section.get(pk, 0),
+            section_slug=slug,
+        )
+        yield reverse("section_feed", kwargs={"section_slug": slug})
+
+    yield reverse("author_list")
+    by_author = dict(
+        articles.order_by().values_list("author").annotate(count=Count("pk"))
+    )
+    authors = Author.objects.filter(site=site).values_list("pk", "slug")
+    for pk, slug in authors.order_by():
+        yield reverse("author_page", kwargs={"author_slug": slug})
+        yield from _paginated_urls(
+            site,
+            "author_page_paginated",
+            articles.filter(author_id=pk),
+            by_author.get(pk, 0),
+            author_slug=slug,
+        )
+        yield reverse("author_feed", kwargs={"author_slug": slug})
+
+    # Articles in a series have the series in their URL. The series page redirects to
+    # the first article in the series.
+    series_urls = {}
+    for slug, section_slug, series_slug in (
+        articles.values_list("slug", "section__slug", "series__slug")
+        .order_by()
+        .iterator(chunk_size=2000)
+    ):
+        kwargs = {"section_slug": section_slug, "article_slug": slug}
+        if series_slug is None:
+            yield reverse("article_page", kwargs=kwargs)
+            continue
+        yield reverse(
+            "article_series_page", kwargs={**kwargs, "series_slug": series_slug}
+        )
+        if series_slug not in series_urls:
+            series_urls[series_slug] = reverse(
+                "series_page",
+                kwargs={"section_slug": section_slug, "series_slug": series_slug},
+            )
+    yield from series_urls.values()
+
+    for slug in Page.objects.live().filter(site=site).values_list("slug", flat=True):
+        yield reverse("landing_page", kwargs={"page_slug": slug})
+
+    # Imported here because it imports models
+    from commoncontent.sitemaps import sitemap_entries
+
+    yield reverse("sitemap_index")
+    for path, _lastmod in sitemap_entries(site):
+        yield path
+
+
+class Rendered(T.NamedTuple):
+    "The outcome of rendering one URL path"
+
+    path: str
+    status: int
+    dependencies: T.List[str] = []
+    digest: str = ""
+
+
+def _digest(content) -> str:
+    if not isinstance(content, bytes):
+        content = json.dumps(content, cls=DjangoJSONEncoder).encode()
+    return md5(content, usedforsecurity=False).hexdigest()
+
+
+def render_urls(
+    site_id: int,
+    paths: T.Iterable[str],
+    output_dir: Path,
+    digests: T.Optional[T.Dict[str, str]] = None,
+) -> T.List[Rendered]:
+    """Render each URL path of the Site and write the response to its file under
+    ``output_dir``. Redirects are written as HTML pages that refresh to the target.
+    Error responses are not written, nor are files whose content is unchanged from the
+    ``digests`` of a previous build."""
+    Site = apps.get_model("sites", "Site")
+    site = Site.objects.get(pk=site_id)
+    output_dir = Path(output_dir)
+    digests = digests or {}
+    # Views find the current Site from the SITE_ID setting when it is set, otherwise
+    # from the request's host, so set both.
+    client = Client(
+        HTTP_HOST=site.domain,
+        raise_request_exception=False,
+        **{STATIC_BUILD_ENVIRON: True},
+    )
+    hosts = [*settings.ALLOWED_HOSTS, site.domain.split(":")[0]]
+    results = []
+    with override_settings(SITE_ID=site.pk, ALLOWED_HOSTS=hosts):
+        for path in paths:
+            response = client.get(path, secure=True)
+            if response.status_code == 200 and response.streaming:
+                content = b"".join(response.streaming_content)
+            elif response.status_code == 200:
+                content = response.content
+            elif response.status_code in (301, 302, 307, 308):
+                content = format_html(REDIRECT_HTML, response["Location"]).encode()
+            else:
+                results.append(Rendered(path, response.status_code))
+                continue
+            digest = _digest(content)
+            file = output_dir / output_path(path)
+            if digests.get(path) != digest or not file.exists():
+                file.parent.mkdir(parents=True, exist_ok=True)
+                file.write_bytes(content)
+            dependencies = sorted(get_dependencies(response.wsgi_request))
+            results.append(Rendered(path, response.status_code, dependencies, digest))
+    return results
+
+
+######################################################################################
+# Incremental builds
+######################################################################################
+# Tags naming one object, e.g. "article:12", and the model of the object
+OBJECT_TAGS = {
+    "article": "commoncontent.Article",
+    "author": "commoncontent.Author",
+    "homepage": "commoncontent.HomePage",
+    "image": "commoncontent.Image",
+    "menu": "commoncontent.Menu",
+    "page": "commoncontent.Page",
+    "section": "commoncontent.Section",
+    "series": "commoncontent.ArticleSeries",
+    "site": "sites.Site",
+}
+# Rows of other models displayed with an object, their foreign key to it, and the
+# fields displayed (None for all)
+RELATED_ROWS = {
+    "menu": ("commoncontent.Link", "menu", None),
+    # Articles list the other articles in their series
+    "series": (
+        "commoncontent.Article",
+        "series",
+        (
+            "pk",
+            "title",
+            "slug",
+            "section_id",
+            "_order",
+            "status",
+            "date_published",
+            "expires",
+        ),
+    ),
+    "site": ("sitevars.SiteVar", "site", None),
+}
+# Tags naming the objects of a model listed on a site, e.g. "articles:1"
+COLLECTION_TAGS = {
+    "articles": "commoncontent.Article",
+    "authors": "commoncontent.Author",
+    "homepages": "commoncontent.HomePage",
+    "menus": "commoncontent.Menu",
+    "pages": "commoncontent.Page",
+    "sections": "commoncontent.Section",
+}
+BATCH_SIZE = 500
+
+
+def _object_fingerprints(kind: str, pks: T.Iterable[int]) -> T.Dict[str, str]:
+    """Fingerprint objects by their field values, their many-to-many relations (such as
+    tags and images) and their related rows."""
+    model = apps.get_model(OBJECT_TAGS[kind])
+    pks = sorted(pks)
+    rows = defaultdict(list)
+    for start in range(0, len(pks), BATCH_SIZE):
+        batch = pks[start : start + BATCH_SIZE]
+        for row in model._base_manager.filter(pk__in=batch).order_by("pk").values():
+            rows[row["id"]].append(sorted(row.items()))
+        for m2m in model._meta.many_to_many:
+            through = m2m.remote_field.through
+            if hasattr(through, "tag"):
+                # django-taggit's generic relation
+                related = through.objects.filter(
+                    content_type__app_label=model._meta.app_label,
+                    content_type__model=model._meta.model_name,
+                    object_id__in=batch,
+                ).values_list("object_id", "tag__name")
+            else:
+                source, target = m2m.m2m_column_name(), m2m.m2m_reverse_name()
+                related = through.objects.filter(**{f"{source}__in": batch})
+                related = related.values_list(source, target)
+            for pk, value in related.order_by(*related._fields):
+                rows[pk].append((m2m.name, value))
+        if kind in RELATED_ROWS:
+            related_model, fk, fields = RELATED_ROWS[kind]
+            related = apps.get_model(related_model)._base_manager.filter(
+                **{f"{fk}__in": batch}
+            )
+            fields = (f"{fk}_id", *fields) if fields else ()
+            for row in related.order_by("pk").values(*fields):
+                rows[row[f"{fk}_id"]].append(sorted(row.items()))
+    # Deleted objects get the fingerprint of no content
+    return {f"{kind}:{pk}": _digest(rows.get(pk, [])) for pk in pks}
+
+
+def _collection_fingerprint(kind: str, site_id: int) -> str:
+    """Fingerprint which objects are listed on the site, in what order and under what
+    title. Long text fields are ignored: pages displaying them depend on the object."""
+    model = apps.get_model(COLLECTION_TAGS[kind])
+    queryset = model._default_manager.filter(site_id=site_id)
+    if hasattr(queryset, "live"):
+        queryset = queryset.live()
+    fields = [
+        f.attname
+        for f in model._meta.concrete_fields
+        if not isinstance(f, TextField) and not f.primary_key
+    ]
+    rows = queryset.order_by("pk").values_list("pk", *fields)
+    return _digest(list(rows.iterator(chunk_size=2000)))
+
+
+def fingerprint_tags(tags: T.Iterable[str]) -> T.Dict[str, str]:
+    """Return a fingerprint of the current content named by each dependency tag.
+    Tags of unknown kinds are left out, so pages depending on them are always stale."""
+    by_kind = defaultdict(set)
+    for tag in tags:
+        kind, _, ident = tag.partition(":")
+        if ident.isdigit():
+            by_kind[kind].add(int(ident))
+    fingerprints = {}
+    for kind, idents in by_kind.items():
+        if kind in OBJECT_TAGS:
+            fingerprints.update(_object_fingerprints(kind, idents))
+        elif kind in COLLECTION_TAGS:
+            for ident in idents:
+                fingerprints[f"{kind}:{ident}"] = _collection_fingerprint(kind, ident)
+    return fingerprints
+
+
+@dataclass
+class Manifest:
+    """Record of a static build of one site: the dependency tags and content digest of
+    each page written, and the fingerprint of each tag at the time of the build."""
+
+    MANIFEST_NAME: T.ClassVar[str] = ".commoncontent-build.json"
+    VERSION: T.ClassVar[int] = 1
+
+    dependencies: T.Dict[str, T.List[str]] = field(default_factory=dict)
+    digests: T.Dict[str, str] = field(default_factory=dict)
+    fingerprints: T.Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, directory: Path) -> "Manifest":
+        """Load the manifest of the build in ``directory``. Returns an empty manifest,
+        which makes every page stale, if there is none."""
+        try:
+            data = json.loads((Path(directory) / cls.MANIFEST_NAME).read_text())
+        except (OSError, ValueError):
+            return cls()
+        if data.pop("version", None) != cls.VERSION:
+            return cls()
+        return cls(**data)
+
+    def save(self, directory: Path):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        data = {"version": self.VERSION, **asdict(self)}
+        (directory / self.MANIFEST_NAME).write_text(json.dumps(data, indent=0))
+
+    def tags(self) -> T.Set[str]:
+        return {tag for tags in self.dependencies.values() for tag in tags}
+
+    def is_stale(self, path: str, fingerprints: T.Dict[str, str]) -> bool:
+        """Whether the page at ``path`` must be rendered again, given the current
+        ``fingerprints`` of its dependencies. Pages that recorded no dependencies,
+        such as redirects and the sitemap, are always stale."""
+        tags = self.dependencies.get(path)
+        return not tags or any(
+            tag not in fingerprints or fingerprints[tag] != self.fingerprints.get(tag)
+            for tag in tags
+        )
+
+    def update(self, rendered: T.Iterable[Rendered]):
+        for result in rendered:
+            if result.status < 400:
+                self.dependencies[result.path] = result.dependencies
+                self.digests[result.path] = result.digest
+            else:
+                self.remove(result.path)
+
+    def remove(self, path: str):
+        self.dependencies.pop(path, None)
+        self.digests.pop(path, None)
+
+
+def init_worker():
+    """Prepare a worker process to render pages. Sets up Django in spawned processes,
+    and closes database connections inherited from the parent in forked ones."""
+    if not apps.ready:
+        import django
+
+        django.setup()
+    connections.close_all()
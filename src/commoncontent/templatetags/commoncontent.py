@@ -1,8 +1,29 @@
-from commoncontent.models import Menu, SectionMenu
+import typing as T
+
+from commoncontent.caching import (
+    MENU_KEY_PREFIX,
+    METADATA_KEY_PREFIX,
+    cached_value,
+    dependency_tags,
+    record_dependencies,
+    site_cache_timeout,
+    site_vars,
+)
+from commoncontent.models import ResolvedMenu
+from commoncontent.renditions import (
+    MIME_TYPES,
+    SRCSET_SCALES,
+    registered_file,
+    rendition_file,
+    responsive_formats,
+)
+from commoncontent.schemas import HeadMetadata
 from django import template
+from django.apps import apps
 from django.contrib.sites.shortcuts import get_current_site
+from django.forms.utils import flatatt
 from django.utils import timezone
-from django.utils.html import format_html, mark_safe
+from django.utils.html import format_html, format_html_join, mark_safe
 
 register = template.Library()
 
@@ -75,10 +96,10 @@ def copyright_notice(context):
         return format_html(notice, copyright_year)
 
     # Otherwise, we fall back to the site's copyright. Is one explicitly set?
-    if notice := site.vars.get_value("copyright_notice"):
+    if notice := site_vars(site).get_value("copyright_notice"):
         return format_html(notice, copyright_year)
     else:
-        holder = site.vars.get_value("copyright_holder", site.name)
+        holder = site_vars(site).get_value("copyright_holder", site.name)
         return format_html(
             "© Copyright {} {}. All rights reserved.", copyright_year, holder
         )
@@ -86,22 +107,59 @@ def copyright_notice(context):
 
 @register.simple_tag(takes_context=True)
 def menu(context, menu_slug):
-    """Looks up a Menu object from the database by slug and stores it in the variable named after 'as'.
+    """Looks up a Menu by slug and stores it in the variable named after 'as'. If
+    ``COMMONCONTENT_MENU_CACHE`` is enabled, menus are cached as a ``ResolvedMenu``,
+    whose links have only ``url``, ``title`` and ``icon_name`` properties.
 
     ``{% menu "main-nav" as menu %}``
     """
     request = context.get("request")
     site = get_current_site(request)
-    menu = None
-    try:
-        menu = Menu.objects.get(site=site, slug=menu_slug)
-    except Menu.DoesNotExist:
-        # Special case for the magic slug "main-nav"
-        if menu_slug == "main-nav":
-            menu = SectionMenu(site)
+    conf = apps.get_app_config("commoncontent")
+    if not conf.menu_cache:
+        menu, dependencies = ResolvedMenu.lookup(site, menu_slug)
+        record_dependencies(request, *dependencies)
+        return menu
+
+    def dependencies(menu):
+        # The page changes if the menu is created later
+        return menu.dependencies if menu else {f"menus:{site.pk}"}
+
+    menu = cached_value(
+        f"{MENU_KEY_PREFIX}{site.pk}:{menu_slug}",
+        dependencies,
+        lambda: ResolvedMenu.resolve(site, menu_slug),
+        site_cache_timeout(site.pk, conf.page_cache_timeout),
+    )
+    record_dependencies(request, *dependencies(menu))
     return menu
 
 
+@register.simple_tag(takes_context=True)
+def head_metadata(context, obj):
+    """Renders the Open Graph and schema.org metadata of an object, once per version of
+    the object if ``COMMONCONTENT_METADATA_CACHE`` is enabled, and stores it in the
+    variable named after 'as'.
+
+    ``{% head_metadata object as head %}{{ head.opengraph }}{{ head.schema }}``
+    """
+    pk = getattr(obj, "pk", None)
+    conf = apps.get_app_config("commoncontent")
+    if pk is None or not conf.metadata_cache:
+        return HeadMetadata.render(obj)
+
+    tags = dependency_tags(obj)
+    record_dependencies(context.get("request"), *tags)
+    modified = getattr(obj, "date_modified", None)
+    version = modified.timestamp() if modified else ""
+    return cached_value(
+        f"{METADATA_KEY_PREFIX}{obj._meta.label_lower}:{pk}:{version}",
+        tags,
+        lambda: HeadMetadata.render(obj),
+        conf.page_cache_timeout,
+    )
+
+
 @register.simple_tag(takes_context=True)
 def menu_active(context, menuitem: str):
     """Returns 'active' if the current URL is "under" the given URL.
@@ -145,12 +203,98 @@ def opengraph_image(context, og):
 
     ``{% opengraph_image article as img %}``
     """
+    img = _opengraph_image(og)
+    if img is not None:
+        record_dependencies(context.get("request"), f"image:{img.pk}")
+    return img
+
+
+def _opengraph_image(og):
     if img := getattr(og, "share_image", None):
         return img
     if hasattr(og, "image_set"):
-        if img := og.image_set.first():
+        # Use the images loaded by Article.objects.for_listing() if available
+        if "image_set" in getattr(og, "_prefetched_objects_cache", {}):
+            images = og.image_set.all()
+            img = images[0] if images else None
+        else:
+            img = og.image_set.first()
+        if img:
             return img
     if hasattr(og, "section"):
         if img := og.section.share_image:
             return img
     return None
+
+
+@register.simple_tag(takes_context=True)
+def responsive_image(context, image, rendition, sizes=None, **attrs):
+    """Renders a rendition of an Image as a ``<picture>``, with a ``<source>`` per
+    format of ``COMMONCONTENT_RESPONSIVE_FORMATS`` and a JPEG ``<img>`` fallback, each
+    with a ``srcset`` of the rendition's responsive variants so that small screens
+    download small files. ``sizes`` defaults to the rendition's width, or the viewport's
+    if smaller. Other arguments are added as attributes of the ``<img>``, and ``alt``
+    defaults to the Image's alt text.
+
+    Only the variants in the Image's rendition registry are listed: encoding the others,
+    AVIF especially, would delay the page. Until they are generated, by the rendition
+    backend or the ``generate_renditions`` command, the tag renders the rendition alone.
+
+    ``{% responsive_image img "medium" sizes="(min-width: 768px) 33vw, 100vw" class="img-fluid" %}``
+    """
+    record_dependencies(context.get("request"), f"image:{image.pk}")
+    src = rendition_file(image, rendition)
+    if sizes is None:
+        sizes = f"(max-width: {src.width}px) 100vw, {src.width}px"
+    candidates = {
+        format: _candidates(image, rendition, format) for format in responsive_formats()
+    }
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}" />',
+        (
+            (MIME_TYPES[format], _srcset(files), sizes)
+            for format, files in candidates.items()
+            if files
+        ),
+    )
+    # The fallback lists the rendition itself, even if the registry lacks it
+    files = _candidates(image, rendition)
+    files.setdefault(src.width, src.url)
+    attrs = {
+        "src": src.url,
+        "srcset": _srcset(files) if len(files) > 1 else None,
+        "sizes": sizes if len(files) > 1 else None,
+        "width": src.width,
+        "height": src.height,
+        "alt": image.alt_text,
+        **attrs,
+    }
+    return format_html("<picture>{}<img{} /></picture>", sources, flatatt(attrs))
+
+
+@register.simple_tag(takes_context=True)
+def rendition(context, image, name, scale=1, format=None):
+    """Stores the URL, width and height of a rendition of an Image, or of one of its
+    responsive variants, in the variable named after 'as'. Unlike ``img.medium.width``,
+    which opens the rendition's file, the dimensions are read from the Image's
+    rendition registry or computed from its size.
+
+    ``{% rendition img "medium" as thumb %}<img src="{{ thumb.url }}" width="{{ thumb.width }}" height="{{ thumb.height }}">``
+    """
+    record_dependencies(context.get("request"), f"image:{image.pk}")
+    return rendition_file(image, name, scale, format)
+
+
+def _candidates(image, rendition, format=None) -> T.Dict[int, str]:
+    "The URLs of the registered variants of a rendition in a format, by width."
+    candidates = {}
+    for scale in SRCSET_SCALES:
+        if file := registered_file(image, rendition, scale, format):
+            # Small images may be resized to the same width at every scale
+            candidates.setdefault(file.width, file.url)
+    return candidates
+
+
+def _srcset(candidates: T.Dict[int, str]) -> str:
+    return ", ".join(f"{url} {width}w" for width, url in candidates.items())
@@ -14,18 +14,37 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
-from django.urls import path
+from django.urls import path, register_converter
 from django.views.generic import RedirectView
 
+from commoncontent import sitemaps
 from commoncontent import views as generic
+from commoncontent.pagination import KeysetCursorConverter
+
+register_converter(KeysetCursorConverter, "cursor")
 
 urlpatterns = [
     path(
         "<slug:section_slug>/feed/", RedirectView.as_view(pattern_name="section_feed")
     ),
     path("feed/", RedirectView.as_view(pattern_name="site_feed")),
+    path("sitemap.xml", sitemaps.sitemap_index, name="sitemap_index"),
+    path(
+        "sitemap-articles-<int:year>-<int:month>.xml",
+        sitemaps.article_sitemap,
+        name="sitemap_articles",
+    ),
+    path(
+        "sitemap-articles-<int:year>-<int:month>-<int:page>.xml",
+        sitemaps.article_sitemap,
+        name="sitemap_articles_paginated",
+    ),
+    path("sitemap-<slug:kind>.xml", sitemaps.sitemap, name="sitemap"),
     # Home page pagination needs to come before the other page patterns to match.
     path("page_<int:page>.html", generic.HomePageView.as_view(), name="home_paginated"),
+    path(
+        "page_<cursor:cursor>.html", generic.HomePageView.as_view(), name="home_keyset"
+    ),
     path("author/", generic.AuthorListView.as_view(), name="author_list"),
     path(
         "author/<slug:author_slug>/index.rss", generic.AuthorFeed(), name="author_feed"
@@ -35,6 +54,11 @@ urlpatterns = [
         generic.AuthorView.as_view(),
         name="author_page_paginated",
     ),
+    path(
+        "author/<slug:author_slug>/page_<cursor:cursor>.html",
+        generic.AuthorView.as_view(),
+        name="author_page_keyset",
+    ),
     path(
         "author/<slug:author_slug>/", generic.AuthorView.as_view(), name="author_page"
     ),
@@ -43,6 +67,11 @@ urlpatterns = [
         generic.SectionView.as_view(),
         name="section_paginated",
     ),
+    path(
+        "<slug:section_slug>/page_<cursor:cursor>.html",
+        generic.SectionView.as_view(),
+        name="section_keyset",
+    ),
     path(
         "<slug:section_slug>/<slug:series_slug>/<slug:article_slug>.html",
         generic.ArticleDetailView.as_view(),
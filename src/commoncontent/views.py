@@ -1,26 +1,43 @@
 import typing as T
+from contextvars import ContextVar
 
 from django.apps import apps
 from django.contrib.sites.shortcuts import get_current_site
 from django.contrib.syndication.views import Feed
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.crypto import md5
+from django.utils.functional import SimpleLazyObject
 from django.utils.feedgenerator import Rss201rev2Feed
 from django.views.generic import DetailView, ListView, RedirectView
 
+from commoncontent.caching import (
+    CachedPageMixin,
+    cached_response,
+    cached_value,
+    dependency_tags,
+    record_dependencies,
+    site_cache_timeout,
+    site_vars,
+    tracks_dependencies,
+)
 from commoncontent.models import Article, ArticleSeries, Author, HomePage, Page, Section
+from commoncontent.pagination import KeysetPaginator
 
 
 ######################################################################################
-class BasePageDetailView(DetailView):
+class BasePageDetailView(CachedPageMixin, DetailView):
     template_name_field = "base_template"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         conf = apps.get_app_config("commoncontent")
+        record_dependencies(self.request, *dependency_tags(self.object))
 
-        context["opengraph"] = self.object.opengraph
+        # Built only if a template uses it. The default templates use head_metadata.
+        context["opengraph"] = SimpleLazyObject(lambda: self.object.opengraph)
 
         # Allow passing kwargs in the urlconf to override the default block templates
         for block in conf.base_blocks:
@@ -41,7 +58,7 @@ class BasePageDetailView(DetailView):
         names = super().get_template_names()
 
         # Fall back to site default if set
-        var = self.object.site.vars
+        var = site_vars(self.object.site_id)
         if site_default := var.get_value("base_template"):
             names.append(site_default)
 
@@ -111,7 +128,7 @@ class PageDetailView(BasePageDetailView):
 
 
 ######################################################################################
-class BasePageListView(ListView):
+class BasePageListView(CachedPageMixin, ListView):
     """View for pages that present a list of articles (e.g. SectionPage, HomePage).
 
     The `get_object` method is left unimplemented here, as it will be different for
@@ -129,8 +146,16 @@ class BasePageListView(ListView):
     def get_context_data(self, **kwargs):
         conf = apps.get_app_config("commoncontent")
         context = super().get_context_data(**kwargs)
+        record_dependencies(
+            self.request,
+            *dependency_tags(self.object),
+            f"articles:{self.object.site_id}",
+        )
+        for item in context["object_list"]:
+            record_dependencies(self.request, *dependency_tags(item))
         context["object"] = self.object
-        context["opengraph"] = self.object.opengraph
+        # Built only if a template uses it. The default templates use head_metadata.
+        context["opengraph"] = SimpleLazyObject(lambda: self.object.opengraph)
         if content_template := getattr(self.object, "content_template", None):
             context["content_template"] = content_template
 
@@ -152,14 +177,44 @@ class BasePageListView(ListView):
         if paginate_by := super().get_paginate_by(queryset):
             return paginate_by
         # Fall back to per-site setting or None
-        return self.request.site.vars.get_value("paginate_by", None, asa=int)
+        return site_vars(self.request.site).get_value("paginate_by", None, asa=int)
 
     def get_paginate_orphans(self) -> int:
         # If set explicitly on class, return it
         if orphans := super().get_paginate_orphans():
             return orphans
         # Fall back to per-site setting or 0 (Django's default)
-        return self.request.site.vars.get_value("paginate_orphans", 0, asa=int)
+        return site_vars(self.request.site).get_value("paginate_orphans", 0, asa=int)
+
+    def paginate_queryset(self, queryset, page_size):
+        conf = apps.get_app_config("commoncontent")
+        cursor = self.kwargs.get("cursor")
+        if cursor is None and (
+            conf.pagination != "keyset" or self.kwargs.get(self.page_kwarg)
+        ):
+            return super().paginate_queryset(queryset, page_size)
+
+        count = None
+        if conf.pagination_count:
+            site_id = self.object.site_id
+            # One count per list, shared by all of its pages
+            kwargs = sorted(
+                (k, v) for k, v in self.kwargs.items() if k not in ("cursor", "page")
+            )
+            # Hashed, as slugs may contain characters some cache backends reject
+            key = md5(str(kwargs).encode(), usedforsecurity=False).hexdigest()
+            count = cached_value(
+                f"commoncontent:count:{site_id}:{type(self).__name__}:{key}",
+                [f"articles:{site_id}"],
+                queryset.count,
+                site_cache_timeout(site_id, conf.page_cache_timeout),
+            )
+        paginator = KeysetPaginator(queryset, page_size, count=count)
+        try:
+            page = paginator.page(cursor)
+        except ValueError as e:
+            raise Http404(f"Invalid page cursor {cursor}") from e
+        return (paginator, page, page.object_list, page.has_other_pages())
 
     def get_queryset(self):
         site = get_current_site(self.request)
@@ -188,7 +243,7 @@ class BasePageListView(ListView):
             )
 
         # Fall back to site default if set
-        var = self.object.site.vars
+        var = site_vars(self.object.site_id)
         if site_default := var.get_value("base_template"):
             names.append(site_default)
 
@@ -205,7 +260,7 @@ class ArticleListView(BasePageListView):
     def get_queryset(self):
         # Because Articles can belong to ArticlesSeries, the default ordering doesn't
         # work as expected, so we must explicitly order by date_published.
-        return super().get_queryset().order_by("-date_published")
+        return super().get_queryset().for_listing().order_by("-date_published")
 
 
 ######################################################################################
@@ -227,7 +282,8 @@ class AuthorView(ArticleListView):
         )
 
     def get_queryset(self):
-        return super().get_queryset().filter(author=self.get_object())
+        # self.object was already loaded by get(), no need to query for it again
+        return super().get_queryset().filter(author=self.object)
 
 
 ######################################################################################
@@ -244,8 +300,14 @@ class AuthorListView(ListView):
         context["content_template"] = "commoncontent/blocks/author_list_album.html"
         return context
 
+    def get_queryset(self):
+        site = get_current_site(self.request)
+        return super().get_queryset().filter(site=site).select_related("profile_image")
+
     def get_object(self):
-        site_name = self.request.site.vars.get_value("brand", self.request.site.name)
+        site_name = site_vars(self.request.site).get_value(
+            "brand", self.request.site.name
+        )
         self.object = Page(
             site=get_current_site(self.request),
             title=f"Contributors to {site_name}",
@@ -258,7 +320,7 @@ class AuthorListView(ListView):
         names = super().get_template_names()
 
         # Fall back to site default if set
-        var = self.object.site.vars
+        var = site_vars(self.object.site_id)
         if site_default := var.get_value("base_template"):
             names.append(site_default)
 
@@ -330,17 +392,39 @@ class ContentFeed(Rss201rev2Feed):
 
 
 ######################################################################################
+# The request of the feed being rendered, if its dependencies are tracked
+_feed_request: ContextVar = ContextVar("commoncontent_feed_request", default=None)
+
+
 class SiteFeed(Feed):
     "RSS feed of site Article Pages"
 
     feed_type = ContentFeed
 
+    def __call__(self, request, *args, **kwargs):
+        return cached_response(
+            request, lambda: super(SiteFeed, self).__call__(request, *args, **kwargs)
+        )
+
+    def get_feed(self, obj, request):
+        # The item_* methods are not passed the request, and the Feed instance is
+        # shared by concurrent requests
+        token = _feed_request.set(request if tracks_dependencies(request) else None)
+        try:
+            return super().get_feed(obj, request)
+        finally:
+            _feed_request.reset(token)
+
     def get_object(self, request, *args, **kwargs):
         "For site feed, get_object will return the site"
-        return request.site
+        site = request.site
+        record_dependencies(
+            request, f"site:{site.pk}", f"articles:{site.pk}", f"homepages:{site.pk}"
+        )
+        return site
 
     def title(self, obj):
-        tagline = obj.vars.get_value("tagline")
+        tagline = site_vars(obj).get_value("tagline")
         if tagline:
             return f"{obj.name} -- {tagline}"
         return obj.name
@@ -356,25 +440,26 @@ class SiteFeed(Feed):
         return reverse("site_feed")
 
     def author_name(self, obj):
-        return obj.vars.get_value("author_display_name")
+        return site_vars(obj).get_value("author_display_name")
 
     def feed_copyright(self, obj):
         page = HomePage.objects.live().filter(site=obj).latest()
         return page.copyright_notice
 
     def items(self, obj):
-        paginate_by = obj.vars.get_value("paginate_by", 15, asa=int)
+        paginate_by = site_vars(obj).get_value("paginate_by", 15, asa=int)
         return (
             Article.objects.live()
             .filter(site=obj)
+            .for_listing()
             .order_by("-date_published")[:paginate_by]
         )
 
     def item_title(self, item):
-        return item.opengraph.title
+        return item.title
 
     def item_description(self, item):
-        return item.opengraph.description
+        return item.description
 
     def item_link(self, item):
         return item.get_absolute_url()
@@ -383,7 +468,7 @@ class SiteFeed(Feed):
         if item.author:
             return item.author.name
         else:
-            return item.site.vars.get_value("author_display_name")
+            return site_vars(item.site_id).get_value("author_display_name")
 
     def item_pubdate(self, item):
         return item.date_published
@@ -395,6 +480,10 @@ class SiteFeed(Feed):
         return item.copyright_notice
 
     def item_extra_kwargs(self, item):
+        if request := _feed_request.get():
+            record_dependencies(request, f"article:{item.pk}")
+            if item.author_id:
+                record_dependencies(request, f"author:{item.author_id}")
         return {"content_encoded": self.item_content_encoded(item)}
 
     def item_content_encoded(self, item):
@@ -407,11 +496,15 @@ class SectionFeed(SiteFeed):
 
     def get_object(self, request, *args, **kwargs):
         "Return the CategoryPage for this feed"
-        return get_object_or_404(
+        section = get_object_or_404(
             Section.objects.live().filter(
                 site=request.site, slug=kwargs["section_slug"]
             )
         )
+        record_dependencies(
+            request, *dependency_tags(section), f"articles:{section.site_id}"
+        )
+        return section
 
     def title(self, obj):
         return obj.title
@@ -429,16 +522,17 @@ class SectionFeed(SiteFeed):
         if obj.author:
             return obj.author.name
         else:
-            return obj.site.vars.get_value("author_display_name")
+            return site_vars(obj.site_id).get_value("author_display_name")
 
     def feed_copyright(self, obj):
         return obj.copyright_notice
 
     def items(self, obj):
-        paginate_by = obj.site.vars.get_value("paginate_by", 15, asa=int)
+        paginate_by = site_vars(obj.site_id).get_value("paginate_by", 15, asa=int)
         return (
             Article.objects.live()
             .filter(section=obj)
+            .for_listing()
             .order_by("-date_published")[:paginate_by]
         )
 
@@ -449,9 +543,13 @@ class AuthorFeed(SiteFeed):
 
     def get_object(self, request, *args, **kwargs):
         "Return the Author for this feed"
-        return get_object_or_404(
+        author = get_object_or_404(
             Author.objects.filter(site=request.site, slug=kwargs["author_slug"])
         )
+        record_dependencies(
+            request, *dependency_tags(author), f"articles:{author.site_id}"
+        )
+        return author
 
     def title(self, obj):
         return obj.name
@@ -472,9 +570,10 @@ class AuthorFeed(SiteFeed):
         return obj.copyright_notice
 
     def items(self, obj):
-        paginate_by = obj.site.vars.get_value("paginate_by", 15, asa=int)
+        paginate_by = site_vars(obj.site_id).get_value("paginate_by", 15, asa=int)
         return (
             Article.objects.live()
             .filter(author=obj)
+            .for_listing()
             .order_by("-date_published")[:paginate_by]
         )
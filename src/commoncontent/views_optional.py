@@ -4,6 +4,7 @@ from django.http import HttpResponse, JsonResponse
 from django.views.generic import ListView
 
 from commoncontent.models import Image
+from commoncontent.renditions import rendition_file
 
 
 ######################################################################################
@@ -25,7 +26,9 @@ class TinyMCEImageListView(ListView):
             [
                 {
                     "title": i.title,
-                    "value": i.portrait_large.url if i.is_portrait else i.large.url,
+                    "value": rendition_file(
+                        i, "portrait_large" if i.is_portrait else "large"
+                    ).url,
                 }
                 for i in images
             ],
@@ -102,7 +102,7 @@ TEMPLATES = [
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
                 "commoncontent.apps.context_defaults",
-                "sitevars.context_processors.inject_sitevars",
+                "commoncontent.apps.inject_sitevars",
             ],
         },
     },
@@ -15,10 +15,8 @@ Including another URLconf
 """
 
 from commoncontent import views_optional as optional
-from commoncontent.sitemaps import sitemaps
 from django.conf import settings
 from django.contrib import admin
-from django.contrib.sitemaps.views import sitemap
 from django.urls import include, path
 
 urlpatterns = [
@@ -29,12 +27,6 @@ urlpatterns = [
     ),
     path("django_accounts/", include("django.contrib.auth.urls")),
     path("admin/", admin.site.urls),
-    path(
-        "sitemap.xml",
-        sitemap,
-        {"sitemaps": sitemaps},
-        name="django.contrib.sitemaps.views.sitemap",
-    ),
     path("", include("commoncontent.urls")),
 ]
 if settings.DEBUG:
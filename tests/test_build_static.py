@@ -0,0 +1,296 @@
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from sitevars.models import SiteVar
+
+from commoncontent.models import (
+    Article,
+    ArticleSeries,
+    Author,
+    HomePage,
+    Page,
+    Section,
+    Site,
+    Status,
+)
+from commoncontent.staticsite import fingerprint_tags, output_path, site_urls
+
+
+class TestBuildStatic(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.site = Site.objects.get_current()
+        SiteVar.objects.create(site=cls.site, name="paginate_by", value="2")
+        HomePage.objects.create(
+            site=cls.site,
+            admin_name="Home",
+            title="Static Home",
+            date_published=now - timedelta(days=1),
+        )
+        cls.section = Section.objects.create(
+            site=cls.site,
+            slug="news",
+            title="News",
+            date_published=now - timedelta(days=1),
+        )
+        cls.author = Author.objects.create(site=cls.site, name="Writer", slug="writer")
+        cls.series = ArticleSeries.objects.create(
+            site=cls.site, name="Series", slug="series"
+        )
+        for i in range(5):
+            Article.objects.create(
+                site=cls.site,
+                section=cls.section,
+                author=cls.author,
+                slug=f"article-{i}",
+                title=f"Article {i}",
+                date_published=now - timedelta(hours=i + 1),
+            )
+        Article.objects.create(
+            site=cls.site,
+            section=cls.section,
+            series=cls.series,
+            slug="in-series",
+            title="In Series",
+            date_published=now - timedelta(hours=10),
+        )
+        Article.objects.create(
+            site=cls.site,
+            section=cls.section,
+            slug="draft",
+            title="Draft",
+            status=Status.WITHHELD,
+            date_published=now - timedelta(hours=1),
+        )
+        Page.objects.create(
+            site=cls.site,
+            slug="about",
+            title="About",
+            date_published=now - timedelta(days=1),
+        )
+        cls.other_site = Site.objects.create(domain="other.example", name="Other")
+        HomePage.objects.create(
+            site=cls.other_site,
+            admin_name="Other Home",
+            title="Other Home",
+            date_published=now - timedelta(days=1),
+        )
+
+    def test_output_path(self):
+        self.assertEqual(output_path("/"), "index.html")
+        self.assertEqual(output_path("/news/"), "news/index.html")
+        self.assertEqual(output_path("/news/page_2.html"), "news/page_2.html")
+        self.assertEqual(output_path("/index.rss"), "index.rss")
+
+    def test_site_urls(self):
+        urls = list(site_urls(self.site))
+        self.assertEqual(len(urls), len(set(urls)))
+        for url in (
+            "/",
+            "/page_2.html",
+            "/page_3.html",
+            "/index.rss",
+            "/news/",
+            "/news/page_2.html",
+            "/news/index.rss",
+            "/author/",
+            "/author/writer/",
+            "/author/writer/page_2.html",
+            "/author/writer/index.rss",
+            "/news/article-0.html",
+            "/news/series/in-series.html",
+            "/news/series/",
+            "/about.html",
+            "/sitemap.xml",
+            "/sitemap-sections.xml",
+        ):
+            self.assertIn(url, urls)
+        self.assertNotIn("/page_4.html", urls)
+        self.assertNotIn("/author/writer/page_4.html", urls)
+        self.assertNotIn("/news/draft.html", urls)
+
+    @override_settings(COMMONCONTENT_PAGINATION="keyset")
+    def test_site_urls_keyset(self):
+        urls = list(site_urls(self.site))
+        self.assertNotIn("/page_2.html", urls)
+        self.assertNotIn("/news/page_2.html", urls)
+        home_pages = [u for u in urls if u.startswith("/page_")]
+        self.assertEqual(len(home_pages), 2)
+        # Every cursor URL is one the rendered pages link to
+        for url in home_pages + ["/"]:
+            page = self.client.get(url).context["page_obj"]
+            if page.has_next():
+                self.assertIn(f"/page_{page.next_cursor}.html", urls)
+
+    def test_build(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out = StringIO()
+            call_command("build_static", tmp, jobs=1, batch_size=3, stdout=out)
+            root = Path(tmp) / self.site.domain
+            for url in site_urls(self.site):
+                self.assertTrue((root / output_path(url)).exists(), url)
+            self.assertIn("Static Home", (root / "index.html").read_text())
+            self.assertIn("Article 2", (root / "page_2.html").read_text())
+            self.assertIn("<rss", (root / "index.rss").read_text())
+            self.assertIn(
+                'http-equiv="refresh"', (root / "news/series/index.html").read_text()
+            )
+            self.assertFalse((root / "news/draft.html").exists())
+
+            # Each site is rendered with its own content
+            other = Path(tmp) / self.other_site.domain / "index.html"
+            self.assertIn("Other Home", other.read_text())
+            self.assertIn("Rendered", out.getvalue())
+
+    def test_build_one_site(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            call_command(
+                "build_static", tmp, sites=["other.example"], jobs=1, stdout=StringIO()
+            )
+            self.assertEqual(
+                [p.name for p in Path(tmp).iterdir()], [self.other_site.domain]
+            )
+
+
+class TestIncrementalBuild(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.site = Site.objects.get_current()
+        HomePage.objects.create(
+            site=cls.site,
+            admin_name="Home",
+            title="Static Home",
+            date_published=now - timedelta(days=1),
+        )
+        cls.section = Section.objects.create(
+            site=cls.site,
+            slug="news",
+            title="News",
+            date_published=now - timedelta(days=1),
+        )
+        cls.article = Article.objects.create(
+            site=cls.site,
+            section=cls.section,
+            slug="first",
+            title="First Article",
+            date_published=now - timedelta(hours=2),
+        )
+        cls.other = Article.objects.create(
+            site=cls.site,
+            section=cls.section,
+            slug="second",
+            title="Second Article",
+            date_published=now - timedelta(hours=1),
+        )
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output = Path(tmp.name)
+        self.root = self.output / self.site.domain
+
+    def build(self, **options):
+        call_command("build_static", self.output, jobs=1, stdout=StringIO(), **options)
+
+    def mark(self, *paths):
+        "Overwrite output files, to detect which ones the next build renders again."
+        for path in paths:
+            (self.root / path).write_text("UNCHANGED")
+
+    def is_marked(self, path):
+        return (self.root / path).read_text() == "UNCHANGED"
+
+    def test_unchanged_pages_are_skipped(self):
+        self.build()
+        self.mark("news/first.html", "news/second.html", "index.html")
+        self.build()
+        self.assertTrue(self.is_marked("news/first.html"))
+        self.assertTrue(self.is_marked("news/second.html"))
+        self.assertTrue(self.is_marked("index.html"))
+
+    def test_changed_article_is_rendered(self):
+        self.build()
+        self.mark("news/first.html", "news/second.html", "index.html", "news/index.rss")
+        self.article.body = "<p>Fixed a typo</p>"
+        self.article.save()
+        self.build()
+        self.assertIn("Fixed a typo", (self.root / "news/first.html").read_text())
+        # Lists and feeds displaying the article
+        self.assertFalse(self.is_marked("index.html"))
+        self.assertFalse(self.is_marked("news/index.rss"))
+        self.assertTrue(self.is_marked("news/second.html"))
+
+    def test_tag_change_is_rendered(self):
+        self.build()
+        self.mark("news/first.html", "news/second.html")
+        self.article.tags.add("freshtag")
+        self.build()
+        self.assertIn("freshtag", (self.root / "news/first.html").read_text())
+        self.assertTrue(self.is_marked("news/second.html"))
+
+    def test_series_change_is_rendered(self):
+        series = ArticleSeries.objects.create(site=self.site, name="One", slug="one")
+        self.article.series = series
+        self.article.save()
+        self.build()
+        page = "news/one/first.html"
+        self.mark(page)
+        self.other.series = series
+        self.other.save()
+        self.build()
+        self.assertIn("/news/one/second.html", (self.root / page).read_text())
+
+        self.mark(page)
+        self.other.title = "Second Part"
+        self.other.save()
+        self.build()
+        self.assertIn("Second Part", (self.root / page).read_text())
+
+        self.mark(page)
+        self.other.series = None
+        self.other.save()
+        self.build()
+        self.assertNotIn("/news/one/second.html", (self.root / page).read_text())
+
+    def test_sitevar_change_renders_site(self):
+        self.build()
+        self.mark("news/first.html", "news/second.html")
+        SiteVar.objects.create(
+            site=self.site, name="copyright_notice", value="{} Custom Notice"
+        )
+        self.build()
+        self.assertFalse(self.is_marked("news/first.html"))
+        self.assertFalse(self.is_marked("news/second.html"))
+
+    def test_withdrawn_page_is_removed(self):
+        self.build()
+        self.other.status = Status.WITHHELD
+        self.other.save()
+        self.build()
+        self.assertFalse((self.root / "news/second.html").exists())
+        self.assertNotIn("Second Article", (self.root / "index.html").read_text())
+
+    def test_full_build(self):
+        self.build()
+        self.mark("news/first.html")
+        self.build(full=True)
+        self.assertFalse(self.is_marked("news/first.html"))
+
+    def test_fingerprints(self):
+        tags = [f"article:{self.article.pk}", f"articles:{self.site.pk}", "custom:1"]
+        before = fingerprint_tags(tags)
+        self.assertEqual(set(before), set(tags[:2]))
+        Article.objects.filter(pk=self.other.pk).update(body="<p>Not listed</p>")
+        self.assertEqual(fingerprint_tags(tags), before)
+        self.article.title = "Retitled"
+        self.article.save()
+        after = fingerprint_tags(tags)
+        self.assertNotEqual(after[tags[0]], before[tags[0]])
+        self.assertNotEqual(after[tags[1]], before[tags[1]])
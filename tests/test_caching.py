@@ -0,0 +1,445 @@
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from sitevars.models import SiteVar
+
+from commoncontent.caching import (
+    begin_request,
+    dependency_tags,
+    end_request,
+    forget_site_vars,
+    get_tag_versions,
+    invalidate_tags,
+    invalidation_tags,
+    next_transition,
+    page_cache_key,
+    site_cache_timeout,
+    site_vars,
+)
+from commoncontent.models import (
+    Article,
+    ArticleSeries,
+    Author,
+    HomePage,
+    Page,
+    Section,
+    Site,
+)
+
+
+class TestDependencyTags(TestCase):
+    def test_article_dependencies(self):
+        site = Site.objects.get_current()
+        section = Section.objects.create(
+            site=site, slug="s", title="S", date_published=timezone.now()
+        )
+        author = Author.objects.create(site=site, name="A", slug="a")
+        article = Article.objects.create(
+            site=site, section=section, author=author, slug="a", title="A"
+        )
+        self.assertEqual(
+            dependency_tags(article),
+            {
+                f"site:{site.pk}",
+                f"article:{article.pk}",
+                f"section:{section.pk}",
+                f"author:{author.pk}",
+            },
+        )
+        self.assertEqual(
+            invalidation_tags(article), {f"article:{article.pk}", f"articles:{site.pk}"}
+        )
+
+    def test_invalidate_tags_changes_versions(self):
+        versions = get_tag_versions(["test:1", "test:2"], create=True)
+        invalidate_tags(["test:1"])
+        current = get_tag_versions(["test:1", "test:2"])
+        self.assertNotEqual(current["test:1"], versions["test:1"])
+        self.assertEqual(current["test:2"], versions["test:2"])
+
+
+@override_settings(COMMONCONTENT_PAGE_CACHE=True)
+class TestPageCache(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.site = Site.objects.get_current()
+        cls.homepage = HomePage.objects.create(
+            site=cls.site,
+            admin_name="Home",
+            title="Home Page",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        cls.section = Section.objects.create(
+            site=cls.site,
+            slug="test-section",
+            title="Test Section",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        cls.article = Article.objects.create(
+            site=cls.site,
+            section=cls.section,
+            slug="test-article",
+            title="Test Article",
+            date_published=timezone.now() - timedelta(hours=1),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.article_url = reverse(
+            "article_page",
+            kwargs={"section_slug": "test-section", "article_slug": "test-article"},
+        )
+
+    def test_hit_costs_no_queries(self):
+        for url in (
+            self.article_url,
+            reverse("home_page"),
+            reverse("section_page", kwargs={"section_slug": "test-section"}),
+            reverse("site_feed"),
+        ):
+            with self.subTest(url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.client.get(url)
+                self.assertEqual(first.content, second.content)
+
+    @override_settings(COMMONCONTENT_CACHE_TAG_HEADER="Cache-Tag")
+    def test_feed_dependencies(self):
+        response = self.client.get(reverse("site_feed"))
+        self.assertIn(f"article:{self.article.pk}", response["Cache-Tag"].split(","))
+
+    @override_settings(COMMONCONTENT_PAGE_CACHE=False)
+    def test_disabled(self):
+        self.client.get(self.article_url)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(self.article_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreater(len(ctx.captured_queries), 0)
+
+    def test_article_change_invalidates_article_and_lists(self):
+        home = reverse("home_page")
+        self.client.get(self.article_url)
+        self.client.get(home)
+        self.article.title = "Retitled Article"
+        self.article.save()
+        self.assertContains(self.client.get(self.article_url), "Retitled Article")
+        self.assertContains(self.client.get(home), "Retitled Article")
+
+    def test_new_article_invalidates_feed(self):
+        self.client.get(reverse("site_feed"))
+        Article.objects.create(
+            site=self.site,
+            section=self.section,
+            slug="new-article",
+            title="Brand New Article",
+            date_published=timezone.now(),
+        )
+        self.assertContains(self.client.get(reverse("site_feed")), "Brand New Article")
+
+    def test_section_change_invalidates_menu_bearing_pages(self):
+        self.client.get(self.article_url)
+        Section.objects.create(
+            site=self.site,
+            slug="new-section",
+            title="Brand New Section",
+            date_published=timezone.now() - timedelta(hours=1),
+        )
+        self.assertContains(self.client.get(self.article_url), "Brand New Section")
+
+    def test_article_leaving_series_invalidates_series(self):
+        series = ArticleSeries.objects.create(site=self.site, name="One", slug="one")
+        self.article.series = series
+        self.article.save()
+        two = Article.objects.create(
+            site=self.site,
+            section=self.section,
+            series=series,
+            slug="two",
+            title="Part Two",
+            date_published=timezone.now() - timedelta(hours=1),
+        )
+        url = self.article.get_absolute_url()
+        self.assertContains(self.client.get(url), "Part Two")
+        two.series = None
+        two.save()
+        self.assertNotContains(self.client.get(url), "Part Two")
+
+    def test_moved_article_invalidates_both_sections(self):
+        other = Section.objects.create(
+            site=self.site,
+            slug="other",
+            title="Other",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        article = Article.objects.get(pk=self.article.pk)
+        article.section = other
+        self.assertLessEqual(
+            {f"section:{self.section.pk}", f"section:{other.pk}"},
+            invalidation_tags(article),
+        )
+        article.save()
+        self.assertNotIn(f"section:{self.section.pk}", invalidation_tags(article))
+
+    def test_sitevar_change_invalidates_pages(self):
+        self.client.get(self.article_url)
+        SiteVar.objects.create(
+            site=self.site, name="copyright_notice", value="{} Custom Notice"
+        )
+        self.assertContains(self.client.get(self.article_url), "Custom Notice")
+
+    def test_tag_change_invalidates_article(self):
+        self.client.get(self.article_url)
+        self.article.tags.add("freshtag")
+        self.assertContains(self.client.get(self.article_url), "freshtag")
+
+    def test_unrelated_article_change_keeps_article_cached(self):
+        self.client.get(self.article_url)
+        Article.objects.create(
+            site=self.site,
+            section=self.section,
+            slug="other-article",
+            title="Other Article",
+            date_published=timezone.now(),
+        )
+        with self.assertNumQueries(0):
+            self.client.get(self.article_url)
+
+
+class TestNextTransition(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.site = Site.objects.get_current()
+        cls.section = Section.objects.create(
+            site=cls.site,
+            slug="test-section",
+            title="Test Section",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_nothing_scheduled(self):
+        self.assertIsNone(next_transition(self.site.pk))
+        self.assertEqual(site_cache_timeout(self.site.pk, 3600), 3600)
+
+    def test_scheduled_publication_and_expiry(self):
+        now = timezone.now()
+        Article.objects.create(
+            site=self.site,
+            section=self.section,
+            slug="later",
+            title="Later",
+            date_published=now + timedelta(hours=2),
+        )
+        expiring = Page.objects.create(
+            site=self.site,
+            slug="expiring",
+            title="Expiring",
+            date_published=now - timedelta(hours=2),
+            expires=now + timedelta(hours=1),
+        )
+        self.assertEqual(next_transition(self.site.pk), expiring.expires)
+        timeout = site_cache_timeout(self.site.pk, 86400)
+        self.assertLessEqual(timeout, 3600)
+        self.assertGreater(timeout, 3500)
+
+    def test_withheld_content_is_ignored(self):
+        Article.objects.create(
+            site=self.site,
+            section=self.section,
+            slug="withdrawn",
+            title="Withdrawn",
+            status="withheld",
+            date_published=timezone.now() + timedelta(hours=2),
+        )
+        self.assertIsNone(next_transition(self.site.pk))
+
+    def test_cached_index_invalidated_by_new_content(self):
+        self.assertIsNone(next_transition(self.site.pk))
+        with self.assertNumQueries(0):
+            self.assertIsNone(next_transition(self.site.pk))
+        article = Article.objects.create(
+            site=self.site,
+            section=self.section,
+            slug="later",
+            title="Later",
+            date_published=timezone.now() + timedelta(hours=2),
+        )
+        self.assertEqual(next_transition(self.site.pk), article.date_published)
+
+    @override_settings(COMMONCONTENT_PAGE_CACHE=True)
+    def test_page_cache_expires_at_publication(self):
+        Article.objects.create(
+            site=self.site,
+            section=self.section,
+            slug="later",
+            title="Later",
+            date_published=timezone.now() + timedelta(minutes=5),
+        )
+        url = reverse("section_page", kwargs={"section_slug": "test-section"})
+        resp = self.client.get(url)
+        self.assertNotContains(resp, "Later")
+        key = page_cache_key(resp.wsgi_request)
+        remaining = cache._expire_info[cache.make_key(key)] - time.time()
+        self.assertLessEqual(remaining, 300)
+
+
+class TestSiteVars(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.site = Site.objects.get_current()
+        SiteVar.objects.create(site=cls.site, name="brand", value="Brand One")
+        SiteVar.objects.create(site=cls.site, name="default_icon", value="star")
+        HomePage.objects.create(
+            site=cls.site,
+            admin_name="Home",
+            title="Home",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        section = Section.objects.create(
+            site=cls.site,
+            slug="news",
+            title="News",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        for i in range(3):
+            Article.objects.create(
+                site=cls.site,
+                section=section,
+                slug=f"article-{i}",
+                title=f"Article {i}",
+                date_published=timezone.now() - timedelta(hours=i + 1),
+            )
+
+    def setUp(self):
+        cache.clear()
+        forget_site_vars(self.site.pk)
+        self.addCleanup(forget_site_vars, self.site.pk)
+
+    def sitevar_queries(self, ctx):
+        return [q for q in ctx.captured_queries if "sitevars_sitevar" in q["sql"]]
+
+    def test_one_query_per_request(self):
+        for url in ("/news/article-0.html", "/news/", "/index.rss"):
+            with self.subTest(url):
+                with CaptureQueriesContext(connection) as ctx:
+                    self.client.get(url)
+                self.assertEqual(len(self.sitevar_queries(ctx)), 1)
+
+    def test_get_value(self):
+        values = site_vars(self.site)
+        self.assertEqual(values.get_value("brand"), "Brand One")
+        self.assertEqual(values.get_value("missing"), "")
+        self.assertEqual(values.get_value("missing", "5", asa=int), 5)
+        self.assertIsNone(values.get_value("missing", None, asa=int))
+
+    def test_request_snapshot_sees_changes(self):
+        begin_request()
+        self.addCleanup(end_request)
+        self.assertEqual(site_vars(self.site.pk).get_value("brand"), "Brand One")
+        with self.assertNumQueries(0):
+            site_vars(self.site).get_value("default_icon")
+        SiteVar.objects.filter(name="brand").get().delete()
+        self.assertEqual(site_vars(self.site).get_value("brand"), "")
+
+    def test_outside_request_reads_current_values(self):
+        self.assertEqual(site_vars(self.site).get_value("brand"), "Brand One")
+        SiteVar.objects.filter(name="brand").update(value="Brand Two")
+        self.assertEqual(site_vars(self.site).get_value("brand"), "Brand Two")
+
+    @override_settings(COMMONCONTENT_SITEVARS_CACHE=True)
+    def test_process_cache(self):
+        site_vars(self.site)
+        with self.assertNumQueries(0):
+            self.assertEqual(site_vars(self.site).get_value("brand"), "Brand One")
+        SiteVar.objects.create(site=self.site, name="tagline", value="Hello")
+        self.assertEqual(site_vars(self.site).get_value("tagline"), "Hello")
+
+        # Another process changed the vars, and the site's tag
+        SiteVar.objects.filter(name="brand").update(value="Brand Two")
+        self.assertEqual(site_vars(self.site).get_value("brand"), "Brand One")
+        invalidate_tags([f"site:{self.site.pk}"])
+        self.assertEqual(site_vars(self.site).get_value("brand"), "Brand Two")
+
+
+@override_settings(COMMONCONTENT_CONDITIONAL_GET=True)
+class TestConditionalGet(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.site = Site.objects.get_current()
+        HomePage.objects.create(
+            site=cls.site,
+            admin_name="Home",
+            title="Home Page",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        section = Section.objects.create(
+            site=cls.site,
+            slug="news",
+            title="News",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        cls.article = Article.objects.create(
+            site=cls.site,
+            section=section,
+            slug="story",
+            title="Story",
+            date_published=timezone.now() - timedelta(hours=1),
+        )
+        cls.urls = ("/news/story.html", "/news/", "/", "/index.rss", "/news/index.rss")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url):
+                first = self.client.get(url)
+                etag = first["ETag"]
+                self.assertTrue(first.has_header("Last-Modified"))
+                with self.assertNumQueries(0):
+                    resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(resp.status_code, 304)
+                self.assertEqual(resp["ETag"], etag)
+                resp = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]
+                )
+                self.assertEqual(resp.status_code, 304)
+                resp = self.client.get(url, HTTP_IF_NONE_MATCH='"other"')
+                self.assertEqual(resp.status_code, 200)
+
+    def test_change_renders_page(self):
+        first = self.client.get("/news/story.html")
+        self.article.title = "New Title"
+        self.article.save()
+        resp = self.client.get("/news/story.html", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], first["ETag"])
+
+    def test_unchanged_content_keeps_last_modified(self):
+        first = self.client.get("/news/story.html")
+        time.sleep(1)
+        invalidate_tags([f"article:{self.article.pk}"])
+        resp = self.client.get("/news/story.html", HTTP_IF_NONE_MATCH=first["ETag"])
+        # Rendered again, but identical
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["ETag"], first["ETag"])
+        self.assertEqual(resp["Last-Modified"], first["Last-Modified"])
+
+    @override_settings(COMMONCONTENT_CONDITIONAL_GET=False)
+    def test_disabled(self):
+        self.assertFalse(self.client.get("/news/story.html").has_header("ETag"))
+
+    @override_settings(COMMONCONTENT_PAGE_CACHE=True)
+    def test_cached_pages_have_validators(self):
+        first = self.client.get("/news/")
+        with self.assertNumQueries(0):
+            second = self.client.get("/news/")
+        self.assertEqual(second["ETag"], first["ETag"])
@@ -1,9 +1,24 @@
+import shutil
+import tempfile
+from io import StringIO
 from pathlib import Path
 
 from django.core.management import call_command
 from django.test import TestCase
+from mistletoe import Document, block_token, span_token
+from mistletoe.contrib.pygments_renderer import PygmentsRenderer
+from taggit.models import Tag
 
-from commoncontent.models import Article, Section, Site
+from commoncontent.caching import get_tag_versions
+from commoncontent import markdown_import
+from commoncontent.markdown_import import (
+    configure_highlight_cache,
+    iter_markdown_files,
+    render_markdown,
+)
+from commoncontent.common import Status
+from commoncontent.management.commands import import_markdown
+from commoncontent.models import Article, ImportedFile, Section, Site
 
 base_path = Path(__file__).resolve().parent
 
@@ -108,3 +123,227 @@ class TestImportMarkdownCommand(TestCase):
         venenatis malesuada ut sit amet odio. Vivamus nec dictum elit, eget gravida ex.</p>
         """
         self.assertHTMLEqual(article.body, expected)
+
+
+class TestBulkImport(TestCase):
+    files = [
+        str(base_path / "test_import_markdown_with_frontmatter.md"),
+        str(base_path / "test_import_markdown_no_frontmatter.md"),
+    ]
+
+    def test_batches(self):
+        versions = get_tag_versions(["articles:1"], create=True)
+        out = StringIO()
+        call_command(
+            "import_markdown", "News", *self.files, batch_size=1, jobs=1, stdout=out
+        )
+        self.assertIn("Imported 2 articles", out.getvalue())
+        self.assertEqual(Article.objects.count(), 2)
+        article = Article.objects.get(slug="test_import_markdown_with_frontmatter")
+        self.assertEqual(
+            sorted(article.tags.names()), ["bash", "cli", "linux", "shell"]
+        )
+        # Excerpts are stored, although bulk_create() does not call save()
+        self.assertTrue(article._excerpt_is_current())
+        # Cached article lists are invalidated
+        self.assertNotEqual(get_tag_versions(["articles:1"]), versions)
+
+    def test_parallel_parsing(self):
+        command = import_markdown.Command()
+        command.parse_chunk_size = 1
+        call_command(command, "News", *self.files, jobs=2, stdout=StringIO())
+        self.assertEqual(
+            sorted(Article.objects.values_list("title", flat=True)),
+            ["A Markdown File with No Front Matter", "Test Article with Front Matter"],
+        )
+
+    def test_existing_tags(self):
+        linux = Tag.objects.create(name="linux")
+        # Same slug as the "cli" tag in the file
+        Tag.objects.create(name="CLI", slug="cli")
+        call_command(
+            "import_markdown", "News", self.files[0], jobs=1, stdout=StringIO()
+        )
+        article = Article.objects.get()
+        self.assertIn(linux, article.tags.all())
+        self.assertEqual(Tag.objects.count(), 5)
+        self.assertNotEqual(Tag.objects.get(name="cli").slug, "cli")
+
+    def test_render_resets_tokens(self):
+        "Rendering must not leave tokens in mistletoe's global token lists."
+        spans = list(span_token._token_types)
+        blocks = list(block_token._token_types)
+        html, title = render_markdown("# Title\n\nSome <b>HTML</b>", extract_title=True)
+        self.assertEqual(title, "Title")
+        self.assertHTMLEqual(html, "<p>Some <b>HTML</b></p>")
+        self.assertEqual(span_token._token_types, spans)
+        self.assertEqual(block_token._token_types, blocks)
+
+
+class TestReimport(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        for name in ("with_frontmatter", "no_frontmatter"):
+            shutil.copy(base_path / f"test_import_markdown_{name}.md", self.dir)
+        self.with_frontmatter = self.dir / "test_import_markdown_with_frontmatter.md"
+        self.no_frontmatter = self.dir / "test_import_markdown_no_frontmatter.md"
+
+    def run_import(self, *files, **options):
+        out = StringIO()
+        files = files or (self.with_frontmatter, self.no_frontmatter)
+        call_command(
+            "import_markdown", "News", *map(str, files), jobs=1, stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_unchanged_files_are_skipped(self):
+        self.run_import()
+        self.assertEqual(ImportedFile.objects.count(), 2)
+        out = self.run_import(update=True)
+        self.assertIn("0 created, 0 updated, 2 skipped", out)
+        self.assertEqual(Article.objects.count(), 2)
+
+    def test_changed_files_are_updated(self):
+        self.run_import()
+        published = Article.objects.get(slug=self.no_frontmatter.stem).date_published
+        self.with_frontmatter.write_text(
+            self.with_frontmatter.read_text().replace("  - bash\n", "")
+        )
+        self.no_frontmatter.write_text("# New Title\n\nNew body.\n")
+
+        # Without --update, existing Articles are not changed
+        self.assertIn("2 skipped", self.run_import())
+        out = self.run_import(update=True)
+        self.assertIn("0 created, 2 updated, 0 skipped", out)
+        self.assertEqual(Article.objects.count(), 2)
+        article = Article.objects.get(slug=self.with_frontmatter.stem)
+        self.assertEqual(sorted(article.tags.names()), ["cli", "linux", "shell"])
+        article = Article.objects.get(slug=self.no_frontmatter.stem)
+        self.assertEqual(article.title, "New Title")
+        self.assertHTMLEqual(article.body, "<p>New body.</p>")
+        self.assertEqual(article.excerpt, article.body)
+        # The file has no date, so the publish date is kept
+        self.assertEqual(article.date_published, published)
+
+    def test_withdraw_missing(self):
+        self.run_import()
+        out = self.run_import(self.with_frontmatter, withdraw_missing=True)
+        self.assertIn("1 withdrawn", out)
+        article = Article.objects.get(slug=self.no_frontmatter.stem)
+        self.assertEqual(article.status, Status.CANCELLED)
+
+        # Restoring the file publishes the Article again
+        out = self.run_import(update=True, withdraw_missing=True)
+        self.assertIn("1 updated, 1 skipped, 0 withdrawn", out)
+        article.refresh_from_db()
+        self.assertEqual(article.status, Status.USABLE)
+
+    def test_duplicate_slugs(self):
+        other = self.dir / "other"
+        other.mkdir()
+        shutil.copy(self.no_frontmatter, other)
+        err = StringIO()
+        call_command(
+            "import_markdown",
+            "News",
+            str(self.no_frontmatter),
+            str(other / self.no_frontmatter.name),
+            jobs=1,
+            stdout=StringIO(),
+            stderr=err,
+        )
+        self.assertEqual(Article.objects.count(), 1)
+        self.assertIn("another file has its slug", err.getvalue())
+
+
+class TestDirectories(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        (self.dir / "2024" / "bundle").mkdir(parents=True)
+        (self.dir / ".git").mkdir()
+        (self.dir / "_posts").mkdir()
+        for path in (
+            "first.md",
+            "2024/second.markdown",
+            "2024/bundle/index.md",
+            "_posts/post.md",
+            # Not imported
+            "_index.md",
+            "_posts/_index.md",
+            ".git/third.md",
+            "2024/notes.txt",
+        ):
+            (self.dir / path).write_text(f"# {path}\n\nBody of {path}.\n")
+
+    def test_iter_markdown_files(self):
+        expected = [
+            self.dir / "2024/bundle/index.md",
+            self.dir / "2024/second.markdown",
+            self.dir / "_posts/post.md",
+            self.dir / "first.md",
+        ]
+        self.assertEqual(list(iter_markdown_files([self.dir])), expected)
+        pattern = self.dir / "**" / "*.md"
+        self.assertEqual(
+            sorted(iter_markdown_files([pattern])),
+            [
+                self.dir / "2024/bundle/index.md",
+                self.dir / "_posts/post.md",
+                self.dir / "first.md",
+            ],
+        )
+        # Directories and other files matching a pattern are skipped
+        pattern = self.dir / "**"
+        self.assertEqual(sorted(iter_markdown_files([pattern])), expected)
+
+    def test_import_directory(self):
+        out = StringIO()
+        call_command(
+            "import_markdown", "News", str(self.dir), batch_size=2, jobs=1, stdout=out
+        )
+        self.assertEqual(
+            sorted(Article.objects.values_list("slug", flat=True)),
+            ["bundle", "first", "post", "second"],
+        )
+        out = out.getvalue()
+        self.assertIn("2/4 files (50%)", out)
+        self.assertIn("Imported 4 articles", out)
+        self.assertRegex(out, r"Time per stage.*: read .*s, yaml .*s, markdown .*s")
+
+
+class TestHighlightCache(TestCase):
+    code = "Config:\n\n```python\nDEBUG = True\n```\n"
+
+    def setUp(self):
+        self.addCleanup(configure_highlight_cache)
+        configure_highlight_cache()
+
+    def test_cached_blocks_are_unchanged(self):
+        with PygmentsRenderer() as renderer:
+            expected = renderer.render(Document(self.code))
+        self.assertEqual(render_markdown(self.code)[0], expected)
+        self.assertEqual(markdown_import.highlight_cache.misses, 1)
+        self.assertEqual(render_markdown(self.code)[0], expected)
+        self.assertEqual(markdown_import.highlight_cache.hits, 1)
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            configure_highlight_cache(tmp)
+            html = render_markdown(self.code)[0]
+            # A new process starts with an empty memory cache
+            configure_highlight_cache(tmp)
+            self.assertEqual(render_markdown(self.code)[0], html)
+            self.assertEqual(markdown_import.highlight_cache.hits, 1)
+            self.assertEqual(markdown_import.highlight_cache.misses, 0)
+
+    def test_import_reports_cached_blocks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ("one", "two"):
+                (Path(tmp) / f"{name}.md").write_text(f"# {name}\n\n{self.code}")
+            out = StringIO()
+            call_command("import_markdown", "News", tmp, jobs=1, stdout=out)
+        self.assertIn("Highlighted 2 code blocks, 1 from the cache", out.getvalue())
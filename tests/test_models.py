@@ -1,6 +1,8 @@
 from datetime import datetime
+from io import StringIO
 from unittest import mock
 
+from django.core.management import call_command
 from django.test import TestCase as DjangoTestCase
 from django.test import override_settings
 from django.urls import reverse
@@ -140,6 +142,56 @@ class TestModels(DjangoTestCase):
             self.assertHTMLEqual(page.excerpt, expected)
 
 
+class TestStoredExcerpt(DjangoTestCase):
+    def setUp(self):
+        self.page = Page.objects.create(
+            title="Test Page",
+            slug="test-page",
+            site=Site.objects.get(id=1),
+            date_published=timezone.now(),
+            body="""<p>First paragraph.</p>
+            <!-- pagebreak --><span id=continue-reading></span>
+            <p>Second paragraph.</p>""",
+        )
+
+    def test_excerpt_stored_on_save(self):
+        self.assertIn("First paragraph.", self.page.stored_excerpt)
+        self.assertNotIn("Second paragraph.", self.page.stored_excerpt)
+        self.assertTrue(self.page.stored_has_excerpt)
+        page = Page.objects.get(pk=self.page.pk)
+        with mock.patch("commoncontent.models.truncatewords_html") as truncate:
+            self.assertEqual(page.excerpt, self.page.stored_excerpt)
+            self.assertTrue(page.has_excerpt)
+        truncate.assert_not_called()
+
+    def test_excerpt_updated_with_body(self):
+        self.page.body = "<p>Replaced.</p>"
+        self.page.save(update_fields=["body"])
+        page = Page.objects.get(pk=self.page.pk)
+        self.assertEqual(page.stored_excerpt, "<p>Replaced.</p>")
+        self.assertFalse(page.has_excerpt)
+
+    def test_settings_change_ignores_stored_excerpt(self):
+        with override_settings(COMMONCONTENT_EXCERPT_MAX_WORDS=1):
+            page = Page.objects.get(pk=self.page.pk)
+            self.assertHTMLEqual(page.excerpt, "<p>First …</p>")
+
+    def test_deferred_excerpt_fields(self):
+        page = Page.objects.defer(*Page.EXCERPT_FIELDS).get(pk=self.page.pk)
+        with self.assertNumQueries(0):
+            self.assertIn("First paragraph.", page.excerpt)
+            self.assertTrue(page.has_excerpt)
+
+    def test_refresh_excerpts(self):
+        Page.objects.filter(pk=self.page.pk).update(excerpt_version="")
+        with override_settings(COMMONCONTENT_EXCERPT_MAX_WORDS=1):
+            call_command("refresh_excerpts", stdout=StringIO())
+            page = Page.objects.get(pk=self.page.pk)
+            with mock.patch("commoncontent.models.truncatewords_html") as truncate:
+                self.assertHTMLEqual(page.excerpt, "<p>First …</p>")
+            truncate.assert_not_called()
+
+
 def upload_to_target_for_test(instance, filename):
     return "arf.jpg"
 
@@ -0,0 +1,175 @@
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from sitevars.models import SiteVar
+
+from commoncontent.models import Article, HomePage, Section, Site
+from commoncontent.purge import HTTPPurgeBackend, purge_tags
+
+
+class TestCacheTagHeader(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.site = Site.objects.get_current()
+        HomePage.objects.create(
+            site=cls.site,
+            admin_name="Home",
+            title="Home Page",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        cls.section = Section.objects.create(
+            site=cls.site,
+            slug="news",
+            title="News",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        cls.article = Article.objects.create(
+            site=cls.site,
+            section=cls.section,
+            slug="story",
+            title="Story",
+            date_published=timezone.now() - timedelta(hours=1),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_no_header_by_default(self):
+        resp = self.client.get("/news/story.html")
+        self.assertFalse(resp.has_header("Cache-Tag"))
+
+    @override_settings(COMMONCONTENT_CACHE_TAG_HEADER="Cache-Tag")
+    def test_header_lists_dependencies(self):
+        for url in ("/news/story.html", "/news/", "/index.rss"):
+            with self.subTest(url):
+                tags = self.client.get(url)["Cache-Tag"].split(",")
+                self.assertIn(f"article:{self.article.pk}", tags)
+                self.assertIn(f"site:{self.site.pk}", tags)
+        tags = self.client.get("/news/")["Cache-Tag"].split(",")
+        self.assertIn(f"section:{self.section.pk}", tags)
+
+    @override_settings(
+        COMMONCONTENT_CACHE_TAG_HEADER="Surrogate-Key", COMMONCONTENT_PAGE_CACHE=True
+    )
+    def test_surrogate_key_header(self):
+        first = self.client.get("/news/story.html")
+        self.assertIn(f"article:{self.article.pk} ", first["Surrogate-Key"])
+        # Cached pages keep the header
+        second = self.client.get("/news/story.html")
+        self.assertEqual(second["Surrogate-Key"], first["Surrogate-Key"])
+
+    @override_settings(
+        COMMONCONTENT_CACHE_TAG_HEADER="Cache-Tag", COMMONCONTENT_PAGE_CACHE=True
+    )
+    def test_shared_max_age_ends_at_next_transition(self):
+        self.assertNotIn("s-maxage", self.client.get("/news/").get("Cache-Control", ""))
+        Article.objects.create(
+            site=self.site,
+            section=self.section,
+            slug="scheduled",
+            title="Scheduled",
+            date_published=timezone.now() + timedelta(minutes=10),
+        )
+        for _ in range(2):  # Rendered, then from the page cache
+            cache_control = self.client.get("/news/")["Cache-Control"]
+            max_age = int(cache_control.partition("s-maxage=")[2].split(",")[0])
+            self.assertTrue(0 < max_age <= 600, cache_control)
+
+
+class TestPurgeBackends(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.site = Site.objects.get_current()
+        cls.section = Section.objects.create(
+            site=cls.site,
+            slug="news",
+            title="News",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.log = Path(tmp.name) / "purged.jsonl"
+        settings = override_settings(
+            COMMONCONTENT_PURGE_BACKEND={
+                "BACKEND": "commoncontent.purge.FilePurgeBackend",
+                "OPTIONS": {"path": self.log},
+            }
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def purged(self):
+        if not self.log.exists():
+            return []
+        return [json.loads(line) for line in self.log.read_text().splitlines()]
+
+    def test_purge_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            article = Article.objects.create(
+                site=self.site, section=self.section, slug="a", title="A"
+            )
+            self.assertEqual(self.purged(), [])
+        self.assertEqual(
+            self.purged(),
+            [sorted({f"article:{article.pk}", f"articles:{self.site.pk}"})],
+        )
+
+    def test_sitevar_change_purges_site(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            SiteVar.objects.create(site=self.site, name="brand", value="Brand")
+        self.assertEqual(self.purged(), [[f"site:{self.site.pk}"]])
+
+    @override_settings(COMMONCONTENT_PURGE_BACKEND=None)
+    def test_no_backend(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.section.save()
+        self.assertEqual(self.purged(), [])
+
+    @override_settings(
+        COMMONCONTENT_PURGE_BACKEND={
+            "BACKEND": "commoncontent.purge.HTTPPurgeBackend",
+            "OPTIONS": {"url": "https://cdn.invalid/purge", "background": False},
+        }
+    )
+    def test_errors_are_logged(self):
+        with patch("urllib.request.urlopen", side_effect=OSError("CDN down")):
+            with self.assertLogs("commoncontent.purge", "ERROR"):
+                purge_tags(["site:1"])
+
+    @override_settings(
+        COMMONCONTENT_PURGE_BACKEND={
+            "BACKEND": "commoncontent.purge.HTTPPurgeBackend",
+            "OPTIONS": {"url": "https://cdn.invalid/purge"},
+        }
+    )
+    def test_http_purge_in_background(self):
+        sent = threading.Event()
+        threads = []
+
+        def urlopen(request, timeout):
+            threads.append(threading.current_thread())
+            sent.set()
+            return MagicMock()
+
+        with patch("urllib.request.urlopen", side_effect=urlopen):
+            purge_tags(["site:1"])
+            self.assertTrue(sent.wait(5))
+        self.assertNotEqual(threads, [threading.current_thread()])
+
+    def test_http_request(self):
+        backend = HTTPPurgeBackend(
+            "https://cdn.invalid/purge", headers={"Authorization": "Bearer x"}
+        )
+        request = backend.request({"site:1", "article:2"})
+        self.assertEqual(request.get_method(), "POST")
+        self.assertEqual(request.get_header("Authorization"), "Bearer x")
+        self.assertEqual(json.loads(request.data), {"tags": ["article:2", "site:1"]})
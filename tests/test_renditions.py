@@ -0,0 +1,306 @@
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image as PILImage
+
+from commoncontent import renditions
+from commoncontent.models import Author, Image
+from commoncontent.renditions import (
+    BaseRenditionBackend,
+    MIME_TYPES,
+    generate_renditions,
+    rendition_file,
+    rendition_size,
+    rendition_variant,
+    rendition_variants,
+    responsive_formats,
+)
+
+enqueued = []
+# Files generated per rendition: itself and its responsive variants
+FILES = 1 + len(rendition_variants("small"))
+
+
+class RecordingBackend(BaseRenditionBackend):
+    def enqueue(self, images):
+        enqueued.append([image.pk for image in images])
+
+
+def image_content(width=160, height=90, name="test.png"):
+    img_io = BytesIO()
+    PILImage.new("RGB", (width, height)).save(img_io, format="PNG")
+    return ContentFile(img_io.getvalue(), name=name)
+
+
+def recorded(image):
+    "The names of the renditions in an Image's registry, without their variants."
+    return sorted(key for key in image.renditions if key.isidentifier())
+
+
+class RenditionTestMixin:
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media = Path(tmp.name)
+        settings = override_settings(
+            MEDIA_ROOT=self.media,
+            COMMONCONTENT_RENDITIONS=("small", "medium", "portrait_small"),
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # imagekit caches whether rendition files exist
+        cache.clear()
+        enqueued.clear()
+
+    def rendition_exists(self, image, name):
+        return (self.media / getattr(image, name).name).exists()
+
+    def rendition_files(self):
+        return [path for path in (self.media / "CACHE").rglob("*") if path.is_file()]
+
+
+class RenditionTestCase(RenditionTestMixin, TestCase):
+    pass
+
+
+class TestEagerRenditions(RenditionTestCase):
+    @override_settings(
+        COMMONCONTENT_RENDITION_BACKEND={
+            "BACKEND": "commoncontent.renditions.SyncRenditionBackend"
+        }
+    )
+    def test_generated_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(title="New", image_file=image_content())
+            self.assertFalse(self.rendition_exists(image, "small"))
+        self.assertTrue(self.rendition_exists(image, "small"))
+        self.assertTrue(self.rendition_exists(image, "medium"))
+        self.assertFalse(self.rendition_exists(image, "large"))
+        image.refresh_from_db()
+        self.assertEqual(recorded(image), ["medium", "small"])
+
+    @override_settings(
+        COMMONCONTENT_RENDITION_BACKEND={"BACKEND": f"{__name__}.RecordingBackend"}
+    )
+    def test_enqueued_once_per_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(title="New", image_file=image_content())
+        self.assertEqual(enqueued, [[image.pk]])
+
+        # Editing other fields does not enqueue the image again
+        with self.captureOnCommitCallbacks(execute=True):
+            image.alt_text = "Changed"
+            image.save()
+        self.assertEqual(enqueued, [[image.pk]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.image_file = image_content(name="other.png")
+            image.save()
+        self.assertEqual(enqueued, [[image.pk], [image.pk]])
+
+    def test_orientation_policy(self):
+        landscape = Image.objects.create(title="Landscape", image_file=image_content())
+        self.assertEqual(generate_renditions(landscape), 2 * FILES)
+        self.assertFalse(self.rendition_exists(landscape, "portrait_small"))
+        portrait = Image.objects.create(
+            title="Portrait", image_file=image_content(90, 160)
+        )
+        self.assertEqual(generate_renditions(portrait), 3 * FILES)
+        self.assertTrue(self.rendition_exists(portrait, "portrait_small"))
+        # Unless requested
+        self.assertEqual(generate_renditions(landscape, ["portrait_small"]), FILES)
+        self.assertEqual(recorded(landscape), ["medium", "portrait_small", "small"])
+
+    @override_settings(
+        COMMONCONTENT_RENDITION_BACKEND={
+            "BACKEND": "commoncontent.renditions.SyncRenditionBackend"
+        }
+    )
+    def test_profile_images_get_portrait_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(title="New", image_file=image_content())
+        self.assertFalse(self.rendition_exists(image, "portrait_small"))
+        with self.captureOnCommitCallbacks(execute=True):
+            Author.objects.create(
+                site=image.site, name="Writer", slug="writer", profile_image=image
+            )
+        self.assertTrue(self.rendition_exists(image, "portrait_small"))
+
+    def test_existing_renditions_are_skipped(self):
+        image = Image.objects.create(title="New", image_file=image_content())
+        self.assertEqual(generate_renditions(image), 2 * FILES)
+        self.assertEqual(generate_renditions(image), 0)
+        self.assertEqual(generate_renditions(image, force=True), 2 * FILES)
+
+
+class TestResponsiveImages(RenditionTestCase):
+    def test_rendition_size(self):
+        names = ["large", "medium", "portrait_large", "portrait_small", "hd1080p"]
+        for size in [(160, 90), (90, 160), (3000, 500), (600, 601)]:
+            image = Image.objects.create(
+                title=f"{size}", image_file=image_content(*size)
+            )
+            for name in names:
+                for scale in (0.5, 1):
+                    with self.subTest(size=size, name=name, scale=scale):
+                        file = rendition_variant(image, name, scale)
+                        self.assertEqual(
+                            rendition_size(image, name, scale),
+                            (file.width, file.height),
+                        )
+
+    def test_rendition_size_without_image_size(self):
+        image = Image(title="New")
+        self.assertEqual(rendition_size(image, "medium"), (400, 225))
+        self.assertEqual(rendition_size(image, "portrait_small", 0.5), (45, 80))
+        # Resized to fit, the dimensions depend on those of the image
+        self.assertIsNone(rendition_size(image, "large"))
+
+    def test_rendition_tag(self):
+        image = Image.objects.create(title="New", image_file=image_content(90, 160))
+        html = Template(
+            "{% load commoncontent %}{% rendition img 'large' as large %}"
+            "{{ large.url }} {{ large.width }}x{{ large.height }}"
+        ).render(Context({"img": image}))
+        self.assertEqual(html, f"{image.large.url} 304x540")
+
+    def test_variant_formats(self):
+        image = Image.objects.create(title="New", image_file=image_content())
+        for format in responsive_formats():
+            file = rendition_variant(image, "medium", 0.5, format)
+            file.generate()
+            with PILImage.open(self.media / file.name) as img:
+                self.assertEqual(img.format, format)
+                self.assertEqual(img.size, (200, 112))
+
+    def test_responsive_image_tag(self):
+        image = Image.objects.create(
+            title="New", alt_text="A test", image_file=image_content()
+        )
+        template = Template(
+            '{% load commoncontent %}{% responsive_image img "medium" class="c" %}'
+        )
+        # Variants not generated in advance are not generated during the request
+        html = template.render(Context({"img": image}))
+        self.assertEqual(len(self.rendition_files()), 1)
+        self.assertNotIn("<source ", html)
+        self.assertNotIn("srcset=", html)
+        self.assertIn(f'src="{image.medium.url}"', html)
+
+        generate_renditions(image, ["medium"])
+        html = template.render(Context({"img": image}))
+        self.assertTrue(html.startswith("<picture><source "))
+        for format in responsive_formats():
+            self.assertIn(f'type="{MIME_TYPES[format]}"', html)
+            url = rendition_variant(image, "medium", 0.5, format).url
+            self.assertIn(f"{url} 200w, ", html)
+        self.assertIn(f'src="{image.medium.url}"', html)
+        self.assertIn('sizes="(max-width: 400px) 100vw, 400px"', html)
+        for attr in ['width="400"', 'height="225"', 'alt="A test"', 'class="c"']:
+            self.assertIn(f" {attr} ", html)
+
+    def test_registry(self):
+        image = Image.objects.create(title="New", image_file=image_content())
+        generate_renditions(image, ["medium"])
+        image.refresh_from_db()
+        self.assertEqual(len(image.renditions), FILES)
+        self.assertEqual(
+            image.renditions["medium@0.5x"],
+            {
+                "name": rendition_variant(image, "medium", 0.5).name,
+                "width": 200,
+                "height": 112,
+            },
+        )
+        self.assertEqual(
+            rendition_file(image, "medium", 0.5),
+            (rendition_variant(image, "medium", 0.5).url, 200, 112),
+        )
+
+        # Registered renditions are displayed without storage I/O: with their files
+        # and imagekit's cache of their existence gone, they are not generated again
+        for path in self.rendition_files():
+            path.unlink()
+        cache.clear()
+        html = Template(
+            '{% load commoncontent %}{% responsive_image img "medium" %}'
+        ).render(Context({"img": image}))
+        self.assertEqual(self.rendition_files(), [])
+        self.assertIn(f'src="{image.medium.url}"', html)
+        # Those not registered are generated on first use
+        self.assertEqual(rendition_file(image, "small").width, 160)
+        self.assertTrue(self.rendition_exists(image, "small"))
+
+    def test_registry_change_purges_image(self):
+        log = self.media / "purged.jsonl"
+        image = Image.objects.create(title="New", image_file=image_content())
+        with override_settings(
+            COMMONCONTENT_PURGE_BACKEND={
+                "BACKEND": "commoncontent.purge.FilePurgeBackend",
+                "OPTIONS": {"path": log},
+            }
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                generate_renditions(image, ["medium"])
+        self.assertEqual(log.read_text(), f'["image:{image.pk}"]\n')
+
+
+# The worker threads must see the Image in the database
+class TestThreadBackend(RenditionTestMixin, TransactionTestCase):
+    def test_thread_backend(self):
+        backend = renditions.get_rendition_backend()
+        self.assertIsInstance(backend, renditions.ThreadRenditionBackend)
+        # Enqueued when the transaction commits
+        image = Image.objects.create(title="New", image_file=image_content())
+        backend.executor.shutdown(wait=True)
+        renditions._backend = None
+        self.assertTrue(self.rendition_exists(image, "medium"))
+        # The worker updated its own copy of the Image
+        self.assertEqual(image.renditions, {})
+        image.refresh_from_db()
+        self.assertEqual(recorded(image), ["medium", "small"])
+
+    def test_backend_is_reused(self):
+        config = {
+            "BACKEND": "commoncontent.renditions.ThreadRenditionBackend",
+            "OPTIONS": {"max_workers": 1},
+        }
+        with override_settings(COMMONCONTENT_RENDITION_BACKEND=config):
+            backend = renditions.get_rendition_backend()
+            self.assertIs(renditions.get_rendition_backend(), backend)
+            self.assertEqual(backend.executor._max_workers, 1)
+        config = {**config, "OPTIONS": {"max_workers": 3}}
+        with override_settings(COMMONCONTENT_RENDITION_BACKEND=config):
+            self.assertEqual(
+                renditions.get_rendition_backend().executor._max_workers, 3
+            )
+
+
+@override_settings(COMMONCONTENT_RENDITION_BACKEND=None)
+class TestGenerateRenditionsCommand(RenditionTestCase):
+    def test_backfill(self):
+        images = [
+            Image.objects.create(title=f"Image {i}", image_file=image_content())
+            for i in range(3)
+        ]
+        out = StringIO()
+        call_command("generate_renditions", "--batch-size=2", stdout=out)
+        self.assertIn(
+            f"Generated {6 * FILES} rendition files of 3 images", out.getvalue()
+        )
+        for image in images:
+            self.assertTrue(self.rendition_exists(image, "small"))
+
+        out = StringIO()
+        call_command("generate_renditions", "--rendition=small", stdout=out)
+        self.assertIn("Generated 0 rendition files of 3 images", out.getvalue())
+
+    def test_unknown_rendition(self):
+        with self.assertRaises(CommandError):
+            call_command("generate_renditions", "--rendition=huge")
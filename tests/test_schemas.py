@@ -1,6 +1,8 @@
 import datetime
 import unittest
 
+from django.utils.html import json_script, mark_safe
+
 from commoncontent.schemas import (
     AudioProp,
     CreativeWorkSchema,
@@ -116,3 +118,21 @@ class TestThingSchema(unittest.TestCase):
             """ "@type": "Thing"}</script>"""
         )
         self.assertEqual(out, expected)
+
+    def test_field_names_per_class(self):
+        self.assertIn("name", ThingSchema._field_names())
+        self.assertNotIn("headline", ThingSchema._field_names())
+        self.assertIn("headline", CreativeWorkSchema._field_names())
+        self.assertIn("name", CreativeWorkSchema._field_names())
+
+    def test_thing_schema_escaping(self):
+        t = ThingSchema(
+            name="Tom & Jerry's <b>Show</b>",
+            description=mark_safe("<p>1 < 2</p>"),
+        )
+        # Same as json_script() would output
+        expected = json_script(t.safe_dict(), element_id="schema-data")
+        self.assertEqual(
+            str(t), expected.replace("application/json", "application/ld+json")
+        )
+        self.assertIn(r"Tom \u0026amp; Jerry\u0026#x27;s Show", str(t))
@@ -1,12 +1,23 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from unittest.mock import Mock
 
-from commoncontent.models import Menu, Page, Status
+from commoncontent.models import (
+    Article,
+    Author,
+    HomePage,
+    Link,
+    Menu,
+    Page,
+    Section,
+    Status,
+)
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.core.paginator import Paginator
 from django.template import Context, Template
 from django.test import RequestFactory, SimpleTestCase, override_settings
 from django.test import TestCase as DjangoTestCase
+from django.utils import timezone
 from sitevars.models import SiteVar
 
 
@@ -152,6 +163,52 @@ class TestMenuTags(DjangoTestCase):
         ).render(self.context)
         self.assertIn("SectionMenu", output)
 
+    def test_menu_links_resolved(self):
+        menu = Menu.objects.create(site=self.site, slug="footer", admin_name="Footer")
+        Link.objects.create(menu=menu, url="/about.html", title="About")
+        output = Template(
+            '{% load commoncontent %}{% menu "footer" as menu %}'
+            "{% for item in menu.links %}{{ item.url }} {{ item.title }} "
+            "{{ item.icon_name }}{% endfor %}"
+        ).render(self.context)
+        self.assertEqual(output, "/about.html About link-45deg")
+
+    def test_menu_links_keep_their_properties(self):
+        menu = Menu.objects.create(site=self.site, slug="footer", admin_name="Footer")
+        Link.objects.create(
+            menu=menu, url="/about.html", title="About", description="Who we are"
+        )
+        template = Template(
+            '{% load commoncontent %}{% menu "footer" as menu %}'
+            "{% for item in menu.links %}{{ item.title }}: {{ item.description }}"
+            "{% endfor %}"
+        )
+        # Links are Link objects, unless the menu is cached
+        self.assertEqual(template.render(self.context), "About: Who we are")
+        with self.settings(COMMONCONTENT_MENU_CACHE=True):
+            cache.clear()
+            self.assertEqual(template.render(self.context), "About: ")
+
+    def test_main_nav_links_resolved(self):
+        HomePage.objects.create(
+            site=self.site,
+            admin_name="Home",
+            title="Home Page",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        Section.objects.create(
+            site=self.site,
+            slug="news",
+            title="News",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        output = Template(
+            '{% load commoncontent %}{% menu "main-nav" as menu %}'
+            "{% for item in menu.links %}{{ item.get_absolute_url }} {{ item.title }};"
+            "{% endfor %}"
+        ).render(self.context)
+        self.assertEqual(output, "/ Home Page;/news/ News;")
+
     def test_menu_active_root_url(self):
         self.request.path = "/"
         output = Template('{% load commoncontent %}{% menu_active "/" %}').render(
@@ -193,3 +250,118 @@ class TestMenuTags(DjangoTestCase):
             '{% load commoncontent %}{% menu_aria_current "/section/" %}'
         ).render(self.context)
         self.assertEqual(output.strip(), "")
+
+
+@override_settings(COMMONCONTENT_MENU_CACHE=True)
+class TestMenuCache(DjangoTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.site = Site.objects.get(id=1)
+        HomePage.objects.create(
+            site=cls.site,
+            admin_name="Home",
+            title="Home Page",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        cls.section = Section.objects.create(
+            site=cls.site,
+            slug="news",
+            title="News",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, slug="main-nav"):
+        request = RequestFactory().get("/")
+        request.site = self.site
+        return Template(
+            '{% load commoncontent %}{% menu "' + slug + '" as menu %}'
+            "{% for item in menu.links %}{{ item.url }} {{ item.title }};{% endfor %}"
+        ).render(Context({"request": request}))
+
+    def test_cached_menu_costs_no_queries(self):
+        first = self.render()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(), first)
+
+    def test_section_change(self):
+        self.render()
+        self.section.title = "Latest News"
+        self.section.save()
+        self.assertIn("/news/ Latest News;", self.render())
+
+    def test_menu_replaces_section_menu(self):
+        self.render()
+        menu = Menu.objects.create(site=self.site, slug="main-nav", admin_name="Main")
+        self.assertEqual(self.render(), "")
+        Link.objects.create(menu=menu, url="/contact.html", title="Contact")
+        self.assertEqual(self.render(), "/contact.html Contact;")
+        with self.assertNumQueries(0):
+            self.render()
+
+    def test_missing_menu(self):
+        self.assertEqual(self.render("footer"), "")
+        menu = Menu.objects.create(site=self.site, slug="footer", admin_name="Footer")
+        Link.objects.create(menu=menu, url="/about.html", title="About")
+        self.assertEqual(self.render("footer"), "/about.html About;")
+
+
+@override_settings(COMMONCONTENT_METADATA_CACHE=True)
+class TestHeadMetadata(DjangoTestCase):
+    template = Template(
+        "{% load commoncontent %}{% head_metadata obj as head %}"
+        "{{ head.title }}|{{ head.opengraph }}|{{ head.schema }}"
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.site = Site.objects.get(id=1)
+        section = Section.objects.create(
+            site=cls.site,
+            slug="news",
+            title="News",
+            date_published=timezone.now() - timedelta(days=1),
+        )
+        cls.author = Author.objects.create(site=cls.site, name="Writer", slug="writer")
+        cls.article = Article.objects.create(
+            site=cls.site,
+            section=section,
+            author=cls.author,
+            slug="story",
+            title="Story",
+            date_published=timezone.now() - timedelta(hours=1),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self):
+        # A fresh instance, without related objects loaded
+        article = Article.objects.get(pk=self.article.pk)
+        return self.template.render(Context({"obj": article}))
+
+    def test_rendered_once(self):
+        first = self.render()
+        self.assertIn('<meta property="og:title" content="Story" />', first)
+        self.assertIn("application/ld+json", first)
+        article = Article.objects.get(pk=self.article.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.template.render(Context({"obj": article})), first)
+        with override_settings(COMMONCONTENT_METADATA_CACHE=False):
+            self.assertEqual(self.render(), first)
+
+    def test_changes(self):
+        self.render()
+        self.article.tags.add("fresh")
+        self.assertIn('content="fresh"', self.render())
+        self.author.name = "Renamed"
+        self.author.save()
+        self.assertIn("Renamed", self.render())
+        self.article.title = "New Title"
+        self.article.save()
+        self.assertIn("New Title|", self.render())
+
+    def test_no_object(self):
+        self.assertEqual(self.template.render(Context({})), "||")
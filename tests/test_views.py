@@ -1,11 +1,16 @@
+import gzip
 import json
-from datetime import timedelta
+from datetime import datetime, timedelta
 from io import BytesIO
+from unittest.mock import patch
 
 from django.apps import apps
+from django.core.cache import cache
 from django.core.files.base import ContentFile
+from django.db import connection
 from django.http import HttpResponseNotFound
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from PIL import Image as PILImage
@@ -22,7 +27,7 @@ from commoncontent.models import (
     Site,
     Status,
 )
-from commoncontent.sitemaps import ArticleSitemap
+from commoncontent.sitemaps import ArticleSitemap, SectionSitemap
 
 
 class TestHomePageView(TestCase):
@@ -713,9 +718,12 @@ class TestAuthorViews(TestCase):
         )
 
     def test_author_list(self):
+        other_site = Site.objects.create(domain="other.example.com", name="Other")
+        Author.objects.create(name="Other Author", site=other_site, slug="other")
         response = self.client.get(reverse("author_list"))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, self.author.name)
+        self.assertNotContains(response, "Other Author")
 
     def test_author_page(self):
         response = self.client.get(
@@ -767,3 +775,305 @@ class ArticleSitemapTest(BaseContentTestCase):
     def test_items_order(self):
         items = list(self.sitemap.items())
         self.assertEqual(items, [self.article, self.article3, self.article4])
+
+    def content(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Robots-Tag"], "noindex, noodp, noarchive")
+        return response.getvalue().decode()
+
+    def test_sitemap_index(self):
+        published = timezone.localtime(self.article.date_published)
+        content = self.content("/sitemap.xml")
+        self.assertIn("<sitemapindex", content)
+        for url in (
+            "/sitemap-home.xml",
+            "/sitemap-sections.xml",
+            "/sitemap-pages.xml",
+            "/sitemap-authors.xml",
+            f"/sitemap-articles-{published.year}-{published.month}.xml",
+        ):
+            self.assertIn(f"<loc>http://example.com{url}</loc>", content)
+
+    def test_month_sitemap(self):
+        Article.objects.create(
+            site=self.site,
+            section=self.section,
+            series=ArticleSeries.objects.create(
+                site=self.site, slug="series", name="Series"
+            ),
+            title="Old Article",
+            slug="old-article",
+            date_published=timezone.make_aware(datetime(2020, 3, 15, 12)),
+            date_modified=timezone.make_aware(datetime(2020, 3, 16, 12)),
+        )
+        content = self.content("/sitemap-articles-2020-3.xml")
+        self.assertIn(
+            "<url><loc>http://example.com/test-section/series/old-article.html</loc>"
+            "<lastmod>2020-03-16</lastmod>",
+            content,
+        )
+        self.assertNotIn("test-article-3", content)
+        self.assertEqual(
+            self.client.get("/sitemap-articles-2020-13.xml").status_code, 404
+        )
+
+    def test_month_sitemap_out_of_range(self):
+        for url in [
+            "/sitemap-articles-0-1.xml",
+            "/sitemap-articles-1-1.xml",
+            "/sitemap-articles-9999-12.xml",
+            "/sitemap-articles-99999-1.xml",
+            "/sitemap-articles-2020-0.xml",
+            "/sitemap-articles-2020-3-0.xml",
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_month_sitemap_pages(self):
+        for day in (1, 2, 3):
+            Article.objects.create(
+                site=self.site,
+                section=self.section,
+                title=f"Article {day}",
+                slug=f"article-{day}",
+                date_published=timezone.make_aware(datetime(2020, 3, day, 12)),
+            )
+        with patch("commoncontent.sitemaps.SITEMAP_LIMIT", 2):
+            self.assertIn(
+                "/sitemap-articles-2020-3-2.xml", self.content("/sitemap.xml")
+            )
+            self.assertIn(
+                "article-3.html", self.content("/sitemap-articles-2020-3.xml")
+            )
+            self.assertIn(
+                "article-1.html", self.content("/sitemap-articles-2020-3-2.xml")
+            )
+            response = self.client.get("/sitemap-articles-2020-3-3.xml")
+            self.assertEqual(response.status_code, 404)
+
+    def test_kind_sitemaps(self):
+        self.assertIn(
+            "<loc>http://example.com/test-section/</loc>",
+            self.content("/sitemap-sections.xml"),
+        )
+        self.assertIn(
+            "<loc>http://example.com/</loc>", self.content("/sitemap-home.xml")
+        )
+        self.assertEqual(self.client.get("/sitemap-images.xml").status_code, 404)
+
+    def test_lastmod(self):
+        section = Section.objects.create(
+            site=self.site,
+            slug="old-section",
+            title="Old Section",
+            date_published=timezone.make_aware(datetime(2020, 1, 1, 12)),
+        )
+        Article.objects.create(
+            site=self.site,
+            section=section,
+            title="Never Modified",
+            slug="never-modified",
+            date_published=timezone.make_aware(datetime(2020, 3, 15, 12)),
+        )
+        # Never modified, the date published is used
+        self.assertIn(
+            "never-modified.html</loc><lastmod>2020-03-15</lastmod>",
+            self.content("/sitemap-articles-2020-3.xml"),
+        )
+        # Sections are modified when their newest Article is
+        content = self.content("/sitemap-sections.xml")
+        self.assertIn("/old-section/</loc><lastmod>2020-03-15</lastmod>", content)
+        self.assertIn(
+            "<lastmod>2020-03-15</lastmod></sitemap>", self.content("/sitemap.xml")
+        )
+
+        # With django.contrib.sitemaps, lastmod is computed in the items query
+        sitemap = SectionSitemap()
+        with self.assertNumQueries(2):
+            urls = sitemap.get_urls(site=self.site, protocol="http")
+        urls = {url["location"]: url["lastmod"] for url in urls}
+        self.assertEqual(
+            urls["http://example.com/old-section/"],
+            timezone.make_aware(datetime(2020, 3, 15, 12)),
+        )
+
+    @override_settings(COMMONCONTENT_SITEMAP_CACHE=True)
+    def test_cached_sitemaps(self):
+        cache.clear()
+        url = "/sitemap-sections.xml"
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn(b"/test-section/</loc>", gzip.decompress(response.content))
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.client.get(url).content, gzip.decompress(response.content)
+            )
+
+        # Regenerated when content changes
+        Section.objects.create(
+            site=self.site,
+            slug="new-section",
+            title="New Section",
+            date_published=timezone.now(),
+        )
+        self.assertIn("/new-section/</loc>", self.content(url))
+
+
+class TestListQueryCount(BaseContentTestCase):
+    """List pages should cost a constant number of queries, however many Articles."""
+
+    def add_articles(self, count):
+        author = Author.objects.create(
+            site=self.site, name=f"Author {count}", slug=f"author-{count}"
+        )
+        for i in range(count):
+            article = Article.objects.create(
+                site=self.site,
+                section=self.section,
+                author=author,
+                title=f"Batch {count} Article {i}",
+                slug=f"batch-{count}-article-{i}",
+                date_published=timezone.now() - timedelta(hours=i + 1),
+            )
+            article.tags.add("tag1", f"tag{i}")
+
+    def count_queries(self, url):
+        # Warm up the per-process caches (e.g. the Site cache) before counting
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_section_page_queries_constant(self):
+        url = reverse("section_page", kwargs={"section_slug": self.section.slug})
+        self.add_articles(1)
+        few = self.count_queries(url)
+        self.add_articles(8)
+        self.assertEqual(self.count_queries(url), few)
+
+    def test_home_page_queries_constant(self):
+        url = reverse("home_page")
+        self.add_articles(1)
+        few = self.count_queries(url)
+        self.add_articles(8)
+        self.assertEqual(self.count_queries(url), few)
+
+    def test_for_listing_tag_names_prefetched(self):
+        self.add_articles(3)
+        articles = list(Article.objects.live().filter(site=self.site).for_listing())
+        with self.assertNumQueries(0):
+            for article in articles:
+                self.assertIsInstance(article.tag_names, list)
+                self.assertIsNotNone(article.section)
+                _ = (article.author, article.section.share_image)
+
+
+class TestKeysetPagination(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.site = Site.objects.get_current()
+        SiteVar.objects.create(site=cls.site, name="paginate_by", value="3")
+        now = timezone.now()
+        HomePage.objects.create(
+            site=cls.site,
+            admin_name="Home",
+            title="Home",
+            date_published=now - timedelta(days=30),
+        )
+        cls.section = Section.objects.create(
+            site=cls.site,
+            slug="news",
+            title="News",
+            date_published=now - timedelta(days=30),
+        )
+        # Two articles share a publication time, so the id breaks the tie
+        dates = [now - timedelta(hours=h) for h in (1, 2, 3, 3, 4, 5, 6, 7, 8)]
+        cls.articles = [
+            Article.objects.create(
+                site=cls.site,
+                section=cls.section,
+                slug=f"article-{i}",
+                title=f"Keyset Article {i}",
+                date_published=date,
+            )
+            for i, date in enumerate(dates)
+        ]
+        cls.articles.sort(key=lambda a: (a.date_published, a.pk), reverse=True)
+
+    def walk(self, url):
+        "Follow the Next links from url, returning each page's response."
+        pages = [self.client.get(url)]
+        while pages[-1].context["page_obj"].has_next():
+            cursor = pages[-1].context["page_obj"].next_cursor
+            pages.append(self.client.get(f"{url}page_{cursor}.html"))
+        return pages
+
+    @override_settings(COMMONCONTENT_PAGINATION="keyset")
+    def test_pages_cover_all_articles_in_order(self):
+        for url in ("/", "/news/"):
+            with self.subTest(url):
+                pages = self.walk(url)
+                self.assertEqual(len(pages), 3)
+                listed = [a for page in pages for a in page.context["object_list"]]
+                self.assertEqual(listed, self.articles)
+                first = pages[0].context["page_obj"]
+                self.assertContains(pages[0], f'href="page_{first.next_cursor}.html"')
+                self.assertNotContains(pages[0], 'href="page_2.html"')
+
+    @override_settings(COMMONCONTENT_PAGINATION="keyset")
+    def test_previous_links(self):
+        pages = self.walk("/news/")
+        self.assertFalse(pages[0].context["page_obj"].has_previous())
+        self.assertIsNone(pages[1].context["page_obj"].previous_cursor)
+        self.assertEqual(
+            pages[2].context["page_obj"].previous_cursor,
+            pages[0].context["page_obj"].next_cursor,
+        )
+
+    @override_settings(COMMONCONTENT_PAGINATION="keyset")
+    def test_cursor_page_stable_when_articles_added(self):
+        url = self.walk("/")[1].wsgi_request.path
+        before = list(self.client.get(url).context["object_list"])
+        Article.objects.create(
+            site=self.site,
+            section=self.section,
+            slug="newest",
+            title="Newest",
+            date_published=timezone.now() - timedelta(minutes=1),
+        )
+        self.assertEqual(list(self.client.get(url).context["object_list"]), before)
+
+    @override_settings(COMMONCONTENT_PAGINATION="keyset")
+    def test_deep_pages_cost_the_same(self):
+        pages = [page.wsgi_request.path for page in self.walk("/news/")]
+
+        def count(url):
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(url)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count(pages[1]), count(pages[2]))
+
+    @override_settings(
+        COMMONCONTENT_PAGINATION="keyset", COMMONCONTENT_PAGINATION_COUNT=True
+    )
+    def test_count(self):
+        resp = self.client.get("/news/")
+        self.assertEqual(resp.context["paginator"].count, 9)
+        self.assertEqual(resp.context["paginator"].num_pages, 3)
+        self.assertContains(resp, "9 articles")
+
+    def test_offset_mode_serves_cursor_urls(self):
+        resp = self.client.get("/news/")
+        self.assertContains(resp, 'href="page_2.html"')
+        last = self.articles[2]
+        cursor = f"{int(last.date_published.timestamp() * 1_000_000)}-{last.pk}"
+        resp = self.client.get(f"/news/page_{cursor}.html")
+        self.assertEqual(list(resp.context["object_list"]), self.articles[3:6])
+
+    def test_invalid_cursor(self):
+        resp = self.client.get("/news/page_99999999999999999999999-1.html")
+        self.assertEqual(resp.status_code, 404)